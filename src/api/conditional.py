@@ -0,0 +1,60 @@
+"""
+Условные GET-запросы: ETag и Last-Modified в ответе, 304 на совпавший If-None-Match.
+Валидаторы считает сервис по версиям организаций и хранит в кэше вместе с ответом
+"""
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from typing import Callable
+
+from fastapi import Request, Response, status
+
+
+def validator_headers(etag: str, last_modified: datetime | None) -> dict:
+    headers = {"ETag": etag}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified.astimezone(timezone.utc), usegmt=True)
+    return headers
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """If-None-Match сравнивается слабо (RFC 9110): W/"x" совпадает с "x" """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def conditional(
+        request: Request,
+        validators: tuple[str, datetime | None] | None,
+        variant: str = "",
+) -> tuple[Response | None, dict]:
+    """
+    :param variant: представление ресурса (api.responses.OutputFormat.variant), входит в ETag
+    :return: ответ 304, если у клиента актуальная версия (иначе None),
+        и заголовки ETag/Last-Modified для полного ответа
+    """
+    if validators is None:
+        return None, {}
+
+    etag, last_modified = validators
+    if variant:
+        etag = f'{etag[:-1]}-{variant}"'
+
+    headers = validator_headers(etag, last_modified)
+    if is_not_modified(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers), headers
+    return None, headers
+
+
+def revalidator(request: Request, variant: str = "") -> Callable[[tuple[str, datetime | None]], bool] | None:
+    """
+    Проверка для сервиса: актуальна ли у клиента версия с такими валидаторами.
+    Сервис вызывает её до загрузки ответа и при совпадении ничего не загружает.
+    None - запрос не условный, проверять нечего
+    """
+    if not request.headers.get("if-none-match"):
+        return None
+    return lambda validators: conditional(request, validators, variant)[0] is not None
@@ -0,0 +1,355 @@
+import asyncio
+import logging
+import math
+import time
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.routing import BaseRoute, Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from api.responses import MSGPACK_MEDIA_TYPE
+from config import settings
+from metrics import (
+    CallbackMetric,
+    Counter,
+    Histogram,
+    RequestStats,
+    http_request_db_duration,
+    http_request_db_queries,
+    http_request_duration,
+    registry,
+    request_stats,
+)
+
+try:
+    import brotli
+except ImportError:  # brotli не обязателен, без него ответы сжимаются только gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsMiddleware:
+    """
+    Время ответа, число запросов к БД и время в них на каждый маршрут, предупреждение
+    о превышении бюджета запросов (api.query_budget).
+    Маршрут берётся шаблоном (/organizations/{organization_id}), а не фактическим путём
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            request_stats.reset(token)
+
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            http_request_duration.observe(elapsed, method=scope["method"], route=path, status=status_code)
+            http_request_db_queries.observe(stats.queries, method=scope["method"], route=path)
+            http_request_db_duration.observe(stats.query_seconds, method=scope["method"], route=path)
+
+            if settings.query_budget_mode != "off" and stats.over_budget:
+                logger.warning(
+                    "%s %s: %d database queries, budget %d",
+                    scope["method"], path, stats.queries, stats.budget,
+                )
+
+
+# ---------- ОГРАНИЧЕНИЕ НАГРУЗКИ ----------
+admission_rejected = registry.register(Counter(
+    "admission_rejected_total", "Requests shed by admission control", ("route", "reason"),
+))
+admission_wait = registry.register(Histogram(
+    "admission_wait_seconds", "Time spent waiting for a route concurrency slot", ("route",),
+))
+
+
+class _RouteGate:
+    """Место для запросов одного маршрута: не больше limit одновременно, остальные ждут"""
+    __slots__ = ("limit", "in_flight", "waiting", "service_seconds", "semaphore")
+
+    # вес последнего запроса в скользящем среднем времени обработки
+    SMOOTHING = 0.2
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self.waiting = 0
+        self.service_seconds = 0.0
+        self.semaphore = asyncio.Semaphore(limit)
+
+    def expected_wait(self) -> float:
+        """Через сколько секунд освободится место для нового запроса, если встанет в конец очереди"""
+        return (self.waiting + 1) * self.service_seconds / self.limit
+
+    def observe(self, seconds: float) -> None:
+        if self.service_seconds == 0.0:
+            self.service_seconds = seconds
+        else:
+            self.service_seconds += self.SMOOTHING * (seconds - self.service_seconds)
+
+
+class AdmissionMiddleware:
+    """
+    Ограничение одновременных запросов на маршрут (шаблон пути). Запросы сверх limit ждут
+    в очереди не больше max_queue штук; если по среднему времени обработки ожидание превысит
+    slo_seconds, запрос сразу получает 503 с Retry-After, а не висит на таймауте пула соединений.
+    Ограничения действуют в пределах одного процесса
+    """
+
+    def __init__(
+            self,
+            app: ASGIApp,
+            default_limit: int = 20,
+            limits: dict[str, int] | None = None,
+            max_queue: int = 50,
+            slo_seconds: float = 2.0,
+    ):
+        self.app = app
+        self.default_limit = default_limit
+        self.limits = limits or {}
+        self.max_queue = max_queue
+        self.slo_seconds = slo_seconds
+        self._gates: dict[str, _RouteGate] = {}
+
+        registry.register(CallbackMetric(
+            "admission_queue_depth", "Requests waiting for a route concurrency slot", "gauge", ("route",),
+            lambda: [((path,), gate.waiting) for path, gate in self._gates.items()],
+        ))
+        registry.register(CallbackMetric(
+            "admission_in_flight", "Requests holding a route concurrency slot", "gauge", ("route",),
+            lambda: [((path,), gate.in_flight) for path, gate in self._gates.items()],
+        ))
+
+    @staticmethod
+    def _match(scope: Scope) -> BaseRoute | None:
+        for route in scope["app"].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route
+        return None
+
+    def _gate(self, path: str) -> _RouteGate | None:
+        gate = self._gates.get(path)
+        if gate is None:
+            limit = self.limits.get(path, self.default_limit)
+            if limit <= 0:
+                return None
+            gate = self._gates[path] = _RouteGate(limit)
+        return gate
+
+    async def _reject(self, scope: Scope, receive: Receive, send: Send, path: str, reason: str, retry_after: float):
+        admission_rejected.inc(route=path, reason=reason)
+        response = JSONResponse(
+            {"detail": "Сервис перегружен, повторите запрос позже"},
+            status_code=503,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+        await response(scope, receive, send)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        route = self._match(scope) if scope["type"] == "http" else None
+        gate = self._gate(route.path) if route is not None else None
+        if gate is None:
+            await self.app(scope, receive, send)
+            return
+
+        path = route.path
+        # маршрут для метрик отклонённых запросов, роутер всё равно выставит его заново
+        scope["route"] = route
+
+        semaphore = gate.semaphore
+        if semaphore.locked():
+            expected = gate.expected_wait()
+            if gate.waiting >= self.max_queue:
+                await self._reject(scope, receive, send, path, "queue_full", expected)
+                return
+            if self.slo_seconds and expected > self.slo_seconds:
+                await self._reject(scope, receive, send, path, "slo", expected)
+                return
+
+            gate.waiting += 1
+            started = time.perf_counter()
+            try:
+                if self.slo_seconds:
+                    await asyncio.wait_for(semaphore.acquire(), self.slo_seconds)
+                else:
+                    await semaphore.acquire()
+            except TimeoutError:
+                await self._reject(scope, receive, send, path, "timeout", gate.expected_wait())
+                return
+            finally:
+                gate.waiting -= 1
+            admission_wait.observe(time.perf_counter() - started, route=path)
+        else:
+            await semaphore.acquire()
+            admission_wait.observe(0.0, route=path)
+
+        gate.in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.in_flight -= 1
+            semaphore.release()
+            gate.observe(time.perf_counter() - started)
+
+
+# ---------- СЖАТИЕ ----------
+class _GzipEncoder:
+    def __init__(self):
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _BrotliEncoder:
+    def __init__(self):
+        # 5 - заметно лучше gzip по размеру и ещё дёшево по CPU, 11 годится только для статики
+        self._compressor = brotli.Compressor(quality=5)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+ENCODERS = {"br": _BrotliEncoder, "gzip": _GzipEncoder} if brotli is not None else {"gzip": _GzipEncoder}
+
+# типы ответов, которые сжимаются (начало Content-Type); остальные отдаются как есть
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/x-ndjson", MSGPACK_MEDIA_TYPE)
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    """Кодировка из ENCODERS с наибольшим q в Accept-Encoding, при равных - br раньше gzip"""
+    weights: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[coding.strip().lower()] = q
+
+    best, best_q = None, 0.0
+    for coding in ENCODERS:
+        q = weights.get(coding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class CompressionMiddleware:
+    """
+    Сжатие ответов gzip или brotli по Accept-Encoding. Сжимаются только COMPRESSIBLE_TYPES,
+    ответы короче minimum_size не сжимаются - выигрыш меньше накладных расходов. Потоковые
+    ответы (NDJSON) сжимаются по частям, каждая часть сразу уходит клиенту.
+
+    Ответы сжимаемых типов всегда получают Vary: Accept-Encoding, даже несжатые: иначе
+    кэш по пути отдаст несжатый ответ и тем клиентам, что просят сжатый, и наоборот.
+
+    Сжатый ответ получает слабый ETag (W/"..."), как у nginx: байты другие,
+    а If-None-Match сравнивается слабо (api.conditional)
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        start: Message | None = None
+        encoder = None
+        passthrough = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start, encoder, passthrough
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(raw=message["headers"])
+                compressible = headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+                if compressible:
+                    headers.add_vary_header("Accept-Encoding")
+                if encoding is None or not compressible:
+                    passthrough = True
+                    await send(message)
+                    return
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if encoder is None:
+                headers = MutableHeaders(raw=start["headers"])
+                if (
+                    "content-encoding" in headers
+                    or start["status"] in (204, 304)
+                    or (not more_body and len(body) < self.minimum_size)
+                ):
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+
+                encoder = ENCODERS[encoding]()
+                headers["Content-Encoding"] = encoding
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    headers["ETag"] = f"W/{etag}"
+
+                if not more_body:
+                    body = encoder.compress(body) + encoder.finish()
+                    headers["Content-Length"] = str(len(body))
+                    await send(start)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+
+                del headers["Content-Length"]
+                await send(start)
+
+            chunk = encoder.compress(body) + (encoder.flush() if more_body else encoder.finish())
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,31 @@
+import functools
+from typing import Callable
+
+from metrics import request_stats
+
+
+def query_budget(limit: int | None):
+    """
+    Сколько запросов к БД может выполнить эндпоинт за один HTTP-запрос.
+    Превышение пишется в лог или, при APP_QUERY_BUDGET_MODE=strict, прерывает
+    запрос с QueryBudgetExceeded - так в тестах ловятся N+1 и лишние догрузки.
+    None - число запросов зависит от объёма входных данных и не ограничивается
+    """
+    def decorator(endpoint: Callable) -> Callable:
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            stats = request_stats.get()
+            if stats is not None:
+                stats.budget = limit
+            return await endpoint(*args, **kwargs)
+
+        wrapper.query_budget = limit
+        return wrapper
+    return decorator
+
+
+def lift_query_budget() -> None:
+    """Снимает бюджет текущего запроса - для потоковой выдачи, где запросы идут на каждую пачку"""
+    stats = request_stats.get()
+    if stats is not None:
+        stats.budget = None
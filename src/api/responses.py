@@ -0,0 +1,107 @@
+import json
+from typing import Any, Literal, NamedTuple
+
+from fastapi import Query, Request
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:  # orjson не обязателен, без него работает стандартный json
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # msgpack не обязателен, без него Accept: application/msgpack получает JSON
+    msgpack = None
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+
+def dumps(content: Any) -> bytes:
+    """JSON в байтах: через orjson, если он установлен"""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    Ответ из уже готовых словарей сервиса: без повторной валидации
+    через response_model, сразу в байты
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class MessagePackResponse(Response):
+    media_type = MSGPACK_MEDIA_TYPE
+
+    def render(self, content: Any) -> bytes:
+        return msgpack.packb(content, use_bin_type=True)
+
+
+# ---------- ФОРМАТ СПИСКОВ ----------
+class OutputFormat(NamedTuple):
+    """Раскладка списка (full - как OrganizationResponse, compact - см. compact_layout) и кодирование"""
+    layout: Literal["full", "compact"] = "full"
+    msgpack: bool = False
+
+    @property
+    def variant(self) -> str:
+        """Суффикс ETag: у разных представлений одного ресурса разные ETag"""
+        parts = [self.layout] if self.layout != "full" else []
+        if self.msgpack:
+            parts.append("msgpack")
+        return "-".join(parts)
+
+
+def get_output_format(
+        request: Request,
+        format: Literal["full", "compact"] = Query(
+            "full",
+            description="compact - здания и деятельности один раз на ответ, организации ссылаются на них по id",
+        ),
+) -> OutputFormat:
+    accept = request.headers.get("accept", "")
+    return OutputFormat(format, msgpack is not None and MSGPACK_MEDIA_TYPE in accept)
+
+
+def compact_layout(organizations: list[dict]) -> dict:
+    """
+    Список организаций без повторов: каждое здание и каждая деятельность
+    встречаются один раз, организации ссылаются на них через building_id и activity_ids.
+    activities - плоский список деятельностей организаций и всех их поддеревьев,
+    дерево восстанавливается по parent_id
+    """
+    buildings: dict[int, dict] = {}
+    activities: dict[int, dict] = {}
+
+    def collect(activity: dict) -> None:
+        if activity["id"] in activities:
+            return
+        activities[activity["id"]] = {
+            "id": activity["id"],
+            "name": activity["name"],
+            "parent_id": activity["parent_id"],
+            "level": activity["level"],
+        }
+        for child in activity["children"] or ():
+            collect(child)
+
+    rows = []
+    for organization in organizations:
+        building = organization["building"]
+        buildings.setdefault(building["id"], building)
+        for activity in organization["activities"]:
+            collect(activity)
+
+        row = {key: value for key, value in organization.items() if key not in ("building", "activities")}
+        row["activity_ids"] = [activity["id"] for activity in organization["activities"]]
+        rows.append(row)
+
+    return {
+        "buildings": list(buildings.values()),
+        "activities": list(activities.values()),
+        "organizations": rows,
+    }
@@ -1,9 +1,30 @@
-from fastapi import APIRouter, Depends, status, HTTPException, Query
-from typing import List, Optional, Annotated
+from fastapi import APIRouter, Depends, status, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, List, Literal, Optional, Annotated
 
+from api.conditional import conditional, revalidator
+from api.query_budget import lift_query_budget, query_budget
+from api.responses import (
+    FastJSONResponse,
+    MessagePackResponse,
+    OutputFormat,
+    compact_layout,
+    dumps,
+    get_output_format,
+)
+from config import settings
+from exceptions import JobQueueFull, ModelNoFoundException
+from services.jobs import AbstractJobBackend
 from services.organization import OrganizationService
-from depends import get_organization_service, verify_api_key
+from services.importer import OrganizationImporter, iter_lines, parse_csv, parse_ndjson
+from depends import get_job_backend, get_organization_importer, get_organization_service, verify_api_key
 from schemas.organization import (
+    ImportReport,
+    OrganizationBatchRequest,
+    OrganizationBatchResponse,
+    OrganizationJobResponse,
+    OrganizationNearestResponse,
+    OrganizationStatsResponse,
     OrganizationResponse,
     OrganizationCreate,
     OrganizationUpdate,
@@ -13,17 +34,104 @@ from schemas.organization import (
 
 router = APIRouter()
 
+AfterIdQuery = Query(None, description="Вернуть организации с id больше указанного (курсор из X-Next-After-Id)")
+LimitQuery = Query(None, ge=1, le=settings.max_page_size, description="Размер страницы")
+StreamQuery = Query(False, description="Отдать все организации потоком в формате NDJSON")
+AsyncQuery = Query(
+    False,
+    alias="async",
+    description="Выполнить поиск в фоне: сразу вернуть задачу (202), результат забирать по Location",
+)
+
+
+def _ndjson_response(organizations: AsyncIterator[dict]) -> StreamingResponse:
+    # поток читает БД пачками, число запросов растёт с размером выдачи
+    lift_query_budget()
+
+    async def lines():
+        async for organization in organizations:
+            yield dumps(organization) + b"\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
+
+async def _submit_job(job_backend: AbstractJobBackend, kind: str, params: dict, stream: bool):
+    """Ставит гео-поиск в очередь задач. К БД запрос не обращается - соединение не занимается"""
+    if stream:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Параметры async и stream несовместимы",
+        )
+    try:
+        job = await job_backend.submit(kind, params)
+    except JobQueueFull as exc:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(exc),
+            headers={"Retry-After": "5"},
+        )
+    return FastJSONResponse(
+        job.to_dict(),
+        status_code=status.HTTP_202_ACCEPTED,
+        headers={"Location": f"/api/v1/organizations/jobs/{job.id}"},
+    )
+
+
+def _render(
+        response: Response,
+        content: List[dict] | dict,
+        limit: Optional[int] = None,
+        headers: Optional[dict] = None,
+        output: Optional[OutputFormat] = None,
+):
+    """
+    В быстром режиме готовые словари сервиса сразу кодируются в байты,
+    иначе FastAPI валидирует их через response_model.
+    Компактная раскладка и MessagePack не совпадают с response_model и всегда отдаются напрямую
+    """
+    headers = dict(headers or {})
+    # полная страница - возможно, есть следующая
+    if isinstance(content, list) and limit is not None and len(content) == limit:
+        headers["X-Next-After-Id"] = str(content[-1]["id"])
+
+    if output is not None:
+        headers["Vary"] = "Accept"
+        if output.layout == "compact":
+            content = compact_layout(content)
+        if output.msgpack:
+            return MessagePackResponse(content, headers=headers)
+        if output.layout == "compact":
+            return FastJSONResponse(content, headers=headers)
+
+    if settings.fast_serialization:
+        return FastJSONResponse(content, headers=headers)
+    response.headers.update(headers)
+    return content
+
+
+# версии страницы (только условный запрос) + организации + здания + связи с деятельностями;
+# из кэша - без запросов
 @router.get("/organizations", response_model=List[OrganizationResponse])
+@query_budget(4)
 async def get_organizations(
     organization_service: Annotated[OrganizationService, Depends(get_organization_service)], # noqa
     authorized: Annotated[bool, Depends(verify_api_key)], # noqa
+    request: Request,
+    response: Response,
+    output: Annotated[OutputFormat, Depends(get_output_format)],
 
     building_id: Optional[int] = None,
     activity_id: Optional[int] = None,
     name: Optional[str] = None,
+    name_search: Literal["contains", "prefix", "similar"] = Query(
+        "contains",
+        description="Режим поиска по названию: подстрока, начало названия или похожие (по убыванию похожести)",
+    ),
     # activity_search: Optional[str] = None,
-    include_subactivities: bool = False
+    include_subactivities: bool = False,
+    after_id: Optional[int] = AfterIdQuery,
+    limit: Optional[int] = LimitQuery,
+    stream: bool = StreamQuery,
 ):
     """
     Получить список организаций по фильтрам
@@ -34,8 +142,16 @@ async def get_organizations(
 
     :param name: название организации
 
+    :param name_search: режим поиска по названию - contains, prefix или similar
+
     :param include_subactivities:  связанные поддеятельностью
 
+    :param after_id: курсор - id последней организации предыдущей страницы
+
+    :param limit: размер страницы
+
+    :param stream: отдать результат потоком NDJSON без пагинации
+
     :return: List[OrganizationResponse]
     """
 
@@ -48,21 +164,106 @@ async def get_organizations(
             filters['activity_id'] = activity_id
         if name:
             filters['name'] = name
+            filters['name_search'] = name_search
+            # выдача similar упорядочена по похожести, курсор по id к ней неприменим
+            if name_search == "similar" and after_id is not None:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="after_id не поддерживается при name_search=similar",
+                )
         filters['include_subactivities'] = include_subactivities
 
-        return await organization_service.get_organizations(filters)
+        if stream:
+            return _ndjson_response(organization_service.stream_organizations(filters))
+
+        organizations, validators = await organization_service.get_organizations(
+            filters, after_id, limit, revalidator(request, output.variant)
+        )
+        not_modified, headers = conditional(request, validators, output.variant)
+        if not_modified:
+            return not_modified
+        # без limit _render не ставит X-Next-After-Id: курсора для similar нет
+        page_limit = None if name and name_search == "similar" else limit
+        return _render(response, organizations, page_limit, headers, output)
+    raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
+
+
+# до 9 запросов на каждый пакет из APP_IMPORT_BATCH_SIZE записей
+@router.post("/organizations/import", response_model=ImportReport)
+@query_budget(None)
+async def import_organizations(
+        request: Request,
+        importer: Annotated[OrganizationImporter, Depends(get_organization_importer)], # noqa
+        authorized: Annotated[bool, Depends(verify_api_key)], # noqa
+
+        format: Optional[Literal["ndjson", "csv"]] = Query(
+            None,
+            description="Формат тела запроса, по умолчанию определяется по Content-Type",
+        ),
+):
+    """
+    Пакетный импорт организаций из NDJSON или CSV. Тело читается потоком,
+    записи пишутся пакетами по APP_IMPORT_BATCH_SIZE
+
+    :param format: ndjson или csv
+
+    :return: ImportReport
+    """
+    if authorized:
+        if format is None:
+            format = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+
+        lines = iter_lines(request.stream())
+        records = parse_csv(lines) if format == "csv" else parse_ndjson(lines)
+        return await importer.run(records)
     raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
 
 
+@router.post("/organizations/batch_get", response_model=OrganizationBatchResponse)
+@query_budget(3)
+async def get_organizations_batch(
+        body: OrganizationBatchRequest,
+        organization_service: Annotated[OrganizationService, Depends(get_organization_service)], # noqa
+        authorized: Annotated[bool, Depends(verify_api_key)], # noqa
+        response: Response,
+):
+    """
+    Получить несколько организаций по id одним запросом
+
+    :param body: список id
+
+    :return: OrganizationBatchResponse - найденные организации в порядке запроса и отсутствующие id
+    """
+    if authorized:
+        if len(body.ids) > settings.max_page_size:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Не больше {settings.max_page_size} id за запрос",
+            )
+        return _render(response, await organization_service.get_organizations_by_ids(body.ids))
+    raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
+
+
+# версии страницы (только условный запрос) + организации + здания + связи с деятельностями;
+# из кэша - без запросов
 @router.get("/organizations/within_radius", response_model=List[OrganizationResponse])
+@query_budget(4)
 async def get_organizations_within_radius(
 
         organization_service: Annotated[OrganizationService, Depends(get_organization_service)], # noqa
         authorized: Annotated[bool, Depends(verify_api_key)], # noqa
+        request: Request,
+        response: Response,
+        output: Annotated[OutputFormat, Depends(get_output_format)],
+        job_backend: Annotated[AbstractJobBackend, Depends(get_job_backend)],
 
         latitude: float = Query(..., description="Широта центра поиска"),
         longitude: float = Query(..., description="Долгота центра поиска"),
         radius_km: float = Query(..., gt=0, description="Радиус в километрах"),
+        after_id: Optional[int] = AfterIdQuery,
+        limit: Optional[int] = LimitQuery,
+        stream: bool = StreamQuery,
+        async_mode: bool = AsyncQuery,
 
 ):
     """
@@ -70,33 +271,92 @@ async def get_organizations_within_radius(
     :param latitude:
     :param longitude:
     :param radius_km:
+    :param after_id:
+    :param limit:
+    :param stream:
+    :param async_mode: вместо результата вернуть задачу, см. GET /organizations/jobs/{job_id}
 
     :return:
     """
 
 
     if authorized:
-        print(latitude,
-            longitude,
-            radius_km)
-        return await organization_service.get_organizations_within_radius(
+        if async_mode:
+            return await _submit_job(
+                job_backend,
+                "within_radius",
+                {"latitude": latitude, "longitude": longitude, "radius_km": radius_km},
+                stream,
+            )
+        if stream:
+            return _ndjson_response(
+                organization_service.stream_organizations_within_radius(latitude, longitude, radius_km)
+            )
+
+        organizations, validators = await organization_service.get_organizations_within_radius(
             latitude,
             longitude,
-            radius_km
+            radius_km,
+            after_id,
+            limit,
+            revalidator(request, output.variant),
         )
+        not_modified, headers = conditional(request, validators, output.variant)
+        if not_modified:
+            return not_modified
+        return _render(response, organizations, limit, headers, output)
     raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
 
 
 
+# до 3 расширений поиска по индексу, в редкой застройке после них ещё сортировка в БД
+# + здания + связи с деятельностями
+@router.get("/organizations/nearest", response_model=List[OrganizationNearestResponse])
+@query_budget(6)
+async def get_nearest_organizations(
+        organization_service: Annotated[OrganizationService, Depends(get_organization_service)], # noqa
+        authorized: Annotated[bool, Depends(verify_api_key)], # noqa
+        response: Response,
+        output: Annotated[OutputFormat, Depends(get_output_format)],
+
+        latitude: float = Query(..., ge=-90, le=90, description="Широта точки"),
+        longitude: float = Query(..., ge=-180, le=180, description="Долгота точки"),
+        k: int = Query(20, ge=1, le=settings.max_page_size, description="Сколько ближайших организаций вернуть"),
+):
+    """
+    Ближайшие к точке организации, отсортированные по расстоянию
+    :param latitude:
+    :param longitude:
+    :param k:
+
+    :return: List[OrganizationNearestResponse]
+    """
+    if authorized:
+        organizations = await organization_service.get_nearest_organizations(latitude, longitude, k)
+        return _render(response, organizations, output=output)
+    raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
+
+
+# версии страницы (только условный запрос) + организации + здания + связи с деятельностями;
+# из кэша - без запросов
 @router.get("/organizations/within_rectangle", response_model=List[OrganizationResponse])
+@query_budget(4)
 async def get_organizations_within_rectangle(
         organization_service: Annotated[OrganizationService, Depends(get_organization_service)], # noqa
         authorized: Annotated[bool, Depends(verify_api_key)], # noqa
+        request: Request,
+        response: Response,
+        output: Annotated[OutputFormat, Depends(get_output_format)],
+        job_backend: Annotated[AbstractJobBackend, Depends(get_job_backend)],
 
         min_lat: float = Query(..., description="Широта первого угла прямоугольника"),
         max_lat: float = Query(..., description="Долгота второго угла прямоугольника"),
         min_lon: float = Query(..., description="Широта первого угла прямоугольника"),
         max_lon: float = Query(..., description="Долгота второго угла прямоугольника"),
+        after_id: Optional[int] = AfterIdQuery,
+        limit: Optional[int] = LimitQuery,
+        stream: bool = StreamQuery,
+        async_mode: bool = AsyncQuery,
 ):
     """
     Поиск организаций в указанной области
@@ -105,25 +365,130 @@ async def get_organizations_within_rectangle(
     :param max_lat:
     :param min_lon:
     :param max_lon:
+    :param after_id:
+    :param limit:
+    :param stream:
+    :param async_mode: вместо результата вернуть задачу, см. GET /organizations/jobs/{job_id}
 
     :return: List[OrganizationResponse]
     """
     if authorized:
-        return await organization_service.get_organizations_within_rectangle(
+        if async_mode:
+            return await _submit_job(
+                job_backend,
+                "within_rectangle",
+                {"min_lat": min_lat, "max_lat": max_lat, "min_lon": min_lon, "max_lon": max_lon},
+                stream,
+            )
+        if stream:
+            return _ndjson_response(
+                organization_service.stream_organizations_within_rectangle(
+                    min_lat,
+                    max_lat,
+                    min_lon,
+                    max_lon
+                )
+            )
+
+        organizations, validators = await organization_service.get_organizations_within_rectangle(
             min_lat,
             max_lat,
             min_lon,
-            max_lon
+            max_lon,
+            after_id,
+            limit,
+            revalidator(request, output.variant),
         )
+        not_modified, headers = conditional(request, validators, output.variant)
+        if not_modified:
+            return not_modified
+        return _render(response, organizations, limit, headers, output)
+    raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
+
+
+
+# число по деятельностям + по зданиям + всего, дерево деятельностей - из памяти
+@router.get("/organizations/stats", response_model=OrganizationStatsResponse)
+@query_budget(3)
+async def get_organization_stats(
+        organization_service: Annotated[OrganizationService, Depends(get_organization_service)], # noqa
+        authorized: Annotated[bool, Depends(verify_api_key)], # noqa
+        response: Response,
+
+        min_lat: Optional[float] = Query(None, description="Ограничить прямоугольником: минимальная широта"),
+        max_lat: Optional[float] = Query(None, description="Максимальная широта"),
+        min_lon: Optional[float] = Query(None, description="Минимальная долгота"),
+        max_lon: Optional[float] = Query(None, description="Максимальная долгота"),
+        buildings_limit: int = Query(
+            100, ge=1, le=settings.max_page_size, description="Сколько зданий с наибольшим числом организаций вернуть",
+        ),
+):
+    """
+    Число организаций для фильтров: всего, по видам деятельности (с учётом вложенных)
+    и по зданиям. Если задан прямоугольник - только организации в нём
+
+    :param min_lat:
+    :param max_lat:
+    :param min_lon:
+    :param max_lon:
+    :param buildings_limit:
+
+    :return: OrganizationStatsResponse
+    """
+    if authorized:
+        bounds = (min_lat, max_lat, min_lon, max_lon)
+        if any(bound is not None for bound in bounds) and any(bound is None for bound in bounds):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Прямоугольник задаётся всеми четырьмя параметрами min_lat, max_lat, min_lon, max_lon",
+            )
+        bbox = bounds if min_lat is not None else None
+        return _render(response, await organization_service.get_stats(bbox, buildings_limit))
     raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
 
 
+# результат хранится в очереди задач, БД не читается
+@router.get("/organizations/jobs/{job_id}", response_model=OrganizationJobResponse)
+@query_budget(0)
+async def get_organization_job(
+        job_id: str,
+        job_backend: Annotated[AbstractJobBackend, Depends(get_job_backend)],
+        authorized: Annotated[bool, Depends(verify_api_key)], # noqa
+        response: Response,
+
+        after_id: Optional[int] = AfterIdQuery,
+        limit: Optional[int] = LimitQuery,
+):
+    """
+    Состояние фоновой задачи поиска (async=true) и страница её результата.
+    Пока status равен pending или running, список организаций пуст
+
+    :param job_id:
+    :param after_id:
+    :param limit:
+    :return: OrganizationJobResponse
+    """
+    if authorized:
+        job = await job_backend.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Задача не найдена или её результат устарел")
+        content = job.to_dict(after_id, limit)
+        headers = {}
+        if limit is not None and len(content["organizations"]) == limit:
+            headers["X-Next-After-Id"] = str(content["organizations"][-1]["id"])
+        return _render(response, content, headers=headers)
+    raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
+
 
+# версия (только условный запрос) + организация + здание + связи с деятельностями; из кэша - без запросов
 @router.get("/organizations/{organization_id}", response_model=OrganizationResponse)
+@query_budget(4)
 async def get_organization(
         organization_id: int,
         organization_service: Annotated[OrganizationService, Depends(get_organization_service)], # noqa
         authorized: Annotated[bool, Depends(verify_api_key)], # noqa
+        request: Request,
+        response: Response,
 ):
     """
     Получить организацию по id
@@ -132,5 +497,14 @@ async def get_organization(
     :return: OrganizationResponse
     """
     if authorized:
-        return await organization_service.get_organization(organization_id)
+        try:
+            organization, validators = await organization_service.get_organization(
+                organization_id, revalidator(request)
+            )
+        except ModelNoFoundException:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Организация не найдена")
+        not_modified, headers = conditional(request, validators)
+        if not_modified:
+            return not_modified
+        return _render(response, organization, headers=headers)
     raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
@@ -0,0 +1,44 @@
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import PlainTextResponse
+
+from db.database import pool_stats
+from api.query_budget import query_budget
+from depends import verify_api_key
+from metrics import registry
+
+router = APIRouter()
+
+# /metrics отдаётся от корня, как ожидает Prometheus
+metrics_router = APIRouter()
+
+
+@metrics_router.get("/metrics", response_class=PlainTextResponse)
+@query_budget(0)
+async def get_metrics(
+        authorized: Annotated[bool, Depends(verify_api_key)], # noqa
+):
+    """
+    Метрики в текстовом формате Prometheus: время ответа по маршрутам,
+    запросы к БД по методам репозиториев, состояние пулов соединений
+    """
+    if authorized:
+        return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+    raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
+
+
+@router.get("/system/pool")
+@query_budget(0)
+async def get_pool_stats(
+        authorized: Annotated[bool, Depends(verify_api_key)], # noqa
+):
+    """
+    Состояние пулов соединений: размер, занятые соединения, число выдач
+    и время ожидания свободного соединения
+
+    :return: {"primary": {...}, "replica": {...}}
+    """
+    if authorized:
+        return pool_stats()
+    raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
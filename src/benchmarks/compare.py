@@ -0,0 +1,56 @@
+"""
+Сравнение двух прогонов benchmarks/run.py.
+
+    python src/benchmarks/compare.py benchmark-results/repositories-abc1234.json benchmark-results/repositories-def5678.json
+"""
+import argparse
+import json
+
+
+def _change(old: float, new: float) -> str:
+    if not old:
+        return "n/a"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def compare(baseline: dict, candidate: dict, metrics: list[str]) -> None:
+    print(f"baseline:  {baseline['revision']} ({baseline['created_at']})")
+    print(f"candidate: {candidate['revision']} ({candidate['created_at']})")
+    if baseline.get("dataset") != candidate.get("dataset"):
+        print(f"WARNING: datasets differ: {baseline.get('dataset')} vs {candidate.get('dataset')}")
+    print()
+
+    old_results = {result["name"]: result for result in baseline["results"]}
+    header = f"{'case':<55}" + "".join(f"{metric:>30}" for metric in metrics)
+    print(header)
+    print("-" * len(header))
+
+    for result in candidate["results"]:
+        old = old_results.get(result["name"])
+        if old is None:
+            print(f"{result['name']:<55} (new case)")
+            continue
+        cells = "".join(
+            f"{old[metric]:>11.2f} -> {result[metric]:>9.2f} {_change(old[metric], result[metric]):>7}"
+            for metric in metrics
+        )
+        print(f"{result['name']:<55}{cells}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение результатов бенчмарков")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--metric", action="append", help="по умолчанию p50_ms, p99_ms и throughput_rps")
+    args = parser.parse_args()
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.candidate, encoding="utf-8") as f:
+        candidate = json.load(f)
+
+    compare(baseline, candidate, args.metric or ["p50_ms", "p99_ms", "throughput_rps"])
+
+
+if __name__ == "__main__":
+    main()
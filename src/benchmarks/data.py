@@ -0,0 +1,202 @@
+"""
+Генератор синтетических данных для бенчмарков.
+
+Полностью заменяет содержимое таблиц buildings, activities, organizations
+и organization_activity. Данные загружаются через COPY.
+
+    python src/benchmarks/data.py --buildings 1000000 --organizations 2000000
+"""
+import argparse
+import asyncio
+import math
+import random
+import time
+
+import asyncpg
+
+from config import settings
+from geo import EARTH_RADIUS_KM
+
+# как в db.models.Activity.validate_level: глубже сервис не принимает
+MAX_ACTIVITY_LEVEL = 3
+
+WORDS = [
+    "Рога", "Копыта", "Мясной", "Дом", "Авто", "Мир", "Молоко", "Хлеб", "Сервис", "Торг",
+    "Строй", "Маркет", "Групп", "Лайн", "Плюс", "Центр", "Союз", "Техно", "Снаб", "Трейд",
+]
+
+
+def generate_activities(roots: int, fanout: int, depth: int) -> list[tuple]:
+    """Дерево деятельностей: roots корней, у каждого узла fanout детей, не глубже depth уровней"""
+    activities = []
+    level_nodes = []
+    for i in range(1, roots + 1):
+        activity_id = len(activities) + 1
+        activities.append((activity_id, f"Деятельность {i}", 1, None))
+        level_nodes.append((activity_id, str(i)))
+
+    for level in range(2, depth + 1):
+        next_level = []
+        for parent_id, path in level_nodes:
+            for i in range(1, fanout + 1):
+                activity_id = len(activities) + 1
+                activities.append((activity_id, f"Деятельность {path}.{i}", level, parent_id))
+                next_level.append((activity_id, f"{path}.{i}"))
+        level_nodes = next_level
+
+    return activities
+
+
+def generate_buildings(
+        count: int,
+        center_lat: float,
+        center_lon: float,
+        spread_km: float,
+        rnd: random.Random,
+):
+    """Здания, равномерно разбросанные в квадрате spread_km вокруг центра"""
+    d_lat = math.degrees(spread_km / EARTH_RADIUS_KM)
+    d_lon = d_lat / math.cos(math.radians(center_lat))
+    for building_id in range(1, count + 1):
+        yield (
+            building_id,
+            f"Синтетическая ул., д. {building_id}",
+            center_lat + rnd.uniform(-d_lat, d_lat),
+            center_lon + rnd.uniform(-d_lon, d_lon),
+        )
+
+
+def generate_organizations(count: int, buildings: int, rnd: random.Random):
+    for organization_id in range(1, count + 1):
+        name = f"{rnd.choice(WORDS)} {rnd.choice(WORDS)} {organization_id}"
+        phones = [f"8-900-{rnd.randint(100, 999)}-{rnd.randint(10, 99)}-{rnd.randint(10, 99)}"
+                  for _ in range(rnd.randint(1, 3))]
+        yield organization_id, name, rnd.randint(1, buildings), phones
+
+
+def generate_links(organizations: int, activity_ids: list[int], per_organization: int, rnd: random.Random):
+    for organization_id in range(1, organizations + 1):
+        count = rnd.randint(1, per_organization)
+        for activity_id in rnd.sample(activity_ids, min(count, len(activity_ids))):
+            yield organization_id, activity_id
+
+
+async def _copy(conn: asyncpg.Connection, table: str, columns: list[str], records, batch_size: int) -> int:
+    total = 0
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            await conn.copy_records_to_table(table, records=batch, columns=columns)
+            total += len(batch)
+            batch = []
+    if batch:
+        await conn.copy_records_to_table(table, records=batch, columns=columns)
+        total += len(batch)
+    return total
+
+
+async def load(
+        buildings: int,
+        organizations: int,
+        activity_roots: int,
+        activity_fanout: int,
+        activity_depth: int,
+        activities_per_organization: int,
+        center_lat: float,
+        center_lon: float,
+        spread_km: float,
+        seed: int,
+        batch_size: int = 50_000,
+) -> None:
+    rnd = random.Random(seed)
+    conn = await asyncpg.connect(
+        host=settings.db.host,
+        port=settings.db.port,
+        user=settings.db.user,
+        password=settings.db.password,
+        database=settings.db.name,
+    )
+    try:
+        started = time.perf_counter()
+        async with conn.transaction():
+            await conn.execute(
+                "TRUNCATE organization_activity, organizations, buildings, activities RESTART IDENTITY CASCADE"
+            )
+            # organization_documents собирается одним запросом после загрузки, а не триггером на каждый COPY
+            await conn.execute("SET LOCAL organization_documents.deferred = 'on'")
+
+            activities = generate_activities(activity_roots, activity_fanout, activity_depth)
+            await _copy(conn, "activities", ["id", "name", "level", "parent_id"], activities, batch_size)
+            await _copy(
+                conn, "buildings", ["id", "address", "latitude", "longitude"],
+                generate_buildings(buildings, center_lat, center_lon, spread_km, rnd), batch_size,
+            )
+            await _copy(
+                conn, "organizations", ["id", "name", "building_id", "phone_numbers"],
+                generate_organizations(organizations, buildings, rnd), batch_size,
+            )
+            links = await _copy(
+                conn, "organization_activity", ["organization_id", "activity_id"],
+                generate_links(organizations, [a[0] for a in activities], activities_per_organization, rnd),
+                batch_size,
+            )
+
+            # id задавались явно - сдвигаем последовательности за максимальные значения
+            for table in ("activities", "buildings", "organizations"):
+                await conn.execute(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                    f"(SELECT coalesce(max(id), 0) + 1 FROM {table}), false)"
+                )
+
+            await conn.execute("SET LOCAL organization_documents.deferred = 'off'")
+            await conn.execute("SELECT refresh_organization_documents(NULL)")
+
+        await conn.execute("ANALYZE")
+        print(
+            f"Loaded {len(activities)} activities, {buildings} buildings, "
+            f"{organizations} organizations, {links} links in {time.perf_counter() - started:.1f}s"
+        )
+    finally:
+        await conn.close()
+
+
+def activity_depth(value: str) -> int:
+    depth = int(value)
+    if depth < 1:
+        raise argparse.ArgumentTypeError("от 1")
+    if depth > MAX_ACTIVITY_LEVEL:
+        raise argparse.ArgumentTypeError(f"Уровень активности не может быть больше {MAX_ACTIVITY_LEVEL}")
+    return depth
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Генерация синтетических данных для бенчмарков")
+    parser.add_argument("--buildings", type=int, default=100_000)
+    parser.add_argument("--organizations", type=int, default=200_000)
+    parser.add_argument("--activity-roots", type=int, default=5)
+    parser.add_argument("--activity-fanout", type=int, default=4)
+    parser.add_argument("--activity-depth", type=activity_depth, default=3)
+    parser.add_argument("--activities-per-organization", type=int, default=3)
+    parser.add_argument("--center-lat", type=float, default=55.7558)
+    parser.add_argument("--center-lon", type=float, default=37.6173)
+    parser.add_argument("--spread-km", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    asyncio.run(load(
+        buildings=args.buildings,
+        organizations=args.organizations,
+        activity_roots=args.activity_roots,
+        activity_fanout=args.activity_fanout,
+        activity_depth=args.activity_depth,
+        activities_per_organization=args.activities_per_organization,
+        center_lat=args.center_lat,
+        center_lon=args.center_lon,
+        spread_km=args.spread_km,
+        seed=args.seed,
+    ))
+
+
+if __name__ == "__main__":
+    main()
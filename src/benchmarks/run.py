@@ -0,0 +1,386 @@
+"""
+Замер задержек и пропускной способности репозиториев и HTTP-эндпоинтов.
+
+Запускается на данных из benchmarks/data.py, результат пишется в JSON,
+который можно сравнить с прогоном на другом коммите через benchmarks/compare.py.
+
+    python src/benchmarks/run.py repositories --requests 500 --concurrency 10
+    python src/benchmarks/run.py statements --requests 2000
+    python src/benchmarks/run.py http --base-url http://localhost:8000 --concurrency 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Awaitable, Callable
+
+from aiohttp import ClientSession
+from sqlalchemy import func, select
+
+from config import settings
+from db.database import async_session_maker
+from db.models import Activity, Building, Organization
+from repositories.activity import ActivityRepository
+from repositories.organization import GEO_BACKENDS
+
+
+@dataclass
+class Dataset:
+    """Границы сгенерированных данных, из которых выбираются параметры запросов"""
+    max_building_id: int
+    max_organization_id: int
+    root_activity_ids: list[int]
+    activity_ids: list[int]
+    min_lat: float
+    max_lat: float
+    min_lon: float
+    max_lon: float
+
+
+async def describe_dataset() -> Dataset:
+    async with async_session_maker() as session:
+        buildings = (await session.execute(
+            select(
+                func.max(Building.id),
+                func.min(Building.latitude),
+                func.max(Building.latitude),
+                func.min(Building.longitude),
+                func.max(Building.longitude),
+            )
+        )).one()
+        max_organization_id = (await session.execute(select(func.max(Organization.id)))).scalar_one()
+        activities = (await session.execute(select(Activity.id, Activity.parent_id))).all()
+
+    return Dataset(
+        max_building_id=buildings[0],
+        max_organization_id=max_organization_id,
+        root_activity_ids=[a.id for a in activities if a.parent_id is None],
+        activity_ids=[a.id for a in activities],
+        min_lat=buildings[1],
+        max_lat=buildings[2],
+        min_lon=buildings[3],
+        max_lon=buildings[4],
+    )
+
+
+def random_point(dataset: Dataset, rnd: random.Random) -> tuple[float, float]:
+    return rnd.uniform(dataset.min_lat, dataset.max_lat), rnd.uniform(dataset.min_lon, dataset.max_lon)
+
+
+def random_rectangle(dataset: Dataset, rnd: random.Random, size_deg: float) -> tuple[float, float, float, float]:
+    lat, lon = random_point(dataset, rnd)
+    return lat, lat + size_deg, lon, lon + size_deg
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Процентиль методом ближайшего ранга, values отсортирован"""
+    if not values:
+        return 0.0
+    rank = max(1, int(round(q / 100 * len(values))))
+    return values[min(rank, len(values)) - 1]
+
+
+async def measure(
+        name: str,
+        call: Callable[[int], Awaitable[object]],
+        requests: int,
+        concurrency: int,
+        warmup: int,
+) -> dict:
+    """Выполняет call(i) requests раз в concurrency параллельных потоков"""
+    for i in range(warmup):
+        await call(i)
+
+    latencies: list[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                await call(i)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    result = {
+        "name": name,
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+    }
+    print(
+        f"{name:<45} p50={result['p50_ms']:>9.2f}ms p95={result['p95_ms']:>9.2f}ms "
+        f"p99={result['p99_ms']:>9.2f}ms {result['throughput_rps']:>8.1f} rps errors={errors}"
+    )
+    return result
+
+
+# ---------- РЕПОЗИТОРИИ ----------
+def repository_cases(
+        dataset: Dataset,
+        rnd: random.Random,
+        page_size: int,
+        geo_backend: str,
+) -> dict[str, Callable]:
+    organizations = GEO_BACKENDS[geo_backend]()
+    activities = ActivityRepository()
+
+    def with_session(method):
+        async def call(i: int):
+            async with async_session_maker() as session:
+                return await method(session)
+        return call
+
+    return {
+        "OrganizationRepository.find_all[building_id]": with_session(
+            lambda s: organizations.find_all(s, {"building_id": rnd.randint(1, dataset.max_building_id)})
+        ),
+        "OrganizationRepository.find_all[activity_id]": with_session(
+            lambda s: organizations.find_all(s, {"activity_id": rnd.choice(dataset.activity_ids)}, limit=page_size)
+        ),
+        "OrganizationRepository.find_all[name]": with_session(
+            lambda s: organizations.find_all(s, {"name": f"{rnd.randint(1, 999)}"}, limit=page_size)
+        ),
+        "OrganizationRepository.find_all[page]": with_session(
+            lambda s: organizations.find_all(
+                s, {}, after_id=rnd.randint(0, dataset.max_organization_id), limit=page_size
+            )
+        ),
+        "OrganizationRepository.find_within_radius[1km]": with_session(
+            lambda s: organizations.find_within_radius(s, *random_point(dataset, rnd), 1.0)
+        ),
+        "OrganizationRepository.find_nearest[20]": with_session(
+            lambda s: organizations.find_nearest(s, *random_point(dataset, rnd), 20)
+        ),
+        "OrganizationRepository.find_within_rectangle[0.02deg]": with_session(
+            lambda s: organizations.find_within_rectangle(s, *random_rectangle(dataset, rnd, 0.02))
+        ),
+        "OrganizationRepository.find_by_building_ids[100]": with_session(
+            lambda s: organizations.find_by_building_ids(
+                s, [rnd.randint(1, dataset.max_building_id) for _ in range(100)]
+            )
+        ),
+        "OrganizationRepository.find_by_activity_ids[subtree]": with_session(
+            lambda s: organizations.find_by_activity_ids(
+                s, activities.subtree_ids_stmt(rnd.choice(dataset.root_activity_ids)), limit=page_size
+            )
+        ),
+        "OrganizationRepository.get_by_id": with_session(
+            lambda s: organizations.get_by_id(s, rnd.randint(1, dataset.max_organization_id))
+        ),
+        "ActivityRepository.get_activity_subtree_ids": with_session(
+            lambda s: activities.get_activity_subtree_ids(s, rnd.choice(dataset.root_activity_ids))
+        ),
+    }
+
+
+# ---------- ПОСТРОЕНИЕ ВЫРАЖЕНИЙ ----------
+def statement_cases(
+        dataset: Dataset,
+        rnd: random.Random,
+        page_size: int,
+        geo_backend: str,
+) -> dict[str, Callable]:
+    """
+    Python-часть запроса до обращения к БД: построение выражения и ключ кэша компиляции
+    SQLAlchemy. Выражения, собираемые на каждый запрос (built), сравниваются с готовыми
+    из repositories.statements (prepared). БД не нужна, кроме описания данных
+    """
+    organizations = GEO_BACKENDS[geo_backend]()
+
+    def prepare(build: Callable):
+        async def call(i: int):
+            stmt = build()
+            if isinstance(stmt, tuple):
+                stmt = stmt[0]
+            return stmt._generate_cache_key()
+        return call
+
+    def radius():
+        return *random_point(dataset, rnd), 1.0
+
+    def rectangle():
+        return random_rectangle(dataset, rnd, 0.02)
+
+    def building_ids():
+        return [rnd.randint(1, dataset.max_building_id) for _ in range(100)]
+
+    def building_filter():
+        return {"building_id": rnd.randint(1, dataset.max_building_id)}
+
+    return {
+        "within_radius[1km] built": prepare(
+            lambda: organizations.paginate(organizations.within_radius_stmt(*radius()), None, page_size)
+        ),
+        "within_radius[1km] prepared": prepare(
+            lambda: organizations.within_radius_query(*radius(), limit=page_size)
+        ),
+        "within_rectangle[0.02deg] built": prepare(
+            lambda: organizations.paginate(organizations.within_rectangle_stmt(*rectangle()), None, page_size)
+        ),
+        "within_rectangle[0.02deg] prepared": prepare(
+            lambda: organizations.within_rectangle_query(*rectangle(), limit=page_size)
+        ),
+        "by_building_ids[100] built": prepare(
+            lambda: organizations.paginate(organizations.by_building_ids_stmt(building_ids()), None, page_size)
+        ),
+        "by_building_ids[100] prepared": prepare(
+            lambda: organizations.by_building_ids_query(building_ids(), limit=page_size)
+        ),
+        "filtered[building_id] built": prepare(
+            lambda: organizations.paginate(organizations.filtered_stmt(building_filter()), None, page_size)
+        ),
+        "filtered[building_id] prepared": prepare(
+            lambda: organizations.filtered_query(building_filter(), limit=page_size)
+        ),
+    }
+
+
+# ---------- HTTP ----------
+def http_cases(
+        dataset: Dataset,
+        rnd: random.Random,
+        client: ClientSession,
+        base_url: str,
+        page_size: int,
+) -> dict[str, Callable]:
+    headers = {"Authorization": f"Bearer {settings.api_key}"}
+
+    def get(path: Callable[[], str]):
+        async def call(i: int):
+            async with client.get(f"{base_url}/api/v1{path()}", headers=headers) as response:
+                await response.read()
+                if response.status >= 400:
+                    raise RuntimeError(f"HTTP {response.status}")
+        return call
+
+    def radius():
+        lat, lon = random_point(dataset, rnd)
+        return f"/organizations/within_radius?latitude={lat}&longitude={lon}&radius_km=1"
+
+    def rectangle():
+        min_lat, max_lat, min_lon, max_lon = random_rectangle(dataset, rnd, 0.02)
+        return (f"/organizations/within_rectangle?min_lat={min_lat}&max_lat={max_lat}"
+                f"&min_lon={min_lon}&max_lon={max_lon}")
+
+    return {
+        "GET /organizations?building_id": get(
+            lambda: f"/organizations?building_id={rnd.randint(1, dataset.max_building_id)}"
+        ),
+        "GET /organizations?activity_id&include_subactivities": get(
+            lambda: (f"/organizations?activity_id={rnd.choice(dataset.root_activity_ids)}"
+                     f"&include_subactivities=true&limit={page_size}")
+        ),
+        "GET /organizations?name": get(
+            lambda: f"/organizations?name={rnd.randint(1, 999)}&limit={page_size}"
+        ),
+        "GET /organizations/within_radius[1km]": get(radius),
+        "GET /organizations/within_rectangle[0.02deg]": get(rectangle),
+        "GET /organizations/nearest[20]": get(
+            lambda: "/organizations/nearest?latitude={}&longitude={}&k=20".format(*random_point(dataset, rnd))
+        ),
+        "GET /organizations/{organization_id}": get(
+            lambda: f"/organizations/{rnd.randint(1, dataset.max_organization_id)}"
+        ),
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def run(args) -> dict:
+    rnd = random.Random(args.seed)
+    dataset = await describe_dataset()
+    cases_filter = set(args.case or [])
+
+    results = []
+    if args.target in ("repositories", "statements"):
+        build_cases = repository_cases if args.target == "repositories" else statement_cases
+        cases = build_cases(dataset, rnd, args.page_size, args.geo_backend)
+        for name, call in cases.items():
+            if not cases_filter or name in cases_filter:
+                results.append(await measure(name, call, args.requests, args.concurrency, args.warmup))
+    else:
+        async with ClientSession() as client:
+            cases = http_cases(dataset, rnd, client, args.base_url.rstrip("/"), args.page_size)
+            for name, call in cases.items():
+                if not cases_filter or name in cases_filter:
+                    results.append(await measure(name, call, args.requests, args.concurrency, args.warmup))
+
+    return {
+        "target": args.target,
+        "revision": git_revision(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "params": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "warmup": args.warmup,
+            "page_size": args.page_size,
+            "seed": args.seed,
+            "geo_backend": args.geo_backend,
+        },
+        "dataset": {
+            "buildings": dataset.max_building_id,
+            "organizations": dataset.max_organization_id,
+            "activities": len(dataset.activity_ids),
+        },
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки репозиториев и HTTP-эндпоинтов")
+    parser.add_argument("target", choices=["repositories", "statements", "http"])
+    parser.add_argument("--requests", type=int, default=300, help="запросов на каждый сценарий")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--page-size", type=int, default=100, help="limit для списочных запросов")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--geo-backend", choices=list(GEO_BACKENDS), default=settings.geo_backend,
+        help="реализация гео-запросов для сценариев repositories и statements",
+    )
+    parser.add_argument("--base-url", default=f"http://localhost:{settings.port}")
+    parser.add_argument("--case", action="append", help="запустить только указанный сценарий")
+    parser.add_argument("--output", help="файл для результатов, по умолчанию benchmark-results/<target>-<revision>.json")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+
+    output = args.output or os.path.join("benchmark-results", f"{report['target']}-{report['revision']}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,7 @@
+from typing import Literal
+
 from aiohttp import ClientSession
+from pydantic import Field, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -25,6 +28,20 @@ class DbSettings(BaseSettings):
     password: str
     name: str
     port: int
+    replica_host: str | None = None  # реплика для чтения, без неё всё идёт в основную БД
+    replica_port: int | None = None  # по умолчанию как port
+    # сколько реплика может отставать: столько секунд после сброса кэша ответы не кладутся в него снова
+    replica_lag_seconds: float = 2
+
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_timeout: float = 30  # сколько секунд ждать свободное соединение
+    pool_recycle: int = -1  # пересоздавать соединения старше N секунд, -1 - никогда
+    pool_pre_ping: bool = False  # проверять соединение перед выдачей из пула
+    statement_cache_size: int = 100  # собственный кэш asyncpg для запросов в обход prepare(), 0 - выключен
+    # кэш подготовленных выражений драйвера SQLAlchemy на соединение - через него идут все запросы ORM, 0 - выключен
+    prepared_statement_cache_size: int = 100
+    query_cache_size: int = 500  # кэш скомпилированного SQL в SQLAlchemy на движок
 
     model_config = SettingsConfigDict(env_prefix="DB_", env_file=".env", extra="ignore")
 
@@ -32,12 +49,85 @@ class DbSettings(BaseSettings):
     def dsn_asyncpg(self):
         return f"postgresql+asyncpg://{self.user}:{self.password}@{self.host}:{self.port}/{self.name}"
 
+    @property
+    def dsn_asyncpg_replica(self) -> str | None:
+        if not self.replica_host:
+            return None
+        port = self.replica_port or self.port
+        return f"postgresql+asyncpg://{self.user}:{self.password}@{self.replica_host}:{port}/{self.name}"
+
+class SpatialIndexSettings(BaseSettings):
+    enabled: bool = True
+    cell_size: float = 0.01  # размер ячейки сетки в градусах (~1.1 км по широте)
+    refresh_seconds: int = 300  # как часто перестраивать индекс из БД, 0 - только при старте
+
+    model_config = SettingsConfigDict(env_prefix="SPATIAL_INDEX_", env_file=".env", extra="ignore")
+
+class ActivityTreeSettings(BaseSettings):
+    ttl_seconds: int = 300  # через сколько секунд дерево деятельностей перечитывается из БД
+
+    model_config = SettingsConfigDict(env_prefix="ACTIVITY_TREE_", env_file=".env", extra="ignore")
+
+class CacheSettings(BaseSettings):
+    backend: Literal["memory", "redis", "none"] = "memory"
+    ttl_seconds: int = 60
+    max_entries: int = 10_000  # только для memory
+    redis_url: str = "redis://localhost:6379/0"  # только для redis
+
+    model_config = SettingsConfigDict(env_prefix="CACHE_", env_file=".env", extra="ignore")
+
+class JobsSettings(BaseSettings):
+    backend: Literal["memory"] = "memory"
+    workers: int = 2  # одновременно выполняемых фоновых задач - столько же соединений пула они занимают
+    queue_size: int = 100  # задач в очереди, сверх этого - 503
+    result_ttl_seconds: int = 600  # сколько хранится результат завершённой задачи
+    max_jobs: int = 1000  # сколько завершённых задач хранится одновременно
+    max_result_rows: int = 10_000  # организаций в результате задачи, при большем числе задача завершается ошибкой
+
+    model_config = SettingsConfigDict(env_prefix="JOBS_", env_file=".env", extra="ignore")
+
+class AdmissionSettings(BaseSettings):
+    enabled: bool = True
+    default_limit: int = 20  # одновременных запросов на маршрут, 0 - без ограничения
+    # ограничения отдельных маршрутов (шаблон пути), JSON в ADMISSION_LIMITS; тяжёлые гео-запросы
+    # держат соединение дольше остальных и вместе не должны занимать весь пул (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+    limits: dict[str, int] = {
+        "/api/v1/organizations/within_radius": 4,
+        "/api/v1/organizations/within_rectangle": 4,
+        "/api/v1/organizations/nearest": 4,
+        "/api/v1/organizations/stats": 2,
+        "/metrics": 0,
+    }
+    max_queue: int = 50  # запросов, ожидающих свободного места на маршруте
+    slo_seconds: float = 2.0  # сколько запрос может ждать в очереди, дольше - сразу 503, 0 - ждать без ограничения
+
+    model_config = SettingsConfigDict(env_prefix="ADMISSION_", env_file=".env", extra="ignore")
+
 class Settings(BaseSettings):
     port: int
     host: str
     api_key: str
+    max_page_size: int = 1000  # максимальный limit для списков организаций
+    stream_batch_size: int = 500  # размер пачки при потоковой выдаче NDJSON
+    fast_serialization: bool = True  # отдавать ответы без повторной валидации pydantic
+    # записей в одной транзакции пакетного импорта, не больше services.importer.MAX_BATCH_SIZE
+    import_batch_size: int = Field(1000, ge=1, le=8191)
+    compression: bool = True  # сжимать ответы gzip/brotli по Accept-Encoding
+    compression_min_size: int = 1024  # ответы короче стольких байт не сжимаются
+    # превышение бюджета запросов к БД эндпоинтом: off - не проверять, warn - в лог, strict - ошибка запроса
+    query_budget_mode: Literal["off", "warn", "strict"] = "warn"
+    # гео-запросы в БД: float - формулы по latitude/longitude, postgis - geography-колонка и GiST-индекс
+    geo_backend: Literal["float", "postgis"] = "float"
+    # откуда читаются организации: tables - из нормализованных таблиц, documents - из organization_documents.
+    # В organization_documents нет geography-колонки, поэтому documents несовместим с geo_backend=postgis
+    read_model: Literal["tables", "documents"] = "tables"
 
     db: DbSettings
+    spatial_index: SpatialIndexSettings
+    activity_tree: ActivityTreeSettings
+    cache: CacheSettings
+    jobs: JobsSettings
+    admission: AdmissionSettings
 
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -45,6 +135,20 @@ class Settings(BaseSettings):
         extra="ignore"
     )
 
+    @model_validator(mode="after")
+    def check_read_model(self):
+        if self.read_model == "documents" and self.geo_backend == "postgis":
+            raise ValueError(
+                "APP_READ_MODEL=documents несовместим с APP_GEO_BACKEND=postgis: "
+                "гео-поиск по organization_documents идёт по latitude/longitude"
+            )
+        return self
+
 settings = Settings(
     db=DbSettings(),
+    spatial_index=SpatialIndexSettings(),
+    activity_tree=ActivityTreeSettings(),
+    cache=CacheSettings(),
+    jobs=JobsSettings(),
+    admission=AdmissionSettings(),
 )
@@ -1,25 +1,163 @@
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-from sqlalchemy.orm import declarative_base
+import time
 
-from config import settings
+from sqlalchemy import Delete, Insert, Select, Update
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import Session, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from config import settings, DbSettings
+from metrics import CallbackMetric, instrument_engine, registry
 from typing import AsyncGenerator
 
 Base = declarative_base()
 
 
-def create_session_maker(db_url: str) -> async_sessionmaker[AsyncSession]:
+# ---------- ПУЛ СОЕДИНЕНИЙ ----------
+class PoolStats:
+    """Счётчики выдачи соединений из пула - для подбора DB_POOL_SIZE и DB_MAX_OVERFLOW"""
+    __slots__ = ("checkouts", "timeouts", "wait_seconds_total", "wait_seconds_max")
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Пул, который считает выдачи соединений и время ожидания.
+    В ожидание входит и открытие нового соединения, если пул ещё не заполнен
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.stats.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            self.stats.checkouts += 1
+            self.stats.wait_seconds_total += waited
+            self.stats.wait_seconds_max = max(self.stats.wait_seconds_max, waited)
+
+
+def create_engine(db_url: str, db_settings: DbSettings) -> AsyncEngine:
+    engine = create_async_engine(
+        url=db_url,
+        poolclass=InstrumentedQueuePool,
+        pool_size=db_settings.pool_size,
+        max_overflow=db_settings.max_overflow,
+        pool_timeout=db_settings.pool_timeout,
+        pool_recycle=db_settings.pool_recycle,
+        pool_pre_ping=db_settings.pool_pre_ping,
+        query_cache_size=db_settings.query_cache_size,
+        connect_args={
+            "statement_cache_size": db_settings.statement_cache_size,
+            "prepared_statement_cache_size": db_settings.prepared_statement_cache_size,
+        },
+    )
+    instrument_engine(engine)
+    return engine
+
+
+# ---------- МАРШРУТИЗАЦИЯ ЧТЕНИЯ ----------
+class RoutingSession(Session):
+    """
+    Сессия с двумя базами: SELECT уходят на реплику, запись - в основную БД.
+    После первой записи сессия читает только из основной, чтобы видеть свои изменения
+    """
+
+    def __init__(self, *args, replica_bind=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.replica_bind = replica_bind
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        primary = super().get_bind(mapper, clause=clause, **kwargs)
+        if self.replica_bind is None or self.info.get("use_primary"):
+            return primary
+
+        if (
+            self._flushing
+            or isinstance(clause, (Insert, Update, Delete))
+            or not isinstance(clause, Select)
+            or clause._for_update_arg is not None
+        ):
+            self.info["use_primary"] = True
+            return primary
+        return self.replica_bind
+
+
+def use_primary(session: AsyncSession) -> None:
+    """Дальнейшие запросы сессии читают из основной БД (проверки перед записью)"""
+    session.info["use_primary"] = True
+
+
+def create_session_maker(
+        primary: AsyncEngine,
+        replica: AsyncEngine | None = None,
+) -> async_sessionmaker[AsyncSession]:
     return async_sessionmaker(
-        bind=create_async_engine(
-            url=db_url,
-            pool_size=5,
-            max_overflow=10
-        ),
+        bind=primary,
+        sync_session_class=RoutingSession,
+        replica_bind=replica.sync_engine if replica is not None else None,
         expire_on_commit=False,
         class_=AsyncSession
     )
 
 
-async_session_maker = create_session_maker(settings.db.dsn_asyncpg)
+primary_engine = create_engine(settings.db.dsn_asyncpg, settings.db)
+replica_engine = (
+    create_engine(settings.db.dsn_asyncpg_replica, settings.db)
+    if settings.db.dsn_asyncpg_replica
+    else None
+)
+async_session_maker = create_session_maker(primary_engine, replica_engine)
+
+
+def pool_stats() -> dict[str, dict]:
+    """Состояние пулов основной БД и реплики"""
+    engines = {"primary": primary_engine}
+    if replica_engine is not None:
+        engines["replica"] = replica_engine
+
+    result = {}
+    for name, engine in engines.items():
+        pool = engine.pool
+        result[name] = {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": max(pool.overflow(), 0),
+            "checkouts": pool.stats.checkouts,
+            "timeouts": pool.stats.timeouts,
+            "wait_seconds_total": round(pool.stats.wait_seconds_total, 6),
+            "wait_seconds_max": round(pool.stats.wait_seconds_max, 6),
+        }
+    return result
+
+
+def _pool_metric(key: str):
+    def collect():
+        return [((name,), stats[key]) for name, stats in pool_stats().items()]
+    return collect
+
+
+for _name, _key, _type, _documentation in (
+    ("db_pool_size", "size", "gauge", "Configured pool size"),
+    ("db_pool_checked_out", "checked_out", "gauge", "Connections currently checked out"),
+    ("db_pool_overflow", "overflow", "gauge", "Overflow connections currently open"),
+    ("db_pool_checkouts_total", "checkouts", "counter", "Connection checkouts"),
+    ("db_pool_timeouts_total", "timeouts", "counter", "Checkouts that timed out waiting for a connection"),
+    ("db_pool_wait_seconds_total", "wait_seconds_total", "counter", "Time spent waiting for a connection"),
+):
+    registry.register(CallbackMetric(_name, _documentation, _type, ("pool",), _pool_metric(_key)))
 
 
 async def get_db_session() -> AsyncGenerator[AsyncSession, None]:
@@ -0,0 +1,72 @@
+"""
+Пакетный импорт организаций из файла NDJSON или CSV.
+
+    python src/db/import_organizations.py organizations.ndjson
+    python src/db/import_organizations.py organizations.csv --batch-size 5000
+
+Работающее приложение подхватит новые здания при следующем перестроении
+индекса (SPATIAL_INDEX_REFRESH_SECONDS), закэшированные ответы - по истечении CACHE_TTL_SECONDS.
+"""
+import argparse
+import asyncio
+import sys
+
+from config import settings
+from db.database import async_session_maker
+from repositories.building import BuildingRepository
+from repositories.organization import OrganizationRepository
+from services.activity_tree import activity_tree
+from services.importer import MAX_BATCH_SIZE, OrganizationImporter, decode_line, parse_csv, parse_ndjson
+from services.spatial_index import building_index
+
+
+async def read_lines(path: str):
+    with open(path, "rb") as f:
+        for line in f:
+            yield decode_line(line.rstrip(b"\n"))
+
+
+def batch_size(value: str) -> int:
+    size = int(value)
+    if not 1 <= size <= MAX_BATCH_SIZE:
+        # больше записей в пакете не передать одним запросом: у asyncpg не больше 32767 параметров
+        raise argparse.ArgumentTypeError(f"от 1 до {MAX_BATCH_SIZE}")
+    return size
+
+
+async def import_file(path: str, file_format: str, batch_size: int):
+    async with async_session_maker() as session:
+        importer = OrganizationImporter(
+            session,
+            OrganizationRepository(),
+            BuildingRepository(),
+            activity_tree,
+            building_index,  # в отдельном процессе не загружен, обновлять нечего
+            None,
+            batch_size,
+        )
+        lines = read_lines(path)
+        records = parse_csv(lines) if file_format == "csv" else parse_ndjson(lines)
+        return await importer.run(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Импорт организаций из NDJSON или CSV")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["ndjson", "csv"], help="по умолчанию по расширению файла")
+    parser.add_argument("--batch-size", type=batch_size, default=settings.import_batch_size)
+    args = parser.parse_args()
+
+    file_format = args.format or ("csv" if args.path.lower().endswith(".csv") else "ndjson")
+    report = asyncio.run(import_file(args.path, file_format, args.batch_size))
+
+    for batch in report.batches:
+        for error in batch.errors:
+            line = f"line {error.line}" if error.line is not None else f"batch {batch.batch}"
+            print(f"{line}: {error.error}", file=sys.stderr)
+    print(f"Inserted: {report.inserted}, updated: {report.updated}, failed: {report.failed}")
+    sys.exit(1 if report.failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, Table, ARRAY
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Table, ARRAY, Index, DateTime, func
+from sqlalchemy.dialects.postgresql import ARRAY as PG_ARRAY, JSONB
 from sqlalchemy.orm import relationship, declarative_base, validates
 from exceptions import ActivityValidationError
 from db.database import Base
@@ -7,8 +8,10 @@ from db.database import Base
 organization_activity = Table(
     'organization_activity',
     Base.metadata,
-    Column('organization_id', Integer, ForeignKey('organizations.id')),
-    Column('activity_id', Integer, ForeignKey('activities.id'))
+    Column('organization_id', Integer, ForeignKey('organizations.id'), primary_key=True),
+    Column('activity_id', Integer, ForeignKey('activities.id'), primary_key=True),
+    # Первичный ключ обслуживает поиск по организации, этот индекс - обратный поиск по деятельности
+    Index('ix_organization_activity_activity_id_organization_id', 'activity_id', 'organization_id'),
 )
 
 
@@ -24,6 +27,11 @@ class Building(Base):
     # Связь с организациями
     organizations = relationship("Organization", back_populates="building", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # Составной индекс для отсечения по прямоугольнику координат
+        Index('ix_buildings_latitude_longitude', 'latitude', 'longitude'),
+    )
+
     def __repr__(self):
         return f"<Building {self.address}>"
 
@@ -35,7 +43,7 @@ class Activity(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(200), nullable=False)
     level = Column(Integer, default=1)  # Уровень вложенности
-    parent_id = Column(Integer, ForeignKey('activities.id'), nullable=True)
+    parent_id = Column(Integer, ForeignKey('activities.id'), nullable=True, index=True)
 
     @validates('level')
     def validate_level(self, key, level):
@@ -88,22 +96,62 @@ class Organization(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(300), nullable=False)
-    building_id = Column(Integer, ForeignKey('buildings.id'), nullable=False)
+    building_id = Column(Integer, ForeignKey('buildings.id'), nullable=False, index=True)
     phone_numbers = Column(ARRAY(String), nullable=False, default=[])  # Массив телефонов
+    # растут при любом изменении, видимом в ответе: полей, здания, связей с деятельностями (ETag)
+    version = Column(Integer, nullable=False, server_default='1')
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
 
-    # Связи
+    # Связи. Для выдачи они догружаются пачками через repositories.loaders,
+    # неявная загрузка запрещена, чтобы не было скрытых запросов
     building = relationship(
         "Building",
         back_populates="organizations",
-        lazy="selectin"
+        lazy="raise"
     )
 
     activities = relationship(
         "Activity",
         secondary=organization_activity,
         back_populates="organizations",
-        lazy="selectin"
+        lazy="raise"
+    )
+
+    __table_args__ = (
+        # Триграммный индекс для поиска по подстроке, префиксу и похожести названия
+        Index(
+            'ix_organizations_name_trgm',
+            'name',
+            postgresql_using='gin',
+            postgresql_ops={'name': 'gin_trgm_ops'},
+        ),
     )
 
     def __repr__(self):
         return f"<Organization {self.name}>"
+
+
+class OrganizationDocument(Base):
+    """
+    Денормализованная копия организации для чтения без join: готовый документ
+    с зданием и id деятельностей плюс колонки для фильтров. Таблицу заполняют
+    триггеры БД на organizations, buildings и organization_activity
+    (миграция c7d3f1a9b250), приложение в неё не пишет
+    """
+    __tablename__ = 'organization_documents'
+
+    id = Column(Integer, ForeignKey('organizations.id', ondelete='CASCADE'), primary_key=True)
+    building_id = Column(Integer, nullable=False, index=True)
+    latitude = Column(Float, nullable=False)
+    longitude = Column(Float, nullable=False)
+    activity_ids = Column(PG_ARRAY(Integer), nullable=False)
+    # id, name, building_id, phone_numbers, building{id, address, latitude, longitude}, activity_ids
+    document = Column(JSONB, nullable=False)
+
+    __table_args__ = (
+        Index('ix_organization_documents_latitude_longitude', 'latitude', 'longitude'),
+        Index('ix_organization_documents_activity_ids', 'activity_ids', postgresql_using='gin'),
+    )
+
+    def __repr__(self):
+        return f"<OrganizationDocument {self.id}>"
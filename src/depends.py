@@ -2,10 +2,19 @@ from repositories.activity import ActivityRepository
 from services import organization
 from fastapi import Depends, Header, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from db.database import get_db_session
+from db.database import async_session_maker, get_db_session
 from repositories.organization import (
+    GEO_BACKENDS,
     OrganizationRepository,
 )
+from repositories.organization_document import OrganizationDocumentRepository
+from repositories.building import BuildingRepository
+from repositories.loaders import Loaders
+from services.spatial_index import BuildingSpatialIndex, building_index
+from services.activity_tree import ActivityTree, activity_tree
+from services.cache import ResponseCache, response_cache
+from services.importer import OrganizationImporter
+from services.jobs import AbstractJobBackend, job_backend
 from fastapi import security
 from fastapi.security import HTTPBearer
 
@@ -30,15 +39,79 @@ def verify_api_key(credentials: security.HTTPAuthorizationCredentials = Depends(
 
 
 def get_organization_repository() -> OrganizationRepository:
-    return OrganizationRepository()
+    return GEO_BACKENDS[settings.geo_backend]()
 
 def get_activity_repository() -> ActivityRepository:
     return ActivityRepository()
 
+def get_building_repository() -> BuildingRepository:
+    return BuildingRepository()
+
+def get_organization_document_repository() -> OrganizationDocumentRepository | None:
+    if settings.read_model == "documents":
+        return OrganizationDocumentRepository()
+    return None
+
+
+def get_loaders(session: AsyncSession = Depends(get_db_session)) -> Loaders:
+    return Loaders(session)
+
+
+def get_building_index() -> BuildingSpatialIndex:
+    return building_index
+
+
+def get_activity_tree() -> ActivityTree:
+    return activity_tree
+
+
+def get_response_cache() -> ResponseCache | None:
+    return response_cache
+
+
+def get_job_backend() -> AbstractJobBackend:
+    return job_backend
+
 
 def get_organization_service(
     session: AsyncSession = Depends(get_db_session),
     repository: OrganizationRepository = Depends(get_organization_repository),
-    activity_repository: ActivityRepository = Depends(get_activity_repository)
+    activity_repository: ActivityRepository = Depends(get_activity_repository),
+    spatial_index: BuildingSpatialIndex = Depends(get_building_index),
+    tree: ActivityTree = Depends(get_activity_tree),
+    cache: ResponseCache | None = Depends(get_response_cache),
+    loaders: Loaders = Depends(get_loaders),
+    documents: OrganizationDocumentRepository | None = Depends(get_organization_document_repository),
 ) -> organization.OrganizationService:
-    return organization.OrganizationService(repository, activity_repository, session)
+    return organization.OrganizationService(
+        repository, activity_repository, session, spatial_index, tree, cache, loaders, documents
+    )
+
+
+def get_organization_importer(
+    session: AsyncSession = Depends(get_db_session),
+    repository: OrganizationRepository = Depends(get_organization_repository),
+    building_repository: BuildingRepository = Depends(get_building_repository),
+    spatial_index: BuildingSpatialIndex = Depends(get_building_index),
+    tree: ActivityTree = Depends(get_activity_tree),
+    cache: ResponseCache | None = Depends(get_response_cache),
+) -> OrganizationImporter:
+    return OrganizationImporter(
+        session, repository, building_repository, tree, spatial_index, cache, settings.import_batch_size
+    )
+
+
+async def run_organization_job(kind: str, params: dict) -> list[dict]:
+    """Обработчик очереди задач: своя сессия на задачу, остальные зависимости - как у эндпоинтов"""
+    async with async_session_maker() as session:
+        service = organization.OrganizationService(
+            get_organization_repository(),
+            get_activity_repository(),
+            session,
+            get_building_index(),
+            get_activity_tree(),
+            get_response_cache(),
+            Loaders(session),
+            get_organization_document_repository(),
+        )
+        return await service.run_job(kind, params, settings.jobs.max_result_rows)
@@ -10,4 +10,19 @@ class ModelNoFoundException(BaseException):
 
 class ActivityValidationError(Exception):
     """Исключение для валидации активности"""
+    pass
+
+
+class QueryBudgetExceeded(Exception):
+    """Эндпоинт выполнил больше запросов к БД, чем заявлено в query_budget (APP_QUERY_BUDGET_MODE=strict)"""
+    pass
+
+
+class JobQueueFull(Exception):
+    """Очередь фоновых задач заполнена (JOBS_QUEUE_SIZE)"""
+    pass
+
+
+class JobResultTooLarge(Exception):
+    """Результат фоновой задачи больше JOBS_MAX_RESULT_ROWS организаций"""
     pass
\ No newline at end of file
@@ -0,0 +1,61 @@
+import math
+
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Расстояние по большой окружности между двумя точками в километрах"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+
+    a = (
+        math.sin(d_phi / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    )
+    # min() защищает asin от погрешности округления при a чуть больше 1
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, a)))
+
+
+def bounding_box(
+        latitude: float,
+        longitude: float,
+        radius_km: float,
+) -> tuple[float, float, float, float]:
+    """
+    Прямоугольник (min_lat, max_lat, min_lon, max_lon), гарантированно
+    содержащий круг радиуса radius_km вокруг точки.
+
+    Долгота не обрезается: у круга, который переходит через 180-й меридиан,
+    min_lon < -180 или max_lon > 180. Диапазоны в пределах [-180, 180] -
+    longitude_ranges(min_lon, max_lon)
+    """
+    angular = radius_km / EARTH_RADIUS_KM
+    d_lat = math.degrees(angular)
+
+    min_lat = latitude - d_lat
+    max_lat = latitude + d_lat
+
+    # круг накрывает полюс - по долготе подходит всё
+    if min_lat <= -90 or max_lat >= 90:
+        return max(min_lat, -90.0), min(max_lat, 90.0), -180.0, 180.0
+
+    d_lon = math.degrees(math.asin(math.sin(angular) / math.cos(math.radians(latitude))))
+
+    return min_lat, max_lat, longitude - d_lon, longitude + d_lon
+
+
+def longitude_ranges(min_lon: float, max_lon: float) -> list[tuple[float, float]]:
+    """
+    Диапазон долгот из bounding_box в пределах [-180, 180]: один, а если
+    он переходит через 180-й меридиан - два, по разные стороны от него
+    """
+    if max_lon - min_lon >= 360:
+        return [(-180.0, 180.0)]
+    if min_lon < -180:
+        return [(min_lon + 360, 180.0), (-180.0, max_lon)]
+    if max_lon > 180:
+        return [(min_lon, 180.0), (-180.0, max_lon - 360)]
+    return [(min_lon, max_lon)]
@@ -1,11 +1,72 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager, suppress
+
 from fastapi import FastAPI, Depends
 from api.v1.endpoints.organizations import router
+from api.v1.endpoints.system import router as system_router, metrics_router
+from api.middleware import AdmissionMiddleware, CompressionMiddleware, MetricsMiddleware
 from config import settings
+from db.database import async_session_maker
+from depends import run_organization_job
+from services.spatial_index import building_index
+from services.activity_tree import activity_tree
+from services.jobs import job_backend
 import uvicorn
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+
+async def refresh_building_index(interval: int):
+    """Периодически перестраивает индекс - подхватывает здания, записанные в обход API"""
+    while True:
+        await asyncio.sleep(interval)
+        # ошибка одного обновления (БД недоступна) не останавливает следующие - до них работает прежний индекс
+        try:
+            async with async_session_maker() as session:
+                await building_index.load(session)
+        except Exception:
+            logger.exception("Building index refresh failed")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # индекс координат и дерево деятельностей строятся один раз при старте приложения
+    async with async_session_maker() as session:
+        if settings.spatial_index.enabled:
+            await building_index.load(session)
+        await activity_tree.load(session)
+
+    refresh_task = None
+    if settings.spatial_index.enabled and settings.spatial_index.refresh_seconds > 0:
+        refresh_task = asyncio.create_task(refresh_building_index(settings.spatial_index.refresh_seconds))
+    await job_backend.start(run_organization_job)
+    yield
+    await job_backend.stop()
+    if refresh_task is not None:
+        refresh_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await refresh_task
+
+
+app = FastAPI(lifespan=lifespan)
+if settings.compression:
+    app.add_middleware(CompressionMiddleware, minimum_size=settings.compression_min_size)
+if settings.admission.enabled:
+    # снаружи сжатия: отклонённый запрос не доходит ни до чего дорогого
+    app.add_middleware(
+        AdmissionMiddleware,
+        default_limit=settings.admission.default_limit,
+        limits=settings.admission.limits,
+        max_queue=settings.admission.max_queue,
+        slo_seconds=settings.admission.slo_seconds,
+    )
+# последним добавленный middleware внешний - время ответа учитывает и сжатие, и ожидание в очереди
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(router, prefix="/api/v1", )
+app.include_router(system_router, prefix="/api/v1")
+app.include_router(metrics_router)
 
 if __name__ == "__main__":
     uvicorn.run(app, host=settings.host, port=settings.port)
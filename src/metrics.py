@@ -0,0 +1,237 @@
+"""
+Метрики в текстовом формате Prometheus и счётчики запросов к БД текущего HTTP-запроса.
+Без внешних зависимостей - нужны только счётчики, гистограммы и значения по callback.
+"""
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Iterable
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from config import settings
+from exceptions import QueryBudgetExceeded
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return f"{{{pairs}}}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+
+    def _key(self, labels: dict) -> tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        for key, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labelnames: tuple[str, ...] = (),
+            buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # на каждый набор меток: счётчики по корзинам (последняя - +Inf), сумма
+        self._values: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1][0] += value
+
+    def samples(self) -> Iterable[str]:
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                labels = _format_labels((*self.labelnames, "le"), (*key, _format_value(float(bound))))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(total[0])}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class CallbackMetric(_Metric):
+    """Значения, которые считаются в момент выгрузки метрик (например, состояние пула)"""
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            type: str,
+            labelnames: tuple[str, ...],
+            callback: Callable[[], Iterable[tuple[tuple[str, ...], float]]],
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.type = type
+        self.callback = callback
+
+    def samples(self) -> Iterable[str]:
+        for key, value in self.callback():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+registry = Registry()
+
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("method", "route", "status"),
+))
+http_request_db_queries = registry.register(Histogram(
+    "http_request_db_queries", "Database queries per HTTP request", ("method", "route"),
+    buckets=QUERY_COUNT_BUCKETS,
+))
+# какая часть времени ответа ушла на БД - сравнивается с http_request_duration_seconds того же маршрута
+http_request_db_duration = registry.register(Histogram(
+    "http_request_db_seconds", "Time spent in database queries per HTTP request", ("method", "route"),
+))
+db_query_duration = registry.register(Histogram(
+    "db_query_duration_seconds", "Database query latency by repository method", ("operation",),
+    buckets=QUERY_BUCKETS,
+))
+db_queries = registry.register(Counter(
+    "db_queries_total", "Database queries by repository method", ("operation",),
+))
+
+
+# ---------- ЗАПРОСЫ К БД ----------
+class RequestStats:
+    """
+    Запросы к БД, выполненные в рамках одного HTTP-запроса,
+    и бюджет запросов эндпоинта (api.query_budget), None - без ограничения
+    """
+    __slots__ = ("queries", "query_seconds", "budget")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.budget: int | None = None
+
+    @property
+    def over_budget(self) -> bool:
+        return self.budget is not None and self.queries > self.budget
+
+
+request_stats: ContextVar[RequestStats | None] = ContextVar("request_stats", default=None)
+
+# метод репозитория, который сейчас выполняет запрос (см. repositories.base)
+current_operation: ContextVar[str | None] = ContextVar("current_operation", default=None)
+
+# метка запроса, заданная через execution_options(operation=...)
+OPERATION_OPTION = "operation"
+# запросы с execution_options(query_budget_exempt=True) не входят в бюджет эндпоинта:
+# прогрев кэшей в памяти, который случается раз в несколько минут, а не на каждый запрос
+BUDGET_EXEMPT_OPTION = "query_budget_exempt"
+
+
+def _exempt(context) -> bool:
+    return context is not None and context.execution_options.get(BUDGET_EXEMPT_OPTION, False)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = request_stats.get()
+    if (
+        stats is not None
+        and stats.budget is not None
+        and settings.query_budget_mode == "strict"
+        and not _exempt(context)
+        and stats.queries >= stats.budget
+    ):
+        raise QueryBudgetExceeded(
+            f"Превышен бюджет запросов к БД: {stats.budget}, следующий запрос: {statement[:200]}"
+        )
+    conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started_at"].pop()
+
+    operation = (
+        (context.execution_options.get(OPERATION_OPTION) if context is not None else None)
+        or current_operation.get()
+        or "other"
+    )
+    db_queries.inc(operation=operation)
+    db_query_duration.observe(elapsed, operation=operation)
+
+    stats = request_stats.get()
+    if stats is not None and not _exempt(context):
+        stats.queries += 1
+        stats.query_seconds += elapsed
+
+
+def _handle_error(exception_context):
+    started = exception_context.connection.info.get("query_started_at") if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """Подключает замер запросов к движку"""
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine.sync_engine, "handle_error", _handle_error)
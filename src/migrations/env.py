@@ -22,12 +22,26 @@ target_metadata = Base.metadata
 config.set_main_option("sqlalchemy.url", settings.db.dsn_asyncpg + "?async_fallback=True")
 
 
+def include_object(object, name, type_, reflected, compare_to):
+    if not reflected or compare_to is not None:
+        return True
+    # служебная таблица расширения PostGIS
+    if type_ == "table" and name == "spatial_ref_sys":
+        return False
+    # buildings.location есть в БД только с PostGIS (миграция e5c2a8d4b713) и в модели не описана,
+    # autogenerate не должен предлагать её удалить
+    if type_ in ("column", "index") and object.table.name == "buildings":
+        return name not in ("location", "ix_buildings_location")
+    return True
+
+
 def run_migrations_offline() -> None:
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
         url=url,
         target_metadata=target_metadata,
         literal_binds=True,
+        include_object=include_object,
         dialect_opts={"paramstyle": "named"},
     )
 
@@ -45,7 +59,7 @@ def run_migrations_online() -> None:
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection, target_metadata=target_metadata, include_object=include_object
         )
 
         with context.begin_transaction():
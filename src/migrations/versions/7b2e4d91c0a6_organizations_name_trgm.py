@@ -0,0 +1,36 @@
+"""organizations name trgm
+
+Revision ID: 7b2e4d91c0a6
+Revises: 3c1f9a7d2e4b
+Create Date: 2026-10-18 11:03:15.742390
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b2e4d91c0a6'
+down_revision: Union[str, Sequence[str], None] = '3c1f9a7d2e4b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index(
+        'ix_organizations_name_trgm',
+        'organizations',
+        ['name'],
+        unique=False,
+        postgresql_using='gin',
+        postgresql_ops={'name': 'gin_trgm_ops'},
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_organizations_name_trgm', table_name='organizations', postgresql_using='gin')
@@ -0,0 +1,55 @@
+"""fk and junction indexes
+
+Revision ID: a91d3c5e7f20
+Revises: 7b2e4d91c0a6
+Create Date: 2026-10-18 11:47:52.093811
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a91d3c5e7f20'
+down_revision: Union[str, Sequence[str], None] = '7b2e4d91c0a6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # перед созданием первичного ключа убираем неполные связи и дубликаты
+    op.execute(
+        'DELETE FROM organization_activity '
+        'WHERE organization_id IS NULL OR activity_id IS NULL'
+    )
+    op.execute(
+        'DELETE FROM organization_activity a '
+        'USING organization_activity b '
+        'WHERE a.ctid < b.ctid '
+        'AND a.organization_id = b.organization_id '
+        'AND a.activity_id = b.activity_id'
+    )
+    op.alter_column('organization_activity', 'organization_id', existing_type=sa.Integer(), nullable=False)
+    op.alter_column('organization_activity', 'activity_id', existing_type=sa.Integer(), nullable=False)
+    op.create_primary_key('organization_activity_pkey', 'organization_activity', ['organization_id', 'activity_id'])
+    op.create_index(
+        'ix_organization_activity_activity_id_organization_id',
+        'organization_activity',
+        ['activity_id', 'organization_id'],
+        unique=False,
+    )
+    op.create_index(op.f('ix_organizations_building_id'), 'organizations', ['building_id'], unique=False)
+    op.create_index(op.f('ix_activities_parent_id'), 'activities', ['parent_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_activities_parent_id'), table_name='activities')
+    op.drop_index(op.f('ix_organizations_building_id'), table_name='organizations')
+    op.drop_index('ix_organization_activity_activity_id_organization_id', table_name='organization_activity')
+    op.drop_constraint('organization_activity_pkey', 'organization_activity', type_='primary')
+    op.alter_column('organization_activity', 'activity_id', existing_type=sa.Integer(), nullable=True)
+    op.alter_column('organization_activity', 'organization_id', existing_type=sa.Integer(), nullable=True)
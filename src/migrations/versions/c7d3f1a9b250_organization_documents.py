@@ -0,0 +1,147 @@
+"""organization documents
+
+Revision ID: c7d3f1a9b250
+Revises: e5c2a8d4b713
+Create Date: 2026-10-18 18:05:41.527390
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7d3f1a9b250'
+down_revision: Union[str, Sequence[str], None] = 'e5c2a8d4b713'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (таблица, событие, переходная таблица)
+TRIGGERS = (
+    ('organizations', 'INSERT', 'NEW'),
+    ('organizations', 'UPDATE', 'NEW'),
+    ('buildings', 'UPDATE', 'NEW'),
+    ('organization_activity', 'INSERT', 'NEW'),
+    ('organization_activity', 'DELETE', 'OLD'),
+)
+
+
+def _trigger_name(table: str, event: str) -> str:
+    return f'{table}_documents_{event.lower()}'
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'organization_documents',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('building_id', sa.Integer(), nullable=False),
+        sa.Column('latitude', sa.Float(), nullable=False),
+        sa.Column('longitude', sa.Float(), nullable=False),
+        sa.Column('activity_ids', postgresql.ARRAY(sa.Integer()), nullable=False),
+        sa.Column('document', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.ForeignKeyConstraint(['id'], ['organizations.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        op.f('ix_organization_documents_building_id'), 'organization_documents', ['building_id'], unique=False
+    )
+    op.create_index(
+        'ix_organization_documents_latitude_longitude',
+        'organization_documents',
+        ['latitude', 'longitude'],
+        unique=False,
+    )
+    op.create_index(
+        'ix_organization_documents_activity_ids',
+        'organization_documents',
+        ['activity_ids'],
+        unique=False,
+        postgresql_using='gin',
+    )
+
+    # пересобирает документы переданных организаций, NULL - всех
+    op.execute("""
+        CREATE FUNCTION refresh_organization_documents(organization_ids integer[]) RETURNS void
+        LANGUAGE sql AS $$
+            DELETE FROM organization_documents d
+            WHERE (organization_ids IS NULL OR d.id = ANY(organization_ids))
+              AND NOT EXISTS (SELECT 1 FROM organizations o WHERE o.id = d.id);
+
+            INSERT INTO organization_documents (id, building_id, latitude, longitude, activity_ids, document)
+            SELECT
+                o.id, o.building_id, b.latitude, b.longitude, links.activity_ids,
+                jsonb_build_object(
+                    'id', o.id,
+                    'name', o.name,
+                    'building_id', o.building_id,
+                    'phone_numbers', to_jsonb(o.phone_numbers),
+                    'building', jsonb_build_object(
+                        'id', b.id, 'address', b.address, 'latitude', b.latitude, 'longitude', b.longitude
+                    ),
+                    'activity_ids', to_jsonb(links.activity_ids)
+                )
+            FROM organizations o
+            JOIN buildings b ON b.id = o.building_id
+            CROSS JOIN LATERAL (
+                SELECT coalesce(array_agg(oa.activity_id ORDER BY oa.activity_id), '{}') AS activity_ids
+                FROM organization_activity oa
+                WHERE oa.organization_id = o.id
+            ) links
+            WHERE organization_ids IS NULL OR o.id = ANY(organization_ids)
+            ON CONFLICT (id) DO UPDATE SET
+                building_id = EXCLUDED.building_id,
+                latitude = EXCLUDED.latitude,
+                longitude = EXCLUDED.longitude,
+                activity_ids = EXCLUDED.activity_ids,
+                document = EXCLUDED.document;
+        $$
+    """)
+
+    # триггеры уровня оператора: пакетная запись пересобирает документы одним запросом.
+    # SET LOCAL organization_documents.deferred = 'on' отключает их на время массовой загрузки,
+    # после неё нужно вызвать refresh_organization_documents(NULL)
+    op.execute("""
+        CREATE FUNCTION organization_documents_trigger() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            IF current_setting('organization_documents.deferred', true) = 'on' THEN
+                RETURN NULL;
+            END IF;
+
+            IF TG_TABLE_NAME = 'organizations' THEN
+                PERFORM refresh_organization_documents(ARRAY(SELECT id FROM changed_rows));
+            ELSIF TG_TABLE_NAME = 'buildings' THEN
+                PERFORM refresh_organization_documents(ARRAY(
+                    SELECT o.id FROM organizations o JOIN changed_rows b ON b.id = o.building_id
+                ));
+            ELSE
+                PERFORM refresh_organization_documents(ARRAY(SELECT DISTINCT organization_id FROM changed_rows));
+            END IF;
+            RETURN NULL;
+        END
+        $$
+    """)
+    for table, event, transition in TRIGGERS:
+        op.execute(
+            f'CREATE TRIGGER {_trigger_name(table, event)} AFTER {event} ON {table} '
+            f'REFERENCING {transition} TABLE AS changed_rows '
+            f'FOR EACH STATEMENT EXECUTE FUNCTION organization_documents_trigger()'
+        )
+
+    op.execute('SELECT refresh_organization_documents(NULL)')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table, event, _ in TRIGGERS:
+        op.execute(f'DROP TRIGGER IF EXISTS {_trigger_name(table, event)} ON {table}')
+    op.execute('DROP FUNCTION IF EXISTS organization_documents_trigger()')
+    op.execute('DROP FUNCTION IF EXISTS refresh_organization_documents(integer[])')
+    op.drop_index('ix_organization_documents_activity_ids', table_name='organization_documents', postgresql_using='gin')
+    op.drop_index('ix_organization_documents_latitude_longitude', table_name='organization_documents')
+    op.drop_index(op.f('ix_organization_documents_building_id'), table_name='organization_documents')
+    op.drop_table('organization_documents')
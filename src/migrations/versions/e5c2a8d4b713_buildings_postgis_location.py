@@ -0,0 +1,47 @@
+"""buildings postgis location
+
+Revision ID: e5c2a8d4b713
+Revises: a91d3c5e7f20
+Create Date: 2026-10-18 16:42:08.311904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5c2a8d4b713'
+down_revision: Union[str, Sequence[str], None] = 'a91d3c5e7f20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Колонка нужна только для APP_GEO_BACKEND=postgis. Без установленного PostGIS
+    # (или прав на CREATE EXTENSION) миграция ничего не делает, работает float-бэкенд.
+    # Генерируемая колонка сама следует за latitude/longitude.
+    op.execute("""
+        DO $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'postgis') THEN
+                CREATE EXTENSION IF NOT EXISTS postgis;
+                ALTER TABLE buildings ADD COLUMN IF NOT EXISTS location geography(Point, 4326)
+                    GENERATED ALWAYS AS (ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)::geography) STORED;
+                CREATE INDEX IF NOT EXISTS ix_buildings_location ON buildings USING gist (location);
+            ELSE
+                RAISE NOTICE 'postgis is not available, buildings.location is not created';
+            END IF;
+        EXCEPTION WHEN insufficient_privilege THEN
+            RAISE NOTICE 'not enough privileges to create postgis, buildings.location is not created';
+        END
+        $$;
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute('DROP INDEX IF EXISTS ix_buildings_location')
+    op.execute('ALTER TABLE buildings DROP COLUMN IF EXISTS location')
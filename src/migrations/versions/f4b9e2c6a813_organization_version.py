@@ -0,0 +1,33 @@
+"""organization version
+
+Revision ID: f4b9e2c6a813
+Revises: c7d3f1a9b250
+Create Date: 2026-10-18 19:22:13.640518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4b9e2c6a813'
+down_revision: Union[str, Sequence[str], None] = 'c7d3f1a9b250'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('organizations', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column(
+        'organizations',
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('organizations', 'updated_at')
+    op.drop_column('organizations', 'version')
@@ -1,10 +1,26 @@
-from sqlalchemy import select
+from sqlalchemy import select, Select
 from sqlalchemy.ext.asyncio import AsyncSession
 from db.models import Activity
 from repositories.base import SQLAlchemyRepository
 
 
 class ActivityRepository(SQLAlchemyRepository):
+    model = Activity
+
+    def subtree_ids_stmt(self, root_activity_id: int) -> Select:
+        """
+        SELECT id всех деятельностей поддерева (включая корень)
+        одним рекурсивным запросом
+        """
+        subtree = (
+            select(Activity.id)
+            .where(Activity.id == root_activity_id)
+            .cte("activity_subtree", recursive=True)
+        )
+        subtree = subtree.union_all(
+            select(Activity.id).where(Activity.parent_id == subtree.c.id)
+        )
+        return select(subtree.c.id)
 
     async def get_activity_subtree_ids(
         self,
@@ -14,17 +30,5 @@ class ActivityRepository(SQLAlchemyRepository):
         """
         Возвращает список id: [root, child1, child2, ...]
         """
-        result_ids = []
-        stack = [root_activity_id]
-
-        while stack:
-            current_id = stack.pop()
-            result_ids.append(current_id)
-
-            stmt = select(Activity.id).where(Activity.parent_id == current_id)
-            res = await session.execute(stmt)
-            children_ids = [row[0] for row in res.all()]
-
-            stack.extend(children_ids)
-
-        return result_ids
+        res = await session.execute(self.subtree_ids_stmt(root_activity_id))
+        return list(res.scalars().all())
@@ -1,6 +1,9 @@
+import functools
+import inspect
 from abc import ABC, abstractmethod
 
-from sqlalchemy import insert, select, update, delete, and_
+from sqlalchemy import insert, select, update, delete, and_, any_, bindparam, Integer, Executable
+from sqlalchemy.dialects.postgresql import ARRAY
 from typing import Dict, Any, Optional
 from sqlalchemy.exc import IntegrityError, NoResultFound
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -9,6 +12,55 @@ from exceptions import (
     ModelAlreadyExistsException,
     ModelNoFoundException
 )
+from metrics import OPERATION_OPTION, current_operation
+
+
+def _traced(func):
+    """
+    Помечает запросы метода репозитория его именем для метрик (metrics.py).
+    Корутины и генераторы задают имя на время выполнения - вложенные вызовы
+    не перебивают внешний; построители выражений вешают его на сам SELECT
+    """
+    def operation(self) -> str:
+        return f"{type(self).__name__}.{func.__name__}"
+
+    if inspect.isasyncgenfunction(func):
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            generator = func(self, *args, **kwargs)
+            name = None if current_operation.get() else operation(self)
+            while True:
+                # между шагами управление у вызывающего, его запросы не наши
+                token = current_operation.set(name) if name else None
+                try:
+                    item = await generator.__anext__()
+                except StopAsyncIteration:
+                    return
+                finally:
+                    if token is not None:
+                        current_operation.reset(token)
+                yield item
+        return wrapper
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            if current_operation.get():
+                return await func(self, *args, **kwargs)
+            token = current_operation.set(operation(self))
+            try:
+                return await func(self, *args, **kwargs)
+            finally:
+                current_operation.reset(token)
+        return wrapper
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        result = func(self, *args, **kwargs)
+        if isinstance(result, Executable) and OPERATION_OPTION not in result.get_execution_options():
+            result = result.execution_options(**{OPERATION_OPTION: operation(self)})
+        return result
+    return wrapper
 
 
 class AbstractRepository(ABC):
@@ -17,6 +69,13 @@ class AbstractRepository(ABC):
     """
     model = None
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # публичные методы наследников подписывают свои запросы в метриках
+        for name, value in list(vars(cls).items()):
+            if not name.startswith("_") and inspect.isfunction(value):
+                setattr(cls, name, _traced(value))
+
     @abstractmethod
     async def add_one(self, *args, **kwargs):
         raise NotImplementedError
@@ -36,15 +95,27 @@ class SQLAlchemyRepository(AbstractRepository):
     """
     model = None
 
-    async def add_one(self, session: AsyncSession, data: dict):
+    async def add_one(self, session: AsyncSession, data: dict, commit: bool = True):
         stmt = insert(self.model).values(**data).returning(self.model)
         try:
             res = await session.execute(stmt)
-            await session.commit()
-            return res.scalar_one()
+            obj = res.scalar_one()
+            if commit:
+                await session.commit()
+            return obj
         except IntegrityError:
             raise ModelAlreadyExistsException
 
+    async def find_existing_ids(self, session: AsyncSession, ids: list[int]) -> set[int]:
+        """Какие из переданных id есть в таблице - одним запросом"""
+        if not ids:
+            return set()
+        stmt = select(self.model.id).where(
+            self.model.id == any_(bindparam("ids", ids, type_=ARRAY(Integer)))
+        )
+        res = await session.execute(stmt)
+        return set(res.scalars().all())
+
     async def find_all(self, session: AsyncSession, filters: Optional[Dict[str, Any]] = None):
         stmt = select(self.model)
 
@@ -84,7 +155,7 @@ class SQLAlchemyRepository(AbstractRepository):
         except NoResultFound:
             raise ModelNoFoundException
 
-    async def change_one(self, session: AsyncSession, data: dict):
+    async def change_one(self, session: AsyncSession, data: dict, commit: bool = True):
         obj_id = data.pop('id')
 
         stmt = (
@@ -97,7 +168,8 @@ class SQLAlchemyRepository(AbstractRepository):
         try:
             res = await session.execute(stmt)
             updated_obj = res.scalar_one()
-            await session.commit()
+            if commit:
+                await session.commit()
             return updated_obj
         except NoResultFound:
             await session.rollback()
@@ -0,0 +1,45 @@
+from sqlalchemy import String, any_, bindparam, select, tuple_
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import Building
+from repositories.base import SQLAlchemyRepository
+
+
+class BuildingRepository(SQLAlchemyRepository):
+    model = Building
+
+    async def upsert_many(self, session: AsyncSession, rows: list[dict]) -> tuple[list, list]:
+        """
+        Добавляет здания одним INSERT ... ON CONFLICT, существующим адресам
+        обновляет координаты, если они другие. Без commit.
+
+        :return: строки (id, address, latitude, longitude) добавленных или изменённых
+            зданий и строки зданий, которые остались как были
+        """
+        if not rows:
+            return [], []
+
+        stmt = insert(Building).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Building.address],
+            set_={
+                "latitude": stmt.excluded.latitude,
+                "longitude": stmt.excluded.longitude,
+            },
+            # адрес - ключ конфликта и совпадает всегда; без изменений строка не переписывается и не возвращается
+            where=tuple_(Building.latitude, Building.longitude).is_distinct_from(
+                tuple_(stmt.excluded.latitude, stmt.excluded.longitude)
+            ),
+        ).returning(Building.id, Building.address, Building.latitude, Building.longitude)
+        changed = (await session.execute(stmt)).all()
+
+        changed_addresses = {row.address for row in changed}
+        unchanged_addresses = [row["address"] for row in rows if row["address"] not in changed_addresses]
+        if not unchanged_addresses:
+            return changed, []
+        res = await session.execute(
+            select(Building.id, Building.address, Building.latitude, Building.longitude)
+            .where(Building.address == any_(bindparam("addresses", unchanged_addresses, type_=ARRAY(String))))
+        )
+        return changed, res.all()
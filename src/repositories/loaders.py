@@ -0,0 +1,122 @@
+import asyncio
+from typing import Awaitable, Callable, Generic, Hashable, Iterable, TypeVar
+
+from sqlalchemy import Select, select, any_, bindparam, Integer
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import Building, organization_activity
+from metrics import OPERATION_OPTION
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class DataLoader(Generic[K, V]):
+    """
+    Собирает ключи, запрошенные за один такт event loop, и загружает их
+    одним запросом. Каждый ключ загружается один раз - повторные обращения
+    отдаются из памяти, пока загрузчик жив (в пределах запроса)
+    """
+
+    def __init__(self, batch_load: Callable[[list[K]], Awaitable[dict[K, V]]], default: V | None = None):
+        self._batch_load = batch_load
+        self._default = default
+        self._memo: dict[K, asyncio.Future] = {}
+        self._queue: list[tuple[K, asyncio.Future]] = []
+        self._tasks: set[asyncio.Task] = set()
+
+    def load(self, key: K) -> Awaitable[V]:
+        future = self._memo.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._memo[key] = loop.create_future()
+            if not self._queue:
+                # запрос уйдёт, когда текущая корутина отдаст управление
+                task = loop.create_task(self._dispatch())
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            self._queue.append((key, future))
+        return future
+
+    async def load_many(self, keys: Iterable[K]) -> list[V]:
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    def prime(self, key: K, value: V) -> None:
+        """Кладёт уже известное значение, чтобы не загружать его повторно"""
+        if key not in self._memo:
+            future = self._memo[key] = asyncio.get_running_loop().create_future()
+            future.set_result(value)
+
+    def clear(self) -> None:
+        self._memo.clear()
+
+    async def _dispatch(self) -> None:
+        queue, self._queue = self._queue, []
+        # future берутся из очереди: после clear() до отправки запроса их уже нет в _memo
+        keys = [key for key, _ in queue]
+        futures = [future for _, future in queue]
+        try:
+            values = await self._batch_load(keys)
+        except Exception as exc:
+            for key, future in zip(keys, futures):
+                # неудачная загрузка не запоминается - следующий load повторит запрос
+                if self._memo.get(key) is future:
+                    del self._memo[key]
+                future.set_exception(exc)
+            return
+        for key, future in zip(keys, futures):
+            if not future.done():
+                future.set_result(values.get(key, self._default))
+
+
+class Loaders:
+    """
+    Загрузчики связей организаций на время одного запроса. Все они работают
+    через одну сессию, поэтому их запросы выполняются по очереди.
+
+    Деятельности по id не загружаются - они берутся из дерева в памяти
+    (services.activity_tree), из БД читаются только связи организация-деятельность
+    """
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+        self._lock = asyncio.Lock()
+        self.buildings: DataLoader[int, Building] = DataLoader(self._load_buildings)
+        self.activity_ids: DataLoader[int, list[int]] = DataLoader(self._load_activity_ids, default=[])
+
+    def clear(self) -> None:
+        self.buildings.clear()
+        self.activity_ids.clear()
+
+    async def _load_buildings(self, ids: list[int]) -> dict[int, Building]:
+        stmt = (
+            select(Building)
+            .where(Building.id == any_(bindparam("ids", ids, type_=ARRAY(Integer))))
+            .execution_options(**{OPERATION_OPTION: "Loaders.buildings"})
+        )
+        async with self._lock:
+            res = await self.session.execute(stmt)
+        return {building.id: building for building in res.scalars().all()}
+
+    @staticmethod
+    def activity_ids_stmt(organization_ids: list[int]) -> Select:
+        # идёт по первичному ключу (organization_id, activity_id) - строки сразу в нужном порядке
+        return (
+            select(organization_activity.c.organization_id, organization_activity.c.activity_id)
+            .where(organization_activity.c.organization_id == any_(
+                bindparam("ids", organization_ids, type_=ARRAY(Integer))
+            ))
+            .order_by(organization_activity.c.organization_id, organization_activity.c.activity_id)
+            .execution_options(**{OPERATION_OPTION: "Loaders.activity_ids"})
+        )
+
+    async def _load_activity_ids(self, organization_ids: list[int]) -> dict[int, list[int]]:
+        stmt = self.activity_ids_stmt(organization_ids)
+        async with self._lock:
+            res = await self.session.execute(stmt)
+
+        links: dict[int, list[int]] = {}
+        for organization_id, activity_id in res.all():
+            links.setdefault(organization_id, []).append(activity_id)
+        return links
@@ -1,107 +1,255 @@
+from datetime import datetime
+from typing import AsyncIterator, Iterable, Sequence
+
 from repositories.base import SQLAlchemyRepository
+from repositories.statements import PreparedQueries, statement_cache
 from sqlalchemy.orm import relationship, joinedload, selectinload
-from sqlalchemy import select, func
-from db.models import Organization, Activity, Building
+from sqlalchemy import select, func, any_, bindparam, or_, Integer, Select, delete, literal_column, update
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from db.models import Organization, Activity, Building, organization_activity
+from exceptions import ModelNoFoundException
+from geo import EARTH_RADIUS_KM, bounding_box, longitude_ranges
 from sqlalchemy.ext.asyncio import AsyncSession
 
+# 'on' в транзакции отключает триггеры пересборки organization_documents (миграция c7d3f1a9b250)
+DOCUMENTS_DEFERRED = "organization_documents.deferred"
+
+
+def distance_km_expr(lat_column, lon_column, latitude: float, longitude: float):
+    """Расстояние в км от точки до координат из колонок по формуле гаверсинусов"""
+    d_lat = func.radians(lat_column - latitude)
+    d_lon = func.radians(lon_column - longitude)
+
+    a = (
+        func.power(func.sin(d_lat / 2), 2)
+        + func.cos(func.radians(latitude))
+        * func.cos(func.radians(lat_column))
+        * func.power(func.sin(d_lon / 2), 2)
+    )
+
+    # least() не даёт округлению вывести аргумент asin за пределы [0, 1]
+    return 2 * EARTH_RADIUS_KM * func.asin(func.sqrt(func.least(a, 1.0)))
+
 
-class OrganizationRepository(SQLAlchemyRepository):
+def radius_box(latitude: float, longitude: float, radius_km: float) -> tuple:
+    """Прямоугольник вокруг круга для within_radius_stmt: (min_lat, max_lat, [(min_lon, max_lon), ...])"""
+    min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius_km)
+    return min_lat, max_lat, longitude_ranges(min_lon, max_lon)
+
+
+def in_radius_box(lat_column, lon_column, bbox: tuple):
+    """Условия попадания в прямоугольник radius_box; у круга через 180-й меридиан - две полосы долгот"""
+    min_lat, max_lat, lon_ranges = bbox
+    longitude = [lon_column.between(min_lon, max_lon) for min_lon, max_lon in lon_ranges]
+    return lat_column.between(min_lat, max_lat), longitude[0] if len(longitude) == 1 else or_(*longitude)
+
+
+class OrganizationRepository(SQLAlchemyRepository, PreparedQueries):
     model = Organization
 
-    # ---------- ОБЩИЙ eager load ----------
+    # ---------- ОБЩИЙ SELECT ----------
     def _base_stmt(self):
+        # здания и деятельности догружаются пачками через repositories.loaders
+        return select(self.model)
+
+    @staticmethod
+    def _distance_expr(latitude: float, longitude: float):
+        """Расстояние от точки до здания в км по формуле гаверсинусов"""
+        return distance_km_expr(Building.latitude, Building.longitude, latitude, longitude)
+
+    # ---------- ПАГИНАЦИЯ И ВЫБОРКА ----------
+    def paginate(self, stmt: Select, after_id: int | None = None, limit: int | None = None) -> Select:
+        """Keyset-пагинация: организации с id больше after_id, не более limit штук"""
+        stmt = stmt.order_by(self.model.id)
+        if after_id is not None:
+            stmt = stmt.where(self.model.id > after_id)
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        return stmt
+
+    async def fetch(self, session: AsyncSession, stmt: Select, params: dict | None = None) -> Sequence[Organization]:
+        res = await session.execute(stmt, params)
+        return res.scalars().unique().all()
+
+    async def stream(
+            self,
+            session: AsyncSession,
+            stmt: Select,
+            batch_size: int,
+    ) -> AsyncIterator[Sequence[Organization]]:
+        """
+        Отдаёт организации пачками по batch_size через серверный курсор
+        """
+        res = await session.stream_scalars(
+            stmt.order_by(self.model.id).execution_options(yield_per=batch_size)
+        )
+        async for partition in res.partitions():
+            yield partition
+
+    # ---------- В РАДИУСЕ ----------
+    def within_radius_stmt(
+            self,
+            latitude: float,
+            longitude: float,
+            radius_km: float,
+            bbox: tuple | None = None,
+    ) -> Select:
+        """
+        :param bbox: готовый прямоугольник вокруг круга в виде radius_box,
+            например параметры из within_radius_query
+        """
+        # прямоугольник отсекается по индексу (latitude, longitude),
+        # точное расстояние считается только для попавших в него зданий
         return (
-            select(self.model)
+            self._base_stmt()
             .join(self.model.building)
-            .options(
-                selectinload(self.model.building),
-                selectinload(self.model.activities)
-                .selectinload(Activity.children),
+            .where(
+                *in_radius_box(Building.latitude, Building.longitude, bbox or radius_box(latitude, longitude, radius_km)),
+                self._distance_expr(latitude, longitude) <= radius_km,
             )
         )
 
-    # ---------- В РАДИУСЕ ----------
     async def find_within_radius(
             self,
             session: AsyncSession,
             latitude: float,
             longitude: float,
             radius_km: float,
+            after_id: int | None = None,
+            limit: int | None = None,
     ):
-        earth_radius = 6371  # км
+        return await self.fetch(session, *self.within_radius_query(latitude, longitude, radius_km, after_id, limit))
 
-        distance_expr = (
-                earth_radius
-                * func.acos(
-            func.cos(func.radians(latitude))
-            * func.cos(func.radians(Building.latitude))
-            * func.cos(func.radians(Building.longitude) - func.radians(longitude))
-            + func.sin(func.radians(latitude))
-            * func.sin(func.radians(Building.latitude))
-        )
-        )
-
-        stmt = (
-            self._base_stmt()
-            .where(distance_expr <= radius_km)
+    # ---------- БЛИЖАЙШИЕ ----------
+    def nearest_stmt(self, latitude: float, longitude: float, k: int) -> Select:
+        """
+        k ближайших организаций с расстоянием. Без KNN-индекса это полный
+        просмотр зданий - используется, только когда индекс в памяти не готов
+        """
+        distance = self._distance_expr(latitude, longitude).label("distance_km")
+        return (
+            select(self.model, distance)
+            .join(self.model.building)
+            .order_by(distance, self.model.id)
+            .limit(k)
         )
 
-        res = await session.execute(stmt)
-        return res.scalars().unique().all()
+    async def find_nearest(
+            self,
+            session: AsyncSession,
+            latitude: float,
+            longitude: float,
+            k: int,
+    ) -> list[tuple[Organization, float]]:
+        res = await session.execute(self.nearest_stmt(latitude, longitude, k))
+        return [(organization, distance) for organization, distance in res.all()]
 
     # ---------- В ПРЯМОУГОЛЬНИКЕ ----------
-    async def find_within_rectangle(
+    def within_rectangle_stmt(
             self,
-            session: AsyncSession,
             min_lat: float,
             max_lat: float,
             min_lon: float,
             max_lon: float,
-    ):
-        stmt = (
+    ) -> Select:
+        return (
             self._base_stmt()
+            .join(self.model.building)
             .where(
                 Building.latitude.between(min_lat, max_lat),
                 Building.longitude.between(min_lon, max_lon),
             )
         )
 
-        res = await session.execute(stmt)
-        return res.scalars().unique().all()
-
-
-    async def find_by_activity_ids(
+    async def find_within_rectangle(
             self,
             session: AsyncSession,
-            activity_ids: list[int],
+            min_lat: float,
+            max_lat: float,
+            min_lon: float,
+            max_lon: float,
+            after_id: int | None = None,
+            limit: int | None = None,
     ):
-        stmt = (
-            select(self.model)
-            .join(self.model.activities)
-            .where(Activity.id.in_(activity_ids))
-            .options(
-                selectinload(self.model.building),
-                selectinload(self.model.activities)
-                .selectinload(Activity.children),
+        return await self.fetch(
+            session, *self.within_rectangle_query(min_lat, max_lat, min_lon, max_lon, after_id, limit)
+        )
+
+    # ---------- ПО СПИСКУ ЗДАНИЙ ----------
+    def by_building_ids_stmt(self, building_ids: list[int]) -> Select:
+        # = ANY(:ids) передаёт список одним параметром-массивом,
+        # IN (...) упёрся бы в лимит параметров asyncpg на больших выборках
+        return (
+            self._base_stmt()
+            .where(
+                self.model.building_id == any_(
+                    bindparam("building_ids", building_ids, type_=ARRAY(Integer))
+                )
             )
         )
 
-        res = await session.execute(stmt)
-        return res.scalars().unique().all()
+    async def find_by_building_ids(
+            self,
+            session: AsyncSession,
+            building_ids: list[int],
+            after_id: int | None = None,
+            limit: int | None = None,
+    ):
+        if not building_ids:
+            return []
 
-    async def find_all(
+        return await self.fetch(session, *self.by_building_ids_query(building_ids, after_id, limit))
+
+    # ---------- ПО ДЕЯТЕЛЬНОСТЯМ ----------
+    def by_activity_ids_stmt(self, activity_ids: list[int] | Select) -> Select:
+        """
+        :param activity_ids: список id или подзапрос, например поддерево
+            из ActivityRepository.subtree_ids_stmt - тогда поиск выполняется одним запросом
+        """
+        # полусоединение по таблице связей не размножает строки организаций
+        linked_ids = (
+            select(organization_activity.c.organization_id)
+            .where(organization_activity.c.activity_id.in_(activity_ids))
+        )
+        return self._base_stmt().where(self.model.id.in_(linked_ids))
+
+    async def find_by_activity_ids(
             self,
             session: AsyncSession,
-            filters: dict | None = None,
+            activity_ids: list[int] | Select,
+            after_id: int | None = None,
+            limit: int | None = None,
     ):
-        stmt = (
-            select(Organization)
-            .options(
-                selectinload(Organization.building),
-                selectinload(Organization.activities)
-                .selectinload(Activity.children),
+        stmt = self.by_activity_ids_stmt(activity_ids)
+        return await self.fetch(session, self.paginate(stmt, after_id, limit))
+
+    # ---------- ПО НАЗВАНИЮ ----------
+    @staticmethod
+    def _name_search(stmt: Select, name: str, mode: str) -> Select:
+        """
+        Поиск по названию, все режимы обслуживаются GIN-индексом pg_trgm:
+
+        - contains - подстрока в любом месте названия
+        - prefix - название начинается с name (подсказки при вводе)
+        - similar - нечёткий поиск, результаты упорядочены по похожести
+        """
+        if mode == "similar":
+            similarity = func.similarity(Organization.name, name)
+            return (
+                stmt
+                .where(Organization.name.op("%")(name))
+                .order_by(similarity.desc())
             )
-        )
+
+        # спецсимволы LIKE в пользовательском вводе ищутся буквально
+        escaped = name.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        if mode == "prefix":
+            return stmt.where(Organization.name.ilike(f"{escaped}%", escape="\\"))
+        return stmt.where(Organization.name.ilike(f"%{escaped}%", escape="\\"))
+
+    # ---------- ПО ФИЛЬТРАМ ----------
+    def filtered_stmt(self, filters: dict | None = None) -> Select:
+        stmt = self._base_stmt()
 
         if filters:
             conditions = []
@@ -111,7 +259,7 @@ class OrganizationRepository(SQLAlchemyRepository):
                 conditions.append(Organization.building_id == filters["building_id"])
 
             if "name" in filters:
-                conditions.append(Organization.name.ilike(f"%{filters['name']}%"))
+                stmt = self._name_search(stmt, filters["name"], filters.get("name_search", "contains"))
 
             # ⚠️ activity_id — через JOIN
             if "activity_id" in filters:
@@ -122,28 +270,296 @@ class OrganizationRepository(SQLAlchemyRepository):
             if conditions:
                 stmt = stmt.where(*conditions)
 
-        res = await session.execute(stmt)
-        return res.scalars().unique().all()
+        return stmt
 
-    async def get_by_id(
+    async def find_all(
             self,
             session: AsyncSession,
-            obj_id: int,
+            filters: dict | None = None,
+            after_id: int | None = None,
+            limit: int | None = None,
     ):
+        return await self.fetch(session, *self.filtered_query(filters or {}, after_id, limit))
+
+    async def get_many(self, session: AsyncSession, ids: list[int]) -> Sequence[Organization]:
+        """Организации по списку id одним запросом, отсутствующие id просто не попадают в результат"""
+        if not ids:
+            return []
+        stmt = self._base_stmt().where(
+            Organization.id == any_(bindparam("ids", ids, type_=ARRAY(Integer)))
+        )
+        return await self.fetch(session, stmt)
+
+    # ---------- СТАТИСТИКА ----------
+    @staticmethod
+    def _in_rectangle(stmt: Select, bbox: tuple[float, float, float, float] | None) -> Select:
+        """Оставляет организации из зданий в прямоугольнике (min_lat, max_lat, min_lon, max_lon)"""
+        if bbox is None:
+            return stmt
+        min_lat, max_lat, min_lon, max_lon = bbox
+        return stmt.join(Building, Building.id == Organization.building_id).where(
+            Building.latitude.between(min_lat, max_lat),
+            Building.longitude.between(min_lon, max_lon),
+        )
+
+    async def count(
+            self,
+            session: AsyncSession,
+            bbox: tuple[float, float, float, float] | None = None,
+    ) -> int:
+        stmt = self._in_rectangle(select(func.count()).select_from(Organization), bbox)
+        res = await session.execute(stmt)
+        return res.scalar_one()
+
+    async def count_by_building(
+            self,
+            session: AsyncSession,
+            bbox: tuple[float, float, float, float] | None = None,
+            limit: int | None = None,
+    ) -> list[tuple[int, int]]:
+        """(building_id, число организаций) по убыванию числа, не более limit зданий"""
+        count = func.count().label("count")
+        stmt = (
+            self._in_rectangle(select(Organization.building_id, count).select_from(Organization), bbox)
+            .group_by(Organization.building_id)
+            .order_by(count.desc(), Organization.building_id)
+            .limit(limit)
+        )
+        res = await session.execute(stmt)
+        return [(building_id, count) for building_id, count in res.all()]
+
+    async def count_by_activity(
+            self,
+            session: AsyncSession,
+            subtrees: dict[int, Iterable[int]],
+            bbox: tuple[float, float, float, float] | None = None,
+    ) -> dict[int, tuple[int, int]]:
+        """
+        Число организаций по деятельностям одним GROUP BY.
+
+        :param subtrees: {activity_id: id самой деятельности и всех её потомков} из дерева деятельностей
+        :return: {activity_id: (привязанные к самой деятельности, к ней или любой вложенной)},
+            организация с несколькими деятельностями поддерева считается один раз
+        """
+        ancestor_ids, member_ids = [], []
+        for activity_id, subtree_ids in subtrees.items():
+            for member_id in subtree_ids:
+                ancestor_ids.append(activity_id)
+                member_ids.append(member_id)
+        if not ancestor_ids:
+            return {}
+
+        # пары (деятельность, деятельность её поддерева) - связь попадает во все поддеревья, где она есть
+        pairs = func.unnest(
+            bindparam("ancestor_ids", ancestor_ids, type_=ARRAY(Integer)),
+            bindparam("member_ids", member_ids, type_=ARRAY(Integer)),
+        ).table_valued("ancestor_id", "activity_id").render_derived()
+        links = organization_activity.c
+
         stmt = (
-            select(Organization)
-            .where(Organization.id == obj_id)
-            .options(
-                selectinload(Organization.building),
-                selectinload(Organization.activities)
-                .selectinload(Activity.children),
+            select(
+                pairs.c.ancestor_id,
+                func.count().filter(pairs.c.ancestor_id == pairs.c.activity_id),
+                func.count(links.organization_id.distinct()),
             )
+            .select_from(organization_activity)
+            .join(pairs, pairs.c.activity_id == links.activity_id)
+            .group_by(pairs.c.ancestor_id)
         )
+        if bbox is not None:
+            stmt = self._in_rectangle(stmt.join(Organization, Organization.id == links.organization_id), bbox)
 
         res = await session.execute(stmt)
+        return {activity_id: (direct, subtree) for activity_id, direct, subtree in res.all()}
+
+    # ---------- ВЕРСИИ ----------
+    @staticmethod
+    def _bump() -> dict:
+        """Значения для UPDATE: следующая версия организации и время изменения"""
+        return {"version": Organization.version + 1, "updated_at": func.now()}
+
+    async def versions(self, session: AsyncSession, stmt: Select) -> list[tuple[int, int, datetime]]:
+        """
+        (id, version, updated_at) организаций из выражения выборки - для ETag
+        без загрузки самих организаций и их связей
+        """
+        res = await session.execute(
+            stmt.with_only_columns(Organization.id, Organization.version, Organization.updated_at)
+        )
+        return [(organization_id, version, updated_at) for organization_id, version, updated_at in res.all()]
+
+    async def versions_by_ids(self, session: AsyncSession, ids: list[int]) -> list[tuple[int, int, datetime]]:
+        """(id, version, updated_at) организаций по списку id - поиск по первичному ключу"""
+        if not ids:
+            return []
+        return await self.versions(
+            session, select(Organization).where(Organization.id == any_(bindparam("ids", ids, type_=ARRAY(Integer))))
+        )
+
+    async def change_one(self, session: AsyncSession, data: dict, commit: bool = True):
+        return await super().change_one(session, {**data, **self._bump()}, commit)
+
+    async def touch_buildings(self, session: AsyncSession, building_ids: list[int]) -> None:
+        """Новая версия организациям в зданиях - здание входит в их ответ. Без commit"""
+        if not building_ids:
+            return
+        await session.execute(
+            update(Organization)
+            .where(Organization.building_id == any_(bindparam("building_ids", building_ids, type_=ARRAY(Integer))))
+            .values(**self._bump())
+        )
+
+    # ---------- ПАКЕТНАЯ ЗАПИСЬ ----------
+    async def upsert_many(self, session: AsyncSession, rows: list[dict]) -> list[tuple[int, bool]]:
+        """
+        Пакетная запись организаций без commit: строки с id обновляют
+        существующие организации, строки без id добавляются.
+
+        :return: (id, добавлена ли) в порядке rows
+        """
+        result: list[tuple[int, bool] | None] = [None] * len(rows)
+        columns = ("name", "building_id", "phone_numbers")
+
+        updates = [(i, row) for i, row in enumerate(rows) if row.get("id") is not None]
+        if updates:
+            stmt = insert(Organization).values([
+                {"id": row["id"], **{column: row[column] for column in columns}}
+                for _, row in updates
+            ])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Organization.id],
+                set_={**{column: stmt.excluded[column] for column in columns}, **self._bump()},
+            )
+            await session.execute(stmt)
+            for i, row in updates:
+                result[i] = (row["id"], False)
+
+        inserts = [(i, row) for i, row in enumerate(rows) if row.get("id") is None]
+        if inserts:
+            stmt = insert(Organization).returning(Organization.id, sort_by_parameter_order=True)
+            res = await session.execute(
+                stmt,
+                [{column: row[column] for column in columns} for _, row in inserts],
+            )
+            for (i, _), organization_id in zip(inserts, res.scalars().all()):
+                result[i] = (organization_id, True)
+
+        return result
+
+    async def replace_activities(self, session: AsyncSession, links: dict[int, list[int]]) -> None:
+        """
+        Заменяет набор деятельностей у организаций {organization_id: [activity_id, ...]} без commit.
+        Триггеры на DELETE и INSERT связей на это время отключены: документы организаций
+        пересобирает один триггер на обновление их версии, а не три подряд
+        """
+        if not links:
+            return
+
+        # прежнее значение возвращается в конце - массовую загрузку с отключёнными триггерами не включаем
+        deferred = (await session.execute(
+            select(func.current_setting(DOCUMENTS_DEFERRED, True), func.set_config(DOCUMENTS_DEFERRED, "on", True))
+        )).scalar()
+        await session.execute(
+            delete(organization_activity).where(
+                organization_activity.c.organization_id == any_(
+                    bindparam("organization_ids", list(links), type_=ARRAY(Integer))
+                )
+            )
+        )
+        rows = [
+            {"organization_id": organization_id, "activity_id": activity_id}
+            for organization_id, activity_ids in links.items()
+            for activity_id in set(activity_ids)
+        ]
+        if rows:
+            await session.execute(insert(organization_activity), rows)
+        await session.execute(select(func.set_config(DOCUMENTS_DEFERRED, deferred or "off", True)))
+        await session.execute(
+            update(Organization)
+            .where(Organization.id == any_(bindparam("organization_ids", list(links), type_=ARRAY(Integer))))
+            .values(**self._bump())
+        )
+
+    async def get_by_id(
+            self,
+            session: AsyncSession,
+            obj_id: int,
+    ):
+        stmt = statement_cache.get(
+            (type(self), "by_id"), lambda: self._base_stmt().where(Organization.id == bindparam("id"))
+        )
+
+        res = await session.execute(stmt, {"id": obj_id})
         organization = res.scalar_one_or_none()
 
         if not organization:
-            raise Exception("Organization not found")
+            raise ModelNoFoundException
 
         return organization
+
+
+class PostGISOrganizationRepository(OrganizationRepository):
+    """
+    Гео-поиск через PostGIS: колонка buildings.location geography(Point, 4326)
+    с GiST-индексом (миграция e5c2a8d4b713). Колонка генерируется из latitude/longitude
+    и в модели не описана. Выбирается через APP_GEO_BACKEND=postgis,
+    OrganizationRepository на float-координатах остаётся по умолчанию.
+
+    Расстояния считаются на сфере, как и в OrganizationRepository
+    """
+    location = literal_column("buildings.location")
+
+    @staticmethod
+    def _point(latitude: float, longitude: float):
+        return func.geography(func.ST_SetSRID(func.ST_MakePoint(longitude, latitude), 4326))
+
+    def within_radius_stmt(
+            self,
+            latitude: float,
+            longitude: float,
+            radius_km: float,
+            bbox: tuple | None = None,
+    ) -> Select:
+        # прямоугольник не нужен - ST_DWithin сам отбирает кандидатов по GiST-индексу
+        return (
+            self._base_stmt()
+            .join(self.model.building)
+            .where(func.ST_DWithin(self.location, self._point(latitude, longitude), radius_km * 1000, False))
+        )
+
+    def nearest_stmt(self, latitude: float, longitude: float, k: int) -> Select:
+        """k ближайших организаций с расстоянием, ORDER BY <-> обслуживается GiST-индексом"""
+        point = self._point(latitude, longitude)
+        distance = (func.ST_Distance(self.location, point, False) / 1000).label("distance_km")
+        return (
+            select(self.model, distance)
+            .join(self.model.building)
+            .order_by(self.location.op("<->")(point), self.model.id)
+            .limit(k)
+        )
+
+    def within_rectangle_stmt(
+            self,
+            min_lat: float,
+            max_lat: float,
+            min_lon: float,
+            max_lon: float,
+    ) -> Select:
+        # && отбирает кандидатов по индексу - рамка geography чуть шире прямоугольника
+        # из-за дуг большого круга, точная граница проверяется по координатам
+        envelope = func.geography(func.ST_MakeEnvelope(min_lon, min_lat, max_lon, max_lat, 4326))
+        return (
+            self._base_stmt()
+            .join(self.model.building)
+            .where(
+                self.location.op("&&")(envelope),
+                Building.latitude.between(min_lat, max_lat),
+                Building.longitude.between(min_lon, max_lon),
+            )
+        )
+
+
+GEO_BACKENDS: dict[str, type[OrganizationRepository]] = {
+    "float": OrganizationRepository,
+    "postgis": PostGISOrganizationRepository,
+}
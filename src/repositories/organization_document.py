@@ -0,0 +1,156 @@
+from typing import AsyncIterator, Sequence
+
+from sqlalchemy import select, func, any_, bindparam, Integer, Select
+from sqlalchemy.dialects.postgresql import ARRAY, array
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import Organization, OrganizationDocument
+from exceptions import ModelNoFoundException
+from repositories.base import SQLAlchemyRepository
+from repositories.organization import OrganizationRepository, distance_km_expr, in_radius_box, radius_box
+from repositories.statements import PreparedQueries, statement_cache
+
+
+class OrganizationDocumentRepository(SQLAlchemyRepository, PreparedQueries):
+    """
+    Чтение организаций из organization_documents: одна таблица без join,
+    документ уже содержит здание и id деятельностей. Построители выражений
+    совпадают с OrganizationRepository, поэтому сервис может читать из любого
+    из них (APP_READ_MODEL). Таблица только для чтения - её ведут триггеры БД
+    """
+    model = OrganizationDocument
+
+    # ---------- ПАГИНАЦИЯ И ВЫБОРКА ----------
+    def paginate(self, stmt: Select, after_id: int | None = None, limit: int | None = None) -> Select:
+        """Keyset-пагинация: документы с id больше after_id, не более limit штук"""
+        stmt = stmt.order_by(self.model.id)
+        if after_id is not None:
+            stmt = stmt.where(self.model.id > after_id)
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        return stmt
+
+    async def fetch(
+            self,
+            session: AsyncSession,
+            stmt: Select,
+            params: dict | None = None,
+    ) -> Sequence[OrganizationDocument]:
+        res = await session.execute(stmt, params)
+        return res.scalars().all()
+
+    async def stream(
+            self,
+            session: AsyncSession,
+            stmt: Select,
+            batch_size: int,
+    ) -> AsyncIterator[Sequence[OrganizationDocument]]:
+        res = await session.stream_scalars(
+            stmt.order_by(self.model.id).execution_options(yield_per=batch_size)
+        )
+        async for partition in res.partitions():
+            yield partition
+
+    # ---------- ГЕО ----------
+    def _distance_expr(self, latitude: float, longitude: float):
+        return distance_km_expr(self.model.latitude, self.model.longitude, latitude, longitude)
+
+    def within_radius_stmt(
+            self,
+            latitude: float,
+            longitude: float,
+            radius_km: float,
+            bbox: tuple | None = None,
+    ) -> Select:
+        return select(self.model).where(
+            *in_radius_box(self.model.latitude, self.model.longitude, bbox or radius_box(latitude, longitude, radius_km)),
+            self._distance_expr(latitude, longitude) <= radius_km,
+        )
+
+    def nearest_stmt(self, latitude: float, longitude: float, k: int) -> Select:
+        distance = self._distance_expr(latitude, longitude).label("distance_km")
+        return (
+            select(self.model, distance)
+            .order_by(distance, self.model.id)
+            .limit(k)
+        )
+
+    async def find_nearest(
+            self,
+            session: AsyncSession,
+            latitude: float,
+            longitude: float,
+            k: int,
+    ) -> list[tuple[OrganizationDocument, float]]:
+        res = await session.execute(self.nearest_stmt(latitude, longitude, k))
+        return [(document, distance) for document, distance in res.all()]
+
+    def within_rectangle_stmt(
+            self,
+            min_lat: float,
+            max_lat: float,
+            min_lon: float,
+            max_lon: float,
+    ) -> Select:
+        return select(self.model).where(
+            self.model.latitude.between(min_lat, max_lat),
+            self.model.longitude.between(min_lon, max_lon),
+        )
+
+    # ---------- ПО ЗДАНИЯМ И ДЕЯТЕЛЬНОСТЯМ ----------
+    def by_building_ids_stmt(self, building_ids: list[int]) -> Select:
+        return select(self.model).where(
+            self.model.building_id == any_(bindparam("building_ids", building_ids, type_=ARRAY(Integer)))
+        )
+
+    def by_activity_ids_stmt(self, activity_ids: list[int] | Select) -> Select:
+        """Пересечение массивов обслуживается GIN-индексом по activity_ids"""
+        if isinstance(activity_ids, Select):
+            activity_ids = func.array(activity_ids.scalar_subquery())
+        else:
+            activity_ids = bindparam("activity_ids", list(activity_ids), type_=ARRAY(Integer))
+        return select(self.model).where(self.model.activity_ids.overlap(activity_ids))
+
+    # ---------- ПО ФИЛЬТРАМ ----------
+    def filtered_stmt(self, filters: dict | None = None) -> Select:
+        stmt = select(self.model)
+        if not filters:
+            return stmt
+
+        if "building_id" in filters:
+            stmt = stmt.where(self.model.building_id == filters["building_id"])
+
+        if "activity_id" in filters:
+            stmt = stmt.where(self.model.activity_ids.contains(array([filters["activity_id"]])))
+
+        # название ищется по триграммному индексу organizations - это единственный join
+        if "name" in filters:
+            stmt = OrganizationRepository._name_search(
+                stmt.join(Organization, Organization.id == self.model.id),
+                filters["name"],
+                filters.get("name_search", "contains"),
+            )
+
+        return stmt
+
+    async def get_many(self, session: AsyncSession, ids: list[int]) -> Sequence[OrganizationDocument]:
+        if not ids:
+            return []
+        stmt = select(self.model).where(self.model.id == any_(bindparam("ids", ids, type_=ARRAY(Integer))))
+        return await self.fetch(session, stmt)
+
+    async def get_by_id(
+            self,
+            session: AsyncSession,
+            obj_id: int,
+    ):
+        stmt = statement_cache.get(
+            (type(self), "by_id"), lambda: select(self.model).where(self.model.id == bindparam("id"))
+        )
+        res = await session.execute(stmt, {"id": obj_id})
+        document = res.scalar_one_or_none()
+
+        if not document:
+            raise ModelNoFoundException
+
+        return document
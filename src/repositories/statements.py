@@ -0,0 +1,158 @@
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+from sqlalchemy import Float, Integer, Select, bindparam
+
+from geo import bounding_box, longitude_ranges
+
+# общие параметры шаблонов: значения подставляются при выполнении
+AFTER_ID = bindparam("after_id", type_=Integer)
+LIMIT = bindparam("limit", type_=Integer)
+LATITUDE = bindparam("latitude", type_=Float)
+LONGITUDE = bindparam("longitude", type_=Float)
+RADIUS_KM = bindparam("radius_km", type_=Float)
+MIN_LAT = bindparam("min_lat", type_=Float)
+MAX_LAT = bindparam("max_lat", type_=Float)
+MIN_LON = bindparam("min_lon", type_=Float)
+MAX_LON = bindparam("max_lon", type_=Float)
+BBOX = (MIN_LAT, MAX_LAT, MIN_LON, MAX_LON)
+# вторая полоса долгот у круга, который переходит через 180-й меридиан (geo.longitude_ranges)
+LON_RANGES = ((MIN_LON, MAX_LON), (bindparam("min_lon_2", type_=Float), bindparam("max_lon_2", type_=Float)))
+
+
+class StatementCache:
+    """
+    Готовые SELECT по форме запроса (какие фильтры заданы, есть ли after_id и limit).
+    Значения приходят при выполнении через именованные bindparam, поэтому выражение
+    строится, а ключ кэша компиляции SQLAlchemy вычисляется один раз на форму.
+    На горячих путях это несколько сотен микросекунд Python на запрос
+    (формула гаверсинусов - самое дорогое дерево выражений)
+    """
+
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self._statements: OrderedDict[Hashable, Select] = OrderedDict()
+
+    def get(self, key: Hashable, build: Callable[[], Select]) -> Select:
+        stmt = self._statements.get(key)
+        if stmt is None:
+            stmt = self._statements[key] = build()
+            if len(self._statements) > self.max_size:
+                self._statements.popitem(last=False)
+        else:
+            self._statements.move_to_end(key)
+        return stmt
+
+
+statement_cache = StatementCache()
+
+
+class PreparedQueries:
+    """
+    Примесь к репозиториям организаций: постраничные запросы из statement_cache.
+    *_query возвращают (выражение, параметры) для fetch(session, stmt, params).
+    Построители *_stmt и paginate репозитория должны принимать bindparam вместо значений
+    """
+
+    def _page_query(
+            self,
+            shape: tuple,
+            build: Callable[[], Select],
+            params: dict,
+            after_id: int | None,
+            limit: int | None,
+    ) -> tuple[Select, dict]:
+        # у PostGIS-репозитория свои выражения для тех же форм
+        key = (type(self), *shape, after_id is not None, limit is not None)
+        stmt = statement_cache.get(key, lambda: self.paginate(
+            build(),
+            AFTER_ID if after_id is not None else None,
+            LIMIT if limit is not None else None,
+        ))
+        if after_id is not None:
+            params["after_id"] = after_id
+        if limit is not None:
+            params["limit"] = limit
+        return stmt, params
+
+    # ---------- ПОСТРАНИЧНЫЕ ЗАПРОСЫ ----------
+    def within_radius_query(
+            self,
+            latitude: float,
+            longitude: float,
+            radius_km: float,
+            after_id: int | None = None,
+            limit: int | None = None,
+    ) -> tuple[Select, dict]:
+        # прямоугольник для индекса считается в Python и тоже передаётся параметрами,
+        # у круга через 180-й меридиан в нём две полосы долгот - это другая форма запроса
+        min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius_km)
+        lon_ranges = longitude_ranges(min_lon, max_lon)
+        params = {
+            "latitude": latitude,
+            "longitude": longitude,
+            "radius_km": radius_km,
+            "min_lat": min_lat,
+            "max_lat": max_lat,
+        }
+        for (min_param, max_param), (range_min, range_max) in zip(LON_RANGES, lon_ranges):
+            params[min_param.key] = range_min
+            params[max_param.key] = range_max
+        bbox = (MIN_LAT, MAX_LAT, LON_RANGES[:len(lon_ranges)])
+        return self._page_query(
+            ("within_radius", len(lon_ranges)),
+            lambda: self.within_radius_stmt(LATITUDE, LONGITUDE, RADIUS_KM, bbox),
+            params,
+            after_id,
+            limit,
+        )
+
+    def within_rectangle_query(
+            self,
+            min_lat: float,
+            max_lat: float,
+            min_lon: float,
+            max_lon: float,
+            after_id: int | None = None,
+            limit: int | None = None,
+    ) -> tuple[Select, dict]:
+        return self._page_query(
+            ("within_rectangle",),
+            lambda: self.within_rectangle_stmt(*BBOX),
+            {"min_lat": min_lat, "max_lat": max_lat, "min_lon": min_lon, "max_lon": max_lon},
+            after_id,
+            limit,
+        )
+
+    def by_building_ids_query(
+            self,
+            building_ids: list[int],
+            after_id: int | None = None,
+            limit: int | None = None,
+    ) -> tuple[Select, dict]:
+        # by_building_ids_stmt передаёт список параметром building_ids, значение заменяется при выполнении
+        return self._page_query(
+            ("by_building_ids",),
+            lambda: self.by_building_ids_stmt([]),
+            {"building_ids": list(building_ids)},
+            after_id,
+            limit,
+        )
+
+    def filtered_query(
+            self,
+            filters: dict,
+            after_id: int | None = None,
+            limit: int | None = None,
+    ) -> tuple[Select, dict]:
+        if "name" in filters:
+            # шаблон LIKE собирается из пользовательского ввода - такие запросы строятся как обычно
+            return self.paginate(self.filtered_stmt(filters), after_id, limit), {}
+        keys = tuple(key for key in ("building_id", "activity_id") if key in filters)
+        return self._page_query(
+            ("filtered", *keys),
+            lambda: self.filtered_stmt({key: bindparam(key, type_=Integer) for key in keys}),
+            {key: filters[key] for key in keys},
+            after_id,
+            limit,
+        )
@@ -1,6 +1,7 @@
-from pydantic import BaseModel, ConfigDict, Field
-from typing import List, Optional
-from schemas.building import BuildingResponse
+from datetime import datetime
+from pydantic import BaseModel, ConfigDict, Field, model_validator
+from typing import List, Literal, Optional
+from schemas.building import BuildingResponse, BuildingCreate
 from schemas.activity import ActivityResponse
 
 
@@ -32,6 +33,10 @@ class OrganizationResponse(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class OrganizationNearestResponse(OrganizationResponse):
+    distance_km: float
+
+
 # Специальные схемы для запросов
 class CoordinateRequest(BaseModel):
     latitude: float
@@ -53,3 +58,83 @@ class OrganizationSearchRequest(BaseModel):
     name: Optional[str] = None
     activity_id: Optional[int] = None
     building_id: Optional[int] = None
+
+
+class OrganizationBatchRequest(BaseModel):
+    ids: List[int] = Field(min_length=1, description="id организаций, не больше APP_MAX_PAGE_SIZE")
+
+
+class OrganizationBatchResponse(BaseModel):
+    organizations: List[OrganizationResponse]
+    missing_ids: List[int]
+
+
+class ActivityCount(BaseModel):
+    activity_id: int
+    count: int = Field(description="Организации, привязанные к самой деятельности")
+    subtree_count: int = Field(description="Организации, привязанные к ней или к любой вложенной, без повторов")
+
+
+class BuildingCount(BaseModel):
+    building_id: int
+    count: int
+
+
+class OrganizationStatsResponse(BaseModel):
+    total: int
+    activities: List[ActivityCount]
+    buildings: List[BuildingCount]
+
+
+class OrganizationJobResponse(BaseModel):
+    id: str
+    kind: Literal["within_radius", "within_rectangle"]
+    status: Literal["pending", "running", "done", "failed"]
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+    total: Optional[int] = Field(None, description="Сколько организаций найдено, пока задача не завершена - null")
+    organizations: List[OrganizationResponse] = Field(
+        default_factory=list, description="Страница результата по after_id и limit"
+    )
+
+
+# Схемы пакетного импорта
+class OrganizationImportRecord(BaseModel):
+    """
+    Строка импорта. С id - обновление существующей организации, без id - новая.
+    Здание задаётся либо building_id, либо building (добавляется или обновляется по адресу).
+    activity_ids=None оставляет деятельности как есть
+    """
+    id: Optional[int] = None
+    name: str
+    phone_numbers: List[str] = Field(default_factory=list)
+    building_id: Optional[int] = None
+    building: Optional[BuildingCreate] = None
+    activity_ids: Optional[List[int]] = None
+
+    @model_validator(mode="after")
+    def check_building(self):
+        if (self.building_id is None) == (self.building is None):
+            raise ValueError("Нужно указать ровно одно из полей building_id или building")
+        return self
+
+
+class ImportRecordError(BaseModel):
+    line: Optional[int] = None
+    error: str
+
+
+class ImportBatchReport(BaseModel):
+    batch: int
+    inserted: int = 0
+    updated: int = 0
+    failed: int = 0
+    errors: List[ImportRecordError] = Field(default_factory=list)
+
+
+class ImportReport(BaseModel):
+    inserted: int = 0
+    updated: int = 0
+    failed: int = 0
+    batches: List[ImportBatchReport] = Field(default_factory=list)
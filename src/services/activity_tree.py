@@ -0,0 +1,151 @@
+import asyncio
+import hashlib
+import time
+from typing import Iterable
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from db.models import Activity
+from metrics import BUDGET_EXEMPT_OPTION, OPERATION_OPTION
+
+
+class ActivityNode:
+    """Узел дерева деятельностей"""
+    __slots__ = ("id", "name", "level", "parent_id", "children_ids")
+
+    def __init__(self, id: int, name: str, level: int, parent_id: int | None):
+        self.id = id
+        self.name = name
+        self.level = level
+        self.parent_id = parent_id
+        self.children_ids: list[int] = []
+
+
+class ActivityTree:
+    """
+    Дерево деятельностей в памяти процесса.
+
+    Деятельности - небольшой и редко меняющийся справочник, поэтому дерево
+    загружается целиком, а множества потомков и сериализованные поддеревья
+    считаются один раз при загрузке. Перечитывается из БД по истечении ttl
+    или после invalidate().
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self.version = 0
+
+        self._nodes: dict[int, ActivityNode] = {}
+        self._descendants: dict[int, frozenset[int]] = {}
+        self._responses: dict[int, dict] = {}
+        self._loaded_version: int | None = None
+        # отпечаток содержимого дерева - одинаковый во всех процессах с одинаковыми данными
+        self.digest = ""
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def __contains__(self, activity_id: int) -> bool:
+        return activity_id in self._nodes
+
+    def __iter__(self):
+        """id всех деятельностей по возрастанию"""
+        return iter(self._nodes)
+
+    @property
+    def is_stale(self) -> bool:
+        return (
+            self._loaded_version != self.version
+            or time.monotonic() - self._loaded_at > self.ttl_seconds
+        )
+
+    def invalidate(self) -> None:
+        """Помечает дерево устаревшим - следующий запрос перечитает его из БД"""
+        self.version += 1
+
+    # ---------- ЗАГРУЗКА ----------
+    async def ensure_fresh(self, session: AsyncSession) -> None:
+        if not self.is_stale:
+            return
+        async with self._lock:
+            # пока ждали блокировку, дерево мог перечитать другой запрос
+            if self.is_stale:
+                await self.load(session)
+
+    async def ensure_loaded(self, session: AsyncSession, activity_ids: Iterable[int]) -> None:
+        """Перечитывает дерево, если в нём нет какой-то из деятельностей"""
+        if any(activity_id not in self._nodes for activity_id in activity_ids):
+            self.invalidate()
+        await self.ensure_fresh(session)
+
+    async def load(self, session: AsyncSession) -> None:
+        version = self.version
+        res = await session.execute(
+            select(Activity.id, Activity.name, Activity.level, Activity.parent_id)
+            .order_by(Activity.id)
+            .execution_options(**{OPERATION_OPTION: "ActivityTree.load", BUDGET_EXEMPT_OPTION: True})
+        )
+
+        rows = res.all()
+        nodes = {
+            row.id: ActivityNode(row.id, row.name, row.level, row.parent_id)
+            for row in rows
+        }
+        for node in nodes.values():
+            if node.parent_id in nodes:
+                nodes[node.parent_id].children_ids.append(node.id)
+
+        descendants: dict[int, frozenset[int]] = {}
+        responses: dict[int, dict] = {}
+
+        def build(node: ActivityNode) -> None:
+            for child_id in node.children_ids:
+                build(nodes[child_id])
+
+            descendants[node.id] = frozenset(
+                [node.id, *(d for child_id in node.children_ids for d in descendants[child_id])]
+            )
+            # порядок ключей совпадает с ActivityResponse
+            responses[node.id] = {
+                "name": node.name,
+                "parent_id": node.parent_id,
+                "id": node.id,
+                "level": node.level,
+                "children": [responses[child_id] for child_id in node.children_ids],
+            }
+
+        for node in nodes.values():
+            if node.parent_id not in nodes:
+                build(node)
+
+        self._nodes = nodes
+        self._descendants = descendants
+        self._responses = responses
+        self.digest = hashlib.md5(repr([tuple(row) for row in rows]).encode()).hexdigest()
+        self._loaded_version = version
+        self._loaded_at = time.monotonic()
+
+    # ---------- ЧТЕНИЕ ----------
+    def get(self, activity_id: int) -> ActivityNode | None:
+        return self._nodes.get(activity_id)
+
+    def descendant_ids(self, activity_id: int) -> frozenset[int]:
+        """id деятельности и всех её потомков"""
+        return self._descendants.get(activity_id, frozenset([activity_id]))
+
+    def ancestor_ids(self, activity_id: int) -> list[int]:
+        """id деятельности и всех её предков, начиная с неё самой"""
+        result = []
+        node = self._nodes.get(activity_id)
+        while node is not None:
+            result.append(node.id)
+            node = self._nodes.get(node.parent_id)
+        return result
+
+    def as_response(self, activity_id: int) -> dict:
+        """Готовое представление ActivityResponse со всем поддеревом"""
+        return self._responses[activity_id]
+
+
+activity_tree = ActivityTree(ttl_seconds=settings.activity_tree.ttl_seconds)
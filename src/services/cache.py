@@ -0,0 +1,206 @@
+import hashlib
+import json
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Iterable
+
+from config import settings, CacheSettings
+
+
+class AbstractCacheBackend(ABC):
+    """
+    Хранилище закэшированных ответов. Каждая запись помечается тегами,
+    по которым её можно точечно сбросить при изменении данных.
+    Сброшенные теги hold_seconds не принимают новых записей: чтение с реплики,
+    отстающей от основной БД, не вернёт в кэш данные до изменения
+    """
+
+    @abstractmethod
+    async def get(self, key: str) -> Any | None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, tags: Iterable[str]) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def invalidate_tags(self, tags: Iterable[str]) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def clear(self) -> None:
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(AbstractCacheBackend):
+    """LRU-кэш в памяти процесса с ограничением по числу записей и TTL"""
+
+    def __init__(self, ttl_seconds: float, max_entries: int, hold_seconds: float = 0):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hold_seconds = hold_seconds
+        self._entries: OrderedDict[str, tuple[float, Any, frozenset[str]]] = OrderedDict()
+        self._tags: dict[str, set[str]] = {}
+        # тег -> до какого момента записи с ним не кэшируются
+        self._held: dict[str, float] = {}
+
+    def _discard(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    async def get(self, key: str) -> Any | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value, _ = entry
+        if expires_at < time.monotonic():
+            self._discard(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Any, tags: Iterable[str]) -> None:
+        self._discard(key)
+        tags = frozenset(tags)
+        if self._held:
+            now = time.monotonic()
+            if any(self._held.get(tag, 0) > now for tag in tags):
+                return
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value, tags)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+
+        # вытесняем самые давно использованные записи
+        while len(self._entries) > self.max_entries:
+            self._discard(next(iter(self._entries)))
+
+    async def invalidate_tags(self, tags: Iterable[str]) -> None:
+        tags = list(tags)
+        for tag in tags:
+            for key in list(self._tags.get(tag, ())):
+                self._discard(key)
+
+        if self.hold_seconds > 0:
+            now = time.monotonic()
+            self._held = {tag: until for tag, until in self._held.items() if until > now}
+            self._held.update((tag, now + self.hold_seconds) for tag in tags)
+
+    async def clear(self) -> None:
+        self._entries.clear()
+        self._tags.clear()
+        self._held.clear()
+
+
+class RedisCacheBackend(AbstractCacheBackend):
+    """
+    Кэш в Redis (или совместимом сервере), общий для всех процессов приложения.
+    Теги хранятся множествами ключей. Нужен пакет redis
+    """
+
+    def __init__(self, url: str, ttl_seconds: int, prefix: str = "secunda:cache", hold_seconds: float = 0):
+        try:
+            from redis import asyncio as redis_asyncio
+        except ImportError as exc:
+            raise RuntimeError("Для CACHE_BACKEND=redis установите пакет redis") from exc
+
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+        self.hold_seconds = hold_seconds
+        self._client = redis_asyncio.from_url(url)
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    def _tag_key(self, tag: str) -> str:
+        return f"{self.prefix}:tag:{tag}"
+
+    def _hold_key(self, tag: str) -> str:
+        return f"{self.prefix}:hold:{tag}"
+
+    async def get(self, key: str) -> Any | None:
+        raw = await self._client.get(self._key(key))
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: Any, tags: Iterable[str]) -> None:
+        tags = list(tags)
+        # метки сброса общие для всех процессов и живут hold_seconds
+        if self.hold_seconds > 0 and tags and await self._client.exists(*map(self._hold_key, tags)):
+            return
+        pipe = self._client.pipeline(transaction=False)
+        pipe.set(self._key(key), json.dumps(value, ensure_ascii=False), ex=self.ttl_seconds)
+        for tag in tags:
+            pipe.sadd(self._tag_key(tag), self._key(key))
+            pipe.expire(self._tag_key(tag), self.ttl_seconds)
+        await pipe.execute()
+
+    async def invalidate_tags(self, tags: Iterable[str]) -> None:
+        for tag in tags:
+            tag_key = self._tag_key(tag)
+            if self.hold_seconds > 0:
+                await self._client.set(self._hold_key(tag), 1, px=int(self.hold_seconds * 1000))
+            keys = await self._client.smembers(tag_key)
+            await self._client.delete(tag_key, *keys)
+
+    async def clear(self) -> None:
+        async for key in self._client.scan_iter(match=f"{self.prefix}:*"):
+            await self._client.delete(key)
+
+
+class ResponseCache:
+    """Кэш ответов сервиса с ключами по нормализованным параметрам запроса"""
+
+    def __init__(self, backend: AbstractCacheBackend):
+        self.backend = backend
+
+    @staticmethod
+    def make_key(kind: str, **params) -> str:
+        normalized = {}
+        for name, value in params.items():
+            if value is None:
+                continue
+            if isinstance(value, float) and value.is_integer():
+                # 55.0 и 55 - один и тот же запрос
+                value = int(value)
+            elif isinstance(value, str):
+                value = value.lower()
+            normalized[name] = value
+
+        payload = json.dumps(normalized, sort_keys=True, ensure_ascii=False, default=str)
+        return f"{kind}:{hashlib.sha1(payload.encode()).hexdigest()}"
+
+    async def get(self, key: str) -> Any | None:
+        return await self.backend.get(key)
+
+    async def set(self, key: str, value: Any, tags: Iterable[str]) -> None:
+        await self.backend.set(key, value, tags)
+
+    async def invalidate(self, tags: Iterable[str]) -> None:
+        await self.backend.invalidate_tags(tags)
+
+    async def clear(self) -> None:
+        await self.backend.clear()
+
+
+def create_response_cache(cache_settings: CacheSettings, hold_seconds: float = 0) -> ResponseCache | None:
+    if cache_settings.backend == "none":
+        return None
+    if cache_settings.backend == "redis":
+        return ResponseCache(RedisCacheBackend(
+            cache_settings.redis_url, cache_settings.ttl_seconds, hold_seconds=hold_seconds,
+        ))
+    return ResponseCache(MemoryCacheBackend(cache_settings.ttl_seconds, cache_settings.max_entries, hold_seconds))
+
+
+# с репликой запись, сбросившая кэш, видна при чтении не сразу
+response_cache = create_response_cache(
+    settings.cache,
+    settings.db.replica_lag_seconds if settings.db.replica_host else 0,
+)
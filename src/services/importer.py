@@ -0,0 +1,298 @@
+import codecs
+import csv
+import json
+from typing import AsyncIterable, AsyncIterator
+
+from pydantic import ValidationError
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.database import use_primary
+from repositories.building import BuildingRepository
+from repositories.organization import OrganizationRepository
+from schemas.organization import (
+    ImportBatchReport,
+    ImportRecordError,
+    ImportReport,
+    OrganizationImportRecord,
+)
+from services.activity_tree import ActivityTree
+from services.cache import ResponseCache
+from services.spatial_index import BuildingSpatialIndex
+
+# (номер строки, данные записи, ошибка разбора)
+ParsedRecord = tuple[int, dict | None, str | None]
+
+# Колонки CSV. Списки телефонов и деятельностей разделяются ";",
+# пустая колонка activity_ids оставляет деятельности без изменений
+CSV_COLUMNS = [
+    "id", "name", "phone_numbers", "building_id",
+    "building_address", "latitude", "longitude", "activity_ids",
+]
+
+
+# asyncpg передаёт в одном запросе не больше 32767 параметров. Самый широкий многострочный INSERT
+# пакета - организации с id: id, name, building_id, phone_numbers на строку и номер версии на весь запрос
+MAX_QUERY_PARAMS = 32767
+MAX_BATCH_SIZE = (MAX_QUERY_PARAMS - 1) // 4
+
+# строка, которую не удалось декодировать, - разбор пропускает её с ошибкой, а не прерывает импорт
+Line = str | UnicodeDecodeError
+
+
+# ---------- РАЗБОР ВХОДНЫХ ДАННЫХ ----------
+def decode_line(line: bytes) -> Line:
+    try:
+        return line.removeprefix(codecs.BOM_UTF8).decode("utf-8").rstrip("\r")
+    except UnicodeDecodeError as exc:
+        return exc
+
+
+async def iter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[Line]:
+    """Разбивает поток байт на строки, не читая его целиком в память"""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield decode_line(line)
+    if buffer:
+        yield decode_line(buffer)
+
+
+def _decode_error(exc: UnicodeDecodeError) -> str:
+    return f"Строка не в кодировке UTF-8: байт 0x{exc.object[exc.start]:02x} в позиции {exc.start}"
+
+
+async def parse_ndjson(lines: AsyncIterable[Line]) -> AsyncIterator[ParsedRecord]:
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        if isinstance(line, UnicodeDecodeError):
+            yield line_number, None, _decode_error(line)
+            continue
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError as exc:
+            yield line_number, None, f"Некорректный JSON: {exc}"
+            continue
+        if not isinstance(data, dict):
+            yield line_number, None, "Строка должна быть JSON-объектом"
+            continue
+        yield line_number, data, None
+
+
+def _split(value: str) -> list[str]:
+    return [item.strip() for item in value.split(";") if item.strip()]
+
+
+async def parse_csv(lines: AsyncIterable[Line]) -> AsyncIterator[ParsedRecord]:
+    """CSV с заголовком из CSV_COLUMNS; значения с переводом строки не поддерживаются"""
+    header = None
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        if isinstance(line, UnicodeDecodeError):
+            yield line_number, None, _decode_error(line)
+            # без заголовка остальные строки не разобрать
+            if header is None:
+                return
+            continue
+        if not line.strip():
+            continue
+        values = next(csv.reader([line]))
+        if header is None:
+            header = [column.strip() for column in values]
+            unknown = set(header) - set(CSV_COLUMNS)
+            if unknown:
+                yield line_number, None, f"Неизвестные колонки: {', '.join(sorted(unknown))}"
+                return
+            continue
+
+        row = dict(zip(header, values))
+        data: dict = {
+            "name": row.get("name", ""),
+            "phone_numbers": _split(row.get("phone_numbers", "")),
+        }
+        if row.get("id"):
+            data["id"] = row["id"]
+        if row.get("building_id"):
+            data["building_id"] = row["building_id"]
+        if row.get("building_address"):
+            data["building"] = {
+                "address": row["building_address"],
+                "latitude": row.get("latitude"),
+                "longitude": row.get("longitude"),
+            }
+        if row.get("activity_ids"):
+            data["activity_ids"] = _split(row["activity_ids"])
+        yield line_number, data, None
+
+
+# ---------- ИМПОРТ ----------
+class OrganizationImporter:
+    """
+    Пакетный импорт организаций. Записи делятся на пакеты по batch_size,
+    каждый пакет пишется несколькими многострочными INSERT ... ON CONFLICT
+    в одной транзакции. Ошибочные записи пропускаются и попадают в отчёт,
+    ошибка БД откатывает только свой пакет.
+    batch_size - от 1 до MAX_BATCH_SIZE: больший пакет не уложится в один запрос
+    """
+
+    def __init__(
+            self,
+            session: AsyncSession,
+            repository: OrganizationRepository,
+            building_repository: BuildingRepository,
+            activity_tree: ActivityTree,
+            building_index: BuildingSpatialIndex,
+            cache: ResponseCache | None,
+            batch_size: int,
+    ):
+        self.session = session
+        self.repository = repository
+        self.building_repository = building_repository
+        self.activity_tree = activity_tree
+        self.building_index = building_index
+        self.cache = cache
+        if not 1 <= batch_size <= MAX_BATCH_SIZE:
+            raise ValueError(f"batch_size должен быть от 1 до {MAX_BATCH_SIZE}")
+        self.batch_size = batch_size
+
+    async def run(self, records: AsyncIterable[ParsedRecord]) -> ImportReport:
+        report = ImportReport()
+        batch: list[ParsedRecord] = []
+        # проверки ссылок не должны видеть отставание реплики
+        use_primary(self.session)
+
+        async def flush():
+            batch_report = await self._import_batch(len(report.batches) + 1, batch)
+            report.batches.append(batch_report)
+            report.inserted += batch_report.inserted
+            report.updated += batch_report.updated
+            report.failed += batch_report.failed
+
+        async for record in records:
+            batch.append(record)
+            if len(batch) >= self.batch_size:
+                await flush()
+                batch = []
+        if batch:
+            await flush()
+
+        # после массовой записи точечная инвалидация не окупается
+        if self.cache is not None and (report.inserted or report.updated):
+            await self.cache.clear()
+        return report
+
+    async def _import_batch(self, number: int, items: list[ParsedRecord]) -> ImportBatchReport:
+        report = ImportBatchReport(batch=number)
+
+        records: list[tuple[int, OrganizationImportRecord]] = []
+        for line, data, error in items:
+            if error is not None:
+                report.errors.append(ImportRecordError(line=line, error=error))
+                continue
+            try:
+                records.append((line, OrganizationImportRecord.model_validate(data)))
+            except ValidationError as exc:
+                message = "; ".join(
+                    f"{'.'.join(str(part) for part in e['loc']) or 'record'}: {e['msg']}"
+                    for e in exc.errors()
+                )
+                report.errors.append(ImportRecordError(line=line, error=message))
+
+        try:
+            records = await self._check_references(records, report)
+            buildings = await self._write(records, report) if records else []
+            await self.session.commit()
+        except SQLAlchemyError as exc:
+            await self.session.rollback()
+            report.inserted = report.updated = 0
+            report.errors.append(ImportRecordError(error=f"Пакет не записан: {exc}"))
+            report.failed = len(items)
+            return report
+
+        # в индексе только изменившиеся координаты
+        if self.building_index.is_ready:
+            for building in buildings:
+                self.building_index.upsert(building.id, building.latitude, building.longitude)
+
+        report.errors.sort(key=lambda e: e.line or 0)
+        report.failed = len(report.errors)
+        return report
+
+    async def _check_references(
+            self,
+            records: list[tuple[int, OrganizationImportRecord]],
+            report: ImportBatchReport,
+    ) -> list[tuple[int, OrganizationImportRecord]]:
+        """Отбрасывает записи со ссылками на несуществующие здания, организации и деятельности"""
+        await self.activity_tree.ensure_loaded(
+            self.session, {a for _, r in records for a in r.activity_ids or ()}
+        )
+
+        building_ids = await self.building_repository.find_existing_ids(
+            self.session, list({r.building_id for _, r in records if r.building_id is not None})
+        )
+        organization_ids = await self.repository.find_existing_ids(
+            self.session, list({r.id for _, r in records if r.id is not None})
+        )
+
+        valid = []
+        seen_ids = set()
+        for line, record in records:
+            if record.building_id is not None and record.building_id not in building_ids:
+                error = f"Здание {record.building_id} не найдено"
+            elif record.id is not None and record.id not in organization_ids:
+                error = f"Организация {record.id} не найдена"
+            elif record.id is not None and record.id in seen_ids:
+                error = f"Организация {record.id} повторяется в пакете"
+            elif record.activity_ids and any(a not in self.activity_tree for a in record.activity_ids):
+                missing = [a for a in record.activity_ids if a not in self.activity_tree]
+                error = f"Деятельности не найдены: {', '.join(map(str, missing))}"
+            else:
+                valid.append((line, record))
+                if record.id is not None:
+                    seen_ids.add(record.id)
+                continue
+            report.errors.append(ImportRecordError(line=line, error=error))
+        return valid
+
+    async def _write(
+            self,
+            records: list[tuple[int, OrganizationImportRecord]],
+            report: ImportBatchReport,
+    ) -> list:
+        # здания по адресу - последняя запись с тем же адресом побеждает
+        buildings = {
+            record.building.address: record.building.model_dump()
+            for _, record in records
+            if record.building is not None
+        }
+        changed, unchanged = await self.building_repository.upsert_many(self.session, list(buildings.values()))
+        address_ids = {row.address: row.id for row in (*changed, *unchanged)}
+        # новые координаты здания меняют ответ всех его организаций; здания без изменений их не трогают
+        await self.repository.touch_buildings(self.session, [row.id for row in changed])
+
+        results = await self.repository.upsert_many(self.session, [
+            {
+                "id": record.id,
+                "name": record.name,
+                "building_id": record.building_id or address_ids[record.building.address],
+                "phone_numbers": record.phone_numbers,
+            }
+            for _, record in records
+        ])
+
+        await self.repository.replace_activities(self.session, {
+            organization_id: record.activity_ids
+            for (organization_id, _), (_, record) in zip(results, records)
+            if record.activity_ids is not None
+        })
+
+        report.inserted = sum(1 for _, inserted in results if inserted)
+        report.updated = len(results) - report.inserted
+        return changed
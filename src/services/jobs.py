@@ -0,0 +1,207 @@
+import asyncio
+import bisect
+import logging
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable
+
+from config import settings, JobsSettings
+from exceptions import JobQueueFull
+from metrics import CallbackMetric, Counter, registry
+
+logger = logging.getLogger(__name__)
+
+# выполняет задачу по виду и параметрам, возвращает организации по возрастанию id
+JobRunner = Callable[[str, dict], Awaitable[list[dict]]]
+
+jobs_finished = registry.register(Counter(
+    "jobs_finished_total", "Background jobs finished", ("kind", "status"),
+))
+
+
+class Job:
+    """
+    Фоновая задача. Результат - организации по возрастанию id,
+    отдаются страницами по курсору after_id
+    """
+    __slots__ = ("id", "kind", "params", "status", "created_at", "finished_at", "error", "result", "_ids")
+
+    def __init__(self, kind: str, params: dict):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.status = "pending"  # pending -> running -> done | failed
+        self.created_at = datetime.now(timezone.utc)
+        self.finished_at: datetime | None = None
+        self.error: str | None = None
+        self.result: list[dict] | None = None
+        self._ids: list[int] = []
+
+    def finish(self, result: list[dict]) -> None:
+        self.result = result
+        self._ids = [organization["id"] for organization in result]
+        self.status = "done"
+        self.finished_at = datetime.now(timezone.utc)
+
+    def fail(self, error: str) -> None:
+        self.error = error
+        self.status = "failed"
+        self.finished_at = datetime.now(timezone.utc)
+
+    def page(self, after_id: int | None = None, limit: int | None = None) -> list[dict]:
+        if self.result is None:
+            return []
+        start = bisect.bisect_right(self._ids, after_id) if after_id is not None else 0
+        end = start + limit if limit is not None else None
+        return self.result[start:end]
+
+    def to_dict(self, after_id: int | None = None, limit: int | None = None) -> dict:
+        """Представление OrganizationJobResponse со страницей результата"""
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "error": self.error,
+            "total": len(self.result) if self.result is not None else None,
+            "organizations": self.page(after_id, limit),
+        }
+
+
+class AbstractJobBackend(ABC):
+    """
+    Очередь фоновых задач и хранилище их результатов. Задача описывается
+    видом и параметрами (JSON), а выполняет её runner, переданный в start()
+    """
+
+    @abstractmethod
+    async def start(self, runner: JobRunner) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def stop(self) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def submit(self, kind: str, params: dict) -> Job:
+        """Ставит задачу в очередь, при переполнении - JobQueueFull"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get(self, job_id: str) -> Job | None:
+        raise NotImplementedError
+
+
+class InMemoryJobBackend(AbstractJobBackend):
+    """
+    Очередь в памяти процесса: ограниченная asyncio.Queue и workers обработчиков.
+    Одновременно выполняется не больше workers задач - столько соединений пула
+    они и занимают. Результаты хранятся result_ttl_seconds, не больше max_jobs задач.
+    Задачу можно забрать только из того процесса, который её принял
+    """
+
+    def __init__(self, workers: int, queue_size: int, result_ttl_seconds: float, max_jobs: int):
+        self.workers = workers
+        self.result_ttl_seconds = result_ttl_seconds
+        self.max_jobs = max_jobs
+        self.running = 0
+
+        self._queue: asyncio.Queue[Job] = asyncio.Queue(maxsize=queue_size)
+        self._jobs: OrderedDict[str, tuple[float, Job]] = OrderedDict()
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def queued(self) -> int:
+        return self._queue.qsize()
+
+    async def start(self, runner: JobRunner) -> None:
+        self._tasks = [asyncio.create_task(self._work(runner)) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _evict(self) -> None:
+        """Убирает устаревшие результаты и освобождает место для новой задачи"""
+        now = time.monotonic()
+        excess = len(self._jobs) + 1 - self.max_jobs
+        # незавершённые задачи не вытесняются - иначе их результат некуда будет положить.
+        # Завершённые переносятся в конец, поэтому идут по времени завершения, самые старые первыми
+        finished = [
+            (job_id, expires_at)
+            for job_id, (expires_at, job) in self._jobs.items()
+            if job.status in ("done", "failed")
+        ]
+        for job_id, expires_at in finished:
+            if expires_at <= now or excess > 0:
+                del self._jobs[job_id]
+                excess -= 1
+
+    async def submit(self, kind: str, params: dict) -> Job:
+        job = Job(kind, params)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise JobQueueFull(f"В очереди уже {self._queue.qsize()} задач")
+        self._evict()
+        self._jobs[job.id] = (time.monotonic() + self.result_ttl_seconds, job)
+        return job
+
+    async def get(self, job_id: str) -> Job | None:
+        entry = self._jobs.get(job_id)
+        if entry is None:
+            return None
+        expires_at, job = entry
+        if expires_at < time.monotonic() and job.status in ("done", "failed"):
+            del self._jobs[job_id]
+            return None
+        return job
+
+    async def _work(self, runner: JobRunner) -> None:
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            self.running += 1
+            try:
+                job.finish(await runner(job.kind, job.params))
+            except asyncio.CancelledError:
+                job.fail("Задача прервана остановкой приложения")
+                raise
+            except Exception as exc:
+                logger.exception("Job %s (%s) failed", job.id, job.kind)
+                job.fail(str(exc) or type(exc).__name__)
+            finally:
+                self.running -= 1
+                jobs_finished.inc(kind=job.kind, status=job.status)
+                # срок хранения результата отсчитывается от завершения
+                if job.id in self._jobs:
+                    self._jobs[job.id] = (time.monotonic() + self.result_ttl_seconds, job)
+                    self._jobs.move_to_end(job.id)
+                self._queue.task_done()
+
+
+def create_job_backend(jobs_settings: JobsSettings) -> AbstractJobBackend:
+    return InMemoryJobBackend(
+        jobs_settings.workers,
+        jobs_settings.queue_size,
+        jobs_settings.result_ttl_seconds,
+        jobs_settings.max_jobs,
+    )
+
+
+job_backend = create_job_backend(settings.jobs)
+
+
+def _queue_state() -> list[tuple[tuple[str, ...], Any]]:
+    if not isinstance(job_backend, InMemoryJobBackend):
+        return []
+    return [(("queued",), job_backend.queued), (("running",), job_backend.running)]
+
+
+registry.register(CallbackMetric("jobs", "Background jobs by state", "gauge", ("state",), _queue_state))
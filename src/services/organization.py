@@ -1,10 +1,31 @@
-from typing import Union, List
+import hashlib
+import math
+from datetime import datetime
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Union, List, Sequence
 
-from db.models import Organization
+from db.models import Organization, OrganizationDocument
 from repositories.base import SQLAlchemyRepository
 from repositories.organization import OrganizationRepository
+from repositories.organization_document import OrganizationDocumentRepository
 from repositories.activity import ActivityRepository
+from repositories.loaders import Loaders
+from services.activity_tree import ActivityTree
+from services.cache import ResponseCache
+from services.serializers import document_to_dict, organization_to_dict
+from services.spatial_index import BuildingSpatialIndex
+from sqlalchemy import Select
 from sqlalchemy.ext.asyncio import AsyncSession
+from config import settings
+from exceptions import JobResultTooLarge
+
+# сколько раз расширять круг поиска по индексу, прежде чем отсортировать всё в БД
+NEAREST_INDEX_ATTEMPTS = 3
+
+# ETag и Last-Modified ответа
+Validators = tuple[str, datetime | None]
+# проверка условного запроса: True, если у клиента актуальная версия (api.conditional.revalidator)
+IsCurrent = Callable[[Validators], bool]
+
 
 class OrganizationService:
 
@@ -12,66 +33,556 @@ class OrganizationService:
             self,
             repository: Union[SQLAlchemyRepository, OrganizationRepository],
             activity_repository: Union[SQLAlchemyRepository, ActivityRepository],
-            session: AsyncSession
+            session: AsyncSession,
+            building_index: BuildingSpatialIndex,
+            activity_tree: ActivityTree,
+            cache: ResponseCache | None = None,
+            loaders: Loaders | None = None,
+            documents: OrganizationDocumentRepository | None = None,
     ):
         self.repository = repository
+        self.documents = documents
+        # чтение идёт из organization_documents, если она включена (APP_READ_MODEL=documents),
+        # запись - всегда через repository
+        self.reader = documents if documents is not None else repository
         self.session = session
         self.activity_repository = activity_repository
+        self.building_index = building_index
+        self.activity_tree = activity_tree
+        self.cache = cache
+        self.loaders = loaders or Loaders(session)
+
+    async def _serialize(self, organizations: Sequence[Organization | OrganizationDocument]) -> List[dict]:
+        """
+        Организации в представлении OrganizationResponse: здания и связи с деятельностями
+        догружаются загрузчиками запроса, сами деятельности - из кэша дерева.
+        Документы из organization_documents уже содержат всё, кроме деятельностей
+        """
+        if self.documents is not None:
+            await self.activity_tree.ensure_loaded(
+                self.session, {a for document in organizations for a in document.activity_ids}
+            )
+            return [document_to_dict(document.document, self.activity_tree) for document in organizations]
+
+        buildings = await self.loaders.buildings.load_many(
+            organization.building_id for organization in organizations
+        )
+        activity_ids = await self.loaders.activity_ids.load_many(
+            organization.id for organization in organizations
+        )
+        await self.activity_tree.ensure_loaded(self.session, {a for ids in activity_ids for a in ids})
+        return [
+            organization_to_dict(organization, building, ids, self.activity_tree)
+            for organization, building, ids in zip(organizations, buildings, activity_ids)
+        ]
+
+    # ---------- КЭШ ----------
+    async def _cached(
+        self,
+        key: str,
+        tags: Iterable[str],
+        load: Callable[[], Awaitable[List[dict] | dict]],
+    ) -> List[dict] | dict:
+        """
+        Ответ из кэша или из БД. Запись помечается тегами запроса и тегами
+        org:{id} всех попавших в неё организаций
+        """
+        if self.cache is None:
+            return await load()
+
+        cached = await self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        result = await load()
+        await self.cache.set(key, result, self._tags(result, tags))
+        return result
+
+    @staticmethod
+    def _tags(result: List[dict] | dict, tags: Iterable[str]) -> list[str]:
+        organizations = result if isinstance(result, list) else [result]
+        # у агрегатов (get_stats) нет id - они сбрасываются только по своим тегам
+        return [*tags, *(f"org:{organization['id']}" for organization in organizations if "id" in organization)]
+
+    async def _invalidate(
+        self,
+        organization_id: int,
+        building_id: int | None = None,
+        activity_ids: Iterable[int] = (),
+    ) -> None:
+        """
+        Сбрасывает записи, которые могли измениться вместе с организацией:
+        содержащие её, а также списки, в которые она могла попасть
+        """
+        if self.cache is None:
+            return
+
+        tags = {f"org:{organization_id}", "all", "name", "geo"}
+        if building_id is not None:
+            tags.add(f"building:{building_id}")
+        # поиск по деятельности с поддеревом затрагивает всех предков
+        for activity_id in activity_ids:
+            tags.update(f"activity:{ancestor_id}" for ancestor_id in self.activity_tree.ancestor_ids(activity_id))
+            tags.add(f"activity:{activity_id}")
+        await self.cache.invalidate(tags)
+
+    # ---------- ВЕРСИИ (ETag) ----------
+    async def _validators(
+        self,
+        organizations: Sequence[Organization | OrganizationDocument],
+    ) -> Validators:
+        """
+        ETag и время последнего изменения страницы по версиям её организаций.
+        Организации из таблиц несут версию сами, для документов она дочитывается
+        по первичному ключу
+        """
+        if self.documents is None:
+            rows = [(o.id, o.version, o.updated_at) for o in organizations]
+        else:
+            rows = await self.repository.versions_by_ids(self.session, [o.id for o in organizations])
+        return await self._digest(rows)
+
+    async def _page_versions(self, stmt: Select, after_id: int | None, limit: int | None) -> Validators:
+        """Валидаторы страницы одним лёгким запросом по organizations, без зданий и деятельностей"""
+        return await self._digest(
+            await self.repository.versions(self.session, self.repository.paginate(stmt, after_id, limit))
+        )
+
+    async def _digest(self, rows: Sequence[tuple[int, int, datetime]]) -> Validators:
+        """
+        ETag по (id, version) организаций. В него входит и отпечаток дерева деятельностей:
+        их поддеревья тоже часть ответа
+        """
+        await self.activity_tree.ensure_fresh(self.session)
+        digest = hashlib.md5(self.activity_tree.digest.encode())
+        for organization_id, version, _ in sorted(rows):
+            digest.update(b"%d:%d," % (organization_id, version))
+        last_modified = max((updated_at for _, _, updated_at in rows), default=None)
+        return f'"{digest.hexdigest()}"', last_modified
+
+    async def _cached_page(
+        self,
+        key: str,
+        tags: Iterable[str],
+        load: Callable[[], Awaitable[Sequence[Organization | OrganizationDocument]]],
+        versions: Callable[[], Awaitable[Validators | None]],
+        is_current: IsCurrent | None = None,
+        single: bool = False,
+    ) -> tuple[List[dict] | dict | None, Validators]:
+        """
+        Как _cached, но вместе с ответом хранит его ETag и Last-Modified под теми же тегами:
+        условный запрос к закэшированной странице не обращается к БД.
+        На промахе условный запрос сначала сверяется с валидаторами из versions (None - ресурса
+        нет) и при совпадении получает (None, валидаторы) без загрузки и сериализации страницы.
+        Безусловный запрос валидаторы не проверяет - они считаются по уже загруженным
+        организациям, без второй выборки
+        :param single: ответ - одна организация, а не список
+        """
+        if self.cache is not None:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                last_modified = cached["last_modified"]
+                return cached["result"], (
+                    cached["etag"], datetime.fromisoformat(last_modified) if last_modified else None
+                )
+
+        if is_current is not None:
+            validators = await versions()
+            if validators is not None and is_current(validators):
+                return None, validators
+
+        # валидаторы пересчитываются по загруженному - страница могла измениться после versions
+        organizations = await load()
+        validators = await self._validators(organizations)
+        result = await self._serialize(organizations)
+        if single:
+            result = result[0]
 
-    async def get_organizations(self, filters):
+        if self.cache is not None:
+            etag, last_modified = validators
+            await self.cache.set(
+                key,
+                {
+                    "result": result,
+                    "etag": etag,
+                    "last_modified": last_modified.isoformat() if last_modified else None,
+                },
+                self._tags(result, tags),
+            )
+        return result, validators
+
+    async def _stream(self, stmt: Select) -> AsyncIterator[dict]:
+        async for organizations in self.reader.stream(
+            self.session,
+            stmt,
+            settings.stream_batch_size,
+        ):
+            for organization in await self._serialize(organizations):
+                yield organization
+            # в потоке загруженное не переиспользуется - не копим его в памяти
+            self.loaders.clear()
+
+    # ---------- ПО ФИЛЬТРАМ ----------
+    async def _organizations_stmt(self, filters: dict, source=None) -> Select:
+        source = source or self.reader
         include_subactivities = filters.pop("include_subactivities", False)
         # обычный поиск
         if not include_subactivities or "activity_id" not in filters:
-            return await self.repository.find_all(self.session, filters)
-        # 🔥 поиск по поддереву
+            return source.filtered_stmt(filters)
+        # 🔥 поиск по поддереву - потомки берутся из кэша дерева деятельностей
         activity_id = filters.pop("activity_id")
-        activity_ids = await self.activity_repository.get_activity_subtree_ids(
-            self.session,
-            activity_id,
-        )
-        return await self.repository.find_by_activity_ids(
-            self.session,
-            activity_ids,
+        await self.activity_tree.ensure_fresh(self.session)
+        return source.by_activity_ids_stmt(
+            list(self.activity_tree.descendant_ids(activity_id))
         )
 
-    async def get_organization(self, organization_id: int) -> Organization:
-        return await self.repository.get_by_id(self.session, organization_id)
+    async def _organizations_query(
+        self,
+        filters: dict,
+        after_id: int | None,
+        limit: int | None,
+    ) -> tuple[Select, dict]:
+        """Страница по фильтрам из кэша готовых выражений, поиск по поддереву - как обычно"""
+        if filters.get("include_subactivities") and "activity_id" in filters:
+            stmt = await self._organizations_stmt(dict(filters))
+            return self.reader.paginate(stmt, after_id, limit), {}
+        filters = {key: value for key, value in filters.items() if key != "include_subactivities"}
+        return self.reader.filtered_query(filters, after_id, limit)
+
+    async def get_organizations(
+        self,
+        filters: dict,
+        after_id: int | None = None,
+        limit: int | None = None,
+        is_current: IsCurrent | None = None,
+    ) -> tuple[List[dict] | None, Validators]:
+        """
+        Страница организаций по фильтрам и её валидаторы (ETag, Last-Modified).
+        Вместо страницы None, если is_current подтвердил версию клиента
+        """
+        key = ResponseCache.make_key("organizations", after_id=after_id, limit=limit, **filters)
+        if "building_id" in filters:
+            tags = [f"building:{filters['building_id']}"]
+        elif "activity_id" in filters:
+            tags = [f"activity:{filters['activity_id']}"]
+        elif "name" in filters:
+            tags = ["name"]
+        else:
+            tags = ["all"]
+
+        async def load():
+            stmt, params = await self._organizations_query(filters, after_id, limit)
+            return await self.reader.fetch(self.session, stmt, params)
+
+        async def versions():
+            return await self._page_versions(
+                await self._organizations_stmt(dict(filters), self.repository), after_id, limit
+            )
+
+        return await self._cached_page(key, tags, load, versions, is_current)
 
+    async def stream_organizations(self, filters: dict) -> AsyncIterator[dict]:
+        async for organization in self._stream(await self._organizations_stmt(filters)):
+            yield organization
+
+    async def get_organization(
+        self,
+        organization_id: int,
+        is_current: IsCurrent | None = None,
+    ) -> tuple[dict | None, Validators]:
+        async def load():
+            return [await self.reader.get_by_id(self.session, organization_id)]
+
+        async def versions():
+            rows = await self.repository.versions_by_ids(self.session, [organization_id])
+            # несуществующей организации не отвечаем 304 даже на If-None-Match: *
+            return await self._digest(rows) if rows else None
+
+        return await self._cached_page(
+            ResponseCache.make_key("organization", id=organization_id), (), load, versions, is_current, single=True
+        )
+
+    async def get_organizations_by_ids(self, organization_ids: List[int]) -> dict:
+        """Организации в порядке запроса и id, которых нет в БД"""
+        ids = list(dict.fromkeys(organization_ids))
+        organizations = await self.reader.get_many(self.session, ids)
+        by_id = {organization["id"]: organization for organization in await self._serialize(organizations)}
+        return {
+            "organizations": [by_id[i] for i in ids if i in by_id],
+            "missing_ids": [i for i in ids if i not in by_id],
+        }
 
     async def create_organization(self, organization_data: dict) -> Organization:
 
         activity_ids = organization_data.pop("activity_ids")
 
-        return await self.repository.add_one(self.session, organization_data)
+        # организация и её деятельности пишутся одной транзакцией
+        organization = await self.repository.add_one(self.session, organization_data, commit=False)
+        await self.repository.replace_activities(self.session, {organization.id: activity_ids})
+        await self.session.commit()
+
+        await self._invalidate(organization.id, organization.building_id, activity_ids)
+        return organization
 
     async def update_organization(self, organization_data: dict) -> Organization:
-        return await self.repository.change_one(self.session, organization_data)
+        organization_id = organization_data["id"]
+        activity_ids = organization_data.pop("activity_ids", None)
+
+        if len(organization_data) > 1:
+            organization = await self.repository.change_one(self.session, organization_data, commit=False)
+        else:
+            organization = await self.repository.get_by_id(self.session, organization_id)
+        if activity_ids is not None:
+            await self.repository.replace_activities(self.session, {organization_id: activity_ids})
+        await self.session.commit()
+
+        await self._invalidate(organization_id, organization_data.get("building_id"), activity_ids or ())
+        return organization
+
+    # ---------- СТАТИСТИКА ----------
+    async def get_stats(
+        self,
+        bbox: tuple[float, float, float, float] | None = None,
+        buildings_limit: int | None = None,
+    ) -> dict:
+        """
+        Число организаций всего, по деятельностям (свои и с поддеревом) и по зданиям,
+        при заданном bbox - только в нём. Всё считается агрегатами в БД, поддеревья
+        берутся из дерева деятельностей
+        """
+        key = ResponseCache.make_key("stats", bbox=bbox, buildings_limit=buildings_limit)
+
+        async def load():
+            await self.activity_tree.ensure_fresh(self.session)
+            by_activity = await self.repository.count_by_activity(
+                self.session,
+                {activity_id: self.activity_tree.descendant_ids(activity_id) for activity_id in self.activity_tree},
+                bbox,
+            )
+            by_building = await self.repository.count_by_building(self.session, bbox, buildings_limit)
+            return {
+                "total": await self.repository.count(self.session, bbox),
+                "activities": [
+                    {"activity_id": activity_id, "count": direct, "subtree_count": subtree}
+                    for activity_id, (direct, subtree) in sorted(by_activity.items())
+                ],
+                "buildings": [
+                    {"building_id": building_id, "count": count} for building_id, count in by_building
+                ],
+            }
+
+        # любая запись организации сбрасывает тег all
+        return await self._cached(key, ["all"], load)
+
+    # ---------- В РАДИУСЕ ----------
+    def _within_radius_stmt(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_km: float,
+        source=None,
+    ) -> Select | None:
+        """None - индекс не нашёл в круге ни одного здания, запрос к БД не нужен"""
+        source = source or self.reader
+        # индекс в памяти отдаёт id зданий, из БД берём только их организации
+        if self.building_index.is_ready:
+            ids = self.building_index.within_radius(latitude, longitude, radius_km)
+            return source.by_building_ids_stmt(ids) if ids else None
+        return source.within_radius_stmt(latitude, longitude, radius_km)
 
     async def get_organizations_within_radius(
         self,
         latitude: float,
         longitude: float,
         radius_km: float,
-    ):
-        return await self.repository.find_within_radius(
-            self.session,
-            latitude,
-            longitude,
-            radius_km,
+        after_id: int | None = None,
+        limit: int | None = None,
+        is_current: IsCurrent | None = None,
+    ) -> tuple[List[dict] | None, Validators]:
+        key = ResponseCache.make_key(
+            "within_radius",
+            latitude=latitude,
+            longitude=longitude,
+            radius_km=radius_km,
+            after_id=after_id,
+            limit=limit,
         )
 
+        async def load():
+            if self.building_index.is_ready:
+                ids = self.building_index.within_radius(latitude, longitude, radius_km)
+                if not ids:
+                    return []
+                stmt, params = self.reader.by_building_ids_query(ids, after_id, limit)
+            else:
+                stmt, params = self.reader.within_radius_query(latitude, longitude, radius_km, after_id, limit)
+            return await self.reader.fetch(self.session, stmt, params)
+
+        async def versions():
+            stmt = self._within_radius_stmt(latitude, longitude, radius_km, self.repository)
+            if stmt is None:
+                return await self._digest([])
+            return await self._page_versions(stmt, after_id, limit)
+
+        return await self._cached_page(key, ["geo"], load, versions, is_current)
+
+    async def stream_organizations_within_radius(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_km: float,
+    ) -> AsyncIterator[dict]:
+        stmt = self._within_radius_stmt(latitude, longitude, radius_km)
+        if stmt is None:
+            return
+        async for organization in self._stream(stmt):
+            yield organization
+
+    # ---------- БЛИЖАЙШИЕ ----------
+    async def _nearest_from_index(
+        self,
+        latitude: float,
+        longitude: float,
+        k: int,
+    ) -> List[tuple[Organization, float]]:
+        """
+        Ближайшие здания берутся из индекса, организации - только для новых зданий
+        каждого шага. Если у want ближайших зданий набралось k организаций, остальные
+        здания не ближе, поэтому первые k по расстоянию - ответ
+        """
+        distances: dict[int, float] = {}
+        organizations: List[Organization] = []
+        want = k
+        for _ in range(NEAREST_INDEX_ATTEMPTS):
+            nearest = self.building_index.nearest(latitude, longitude, want)
+            new_ids = [building_id for building_id, _ in nearest if building_id not in distances]
+            distances.update(nearest)
+            if new_ids:
+                organizations.extend(await self.reader.fetch(
+                    self.session, self.reader.by_building_ids_stmt(new_ids)
+                ))
+
+            # набрали k или зданий больше нет
+            if len(organizations) >= k or len(nearest) < want:
+                ranked = sorted(organizations, key=lambda o: (distances[o.building_id], o.id))[:k]
+                return [(organization, distances[organization.building_id]) for organization in ranked]
+
+            # сколько зданий нужно при текущей плотности организаций на здание, с запасом
+            density = len(organizations) / len(distances)
+            want = max(want * 4, math.ceil(k / density * 1.5)) if density else want * 16
+
+        return await self.reader.find_nearest(self.session, latitude, longitude, k)
+
+    async def get_nearest_organizations(
+        self,
+        latitude: float,
+        longitude: float,
+        k: int,
+    ) -> List[dict]:
+        """k ближайших организаций по возрастанию расстояния, с полем distance_km"""
+        key = ResponseCache.make_key("nearest", latitude=latitude, longitude=longitude, k=k)
+
+        async def load():
+            if self.building_index.is_ready:
+                ranked = await self._nearest_from_index(latitude, longitude, k)
+            else:
+                ranked = await self.reader.find_nearest(self.session, latitude, longitude, k)
+
+            result = await self._serialize([organization for organization, _ in ranked])
+            for organization, (_, distance) in zip(result, ranked):
+                organization["distance_km"] = distance
+            return result
+
+        return await self._cached(key, ["geo"], load)
+
+    # ---------- В ПРЯМОУГОЛЬНИКЕ ----------
+    def _within_rectangle_stmt(
+        self,
+        min_lat: float,
+        max_lat: float,
+        min_lon: float,
+        max_lon: float,
+        source=None,
+    ) -> Select | None:
+        """None - индекс не нашёл в прямоугольнике ни одного здания, запрос к БД не нужен"""
+        source = source or self.reader
+        if self.building_index.is_ready:
+            ids = self.building_index.within_rectangle(min_lat, max_lat, min_lon, max_lon)
+            return source.by_building_ids_stmt(ids) if ids else None
+        return source.within_rectangle_stmt(min_lat, max_lat, min_lon, max_lon)
+
     async def get_organizations_within_rectangle(
         self,
         min_lat: float,
         max_lat: float,
         min_lon: float,
         max_lon: float,
-    ):
-        return await self.repository.find_within_rectangle(
-            self.session,
-            min_lat,
-            max_lat,
-            min_lon,
-            max_lon,
+        after_id: int | None = None,
+        limit: int | None = None,
+        is_current: IsCurrent | None = None,
+    ) -> tuple[List[dict] | None, Validators]:
+        key = ResponseCache.make_key(
+            "within_rectangle",
+            min_lat=min_lat,
+            max_lat=max_lat,
+            min_lon=min_lon,
+            max_lon=max_lon,
+            after_id=after_id,
+            limit=limit,
         )
 
+        async def load():
+            if self.building_index.is_ready:
+                ids = self.building_index.within_rectangle(min_lat, max_lat, min_lon, max_lon)
+                if not ids:
+                    return []
+                stmt, params = self.reader.by_building_ids_query(ids, after_id, limit)
+            else:
+                stmt, params = self.reader.within_rectangle_query(min_lat, max_lat, min_lon, max_lon, after_id, limit)
+            return await self.reader.fetch(self.session, stmt, params)
+
+        async def versions():
+            stmt = self._within_rectangle_stmt(min_lat, max_lat, min_lon, max_lon, self.repository)
+            if stmt is None:
+                return await self._digest([])
+            return await self._page_versions(stmt, after_id, limit)
+
+        return await self._cached_page(key, ["geo"], load, versions, is_current)
+
+    async def stream_organizations_within_rectangle(
+        self,
+        min_lat: float,
+        max_lat: float,
+        min_lon: float,
+        max_lon: float,
+    ) -> AsyncIterator[dict]:
+        stmt = self._within_rectangle_stmt(min_lat, max_lat, min_lon, max_lon)
+        if stmt is None:
+            return
+        async for organization in self._stream(stmt):
+            yield organization
+
+    # ---------- ФОНОВЫЕ ЗАДАЧИ ----------
+    async def run_job(self, kind: str, params: dict, max_rows: int | None = None) -> List[dict]:
+        """
+        Выполняет гео-поиск из очереди задач (services.jobs) целиком, без пагинации.
+        Результат хранится в задаче и отдаётся страницами, поэтому в кэш ответов не пишется.
+        Больше max_rows организаций - JobResultTooLarge: такой результат не держится в памяти
+        """
+        if kind == "within_radius":
+            stmt = self._within_radius_stmt(params["latitude"], params["longitude"], params["radius_km"])
+        elif kind == "within_rectangle":
+            stmt = self._within_rectangle_stmt(
+                params["min_lat"], params["max_lat"], params["min_lon"], params["max_lon"]
+            )
+        else:
+            raise ValueError(f"Unknown job kind: {kind}")
+        if stmt is None:
+            return []
+
+        # одна лишняя строка показывает, что результат не уместился
+        stmt = self.reader.paginate(stmt, None, max_rows + 1 if max_rows is not None else None)
+        organizations = await self.reader.fetch(self.session, stmt)
+        if max_rows is not None and len(organizations) > max_rows:
+            raise JobResultTooLarge(f"Найдено больше {max_rows} организаций, сузьте область поиска")
+        return await self._serialize(organizations)
@@ -0,0 +1,51 @@
+from db.models import Building, Organization
+from services.activity_tree import ActivityTree
+
+
+# Порядок ключей повторяет схемы из schemas/, чтобы ответ не отличался от сериализации pydantic
+
+def building_to_dict(building: Building) -> dict:
+    return {
+        "address": building.address,
+        "latitude": building.latitude,
+        "longitude": building.longitude,
+        "id": building.id,
+    }
+
+
+def organization_to_dict(
+        organization: Organization,
+        building: Building,
+        activity_ids: list[int],
+        activity_tree: ActivityTree,
+) -> dict:
+    """Представление OrganizationResponse; деятельности с поддеревьями берутся из кэша дерева"""
+    return {
+        "id": organization.id,
+        "name": organization.name,
+        "building_id": organization.building_id,
+        "phone_numbers": organization.phone_numbers,
+        "building": building_to_dict(building),
+        "activities": [activity_tree.as_response(activity_id) for activity_id in activity_ids],
+    }
+
+
+def document_to_dict(document: dict, activity_tree: ActivityTree) -> dict:
+    """
+    Представление OrganizationResponse из organization_documents.document.
+    jsonb не хранит порядок ключей, поэтому словарь собирается заново
+    """
+    building = document["building"]
+    return {
+        "id": document["id"],
+        "name": document["name"],
+        "building_id": document["building_id"],
+        "phone_numbers": document["phone_numbers"],
+        "building": {
+            "address": building["address"],
+            "latitude": building["latitude"],
+            "longitude": building["longitude"],
+            "id": building["id"],
+        },
+        "activities": [activity_tree.as_response(activity_id) for activity_id in document["activity_ids"]],
+    }
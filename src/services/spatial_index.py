@@ -0,0 +1,192 @@
+import heapq
+import math
+from array import array
+from typing import Iterator
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from db.models import Building
+from metrics import OPERATION_OPTION
+from geo import EARTH_RADIUS_KM, bounding_box, haversine_km, longitude_ranges
+
+
+class _Cell:
+    """Здания одной ячейки сетки, хранятся в компактных массивах"""
+    __slots__ = ("ids", "lats", "lons")
+
+    def __init__(self):
+        self.ids = array("q")
+        self.lats = array("d")
+        self.lons = array("d")
+
+
+class BuildingSpatialIndex:
+    """
+    Сеточный индекс координат зданий в памяти процесса.
+
+    Карта разбита на ячейки cell_size x cell_size градусов. Поиск по радиусу
+    и прямоугольнику просматривает только ячейки, пересекающие область,
+    и возвращает id подходящих зданий - организации затем выбираются из БД
+    по этим id.
+    """
+
+    def __init__(self, cell_size: float):
+        self.cell_size = cell_size
+        self.is_ready = False
+        self._cells: dict[tuple[int, int], _Cell] = {}
+        self._building_cells: dict[int, tuple[int, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._building_cells)
+
+    def _cell_key(self, latitude: float, longitude: float) -> tuple[int, int]:
+        return (
+            math.floor(latitude / self.cell_size),
+            math.floor(longitude / self.cell_size),
+        )
+
+    # ---------- НАПОЛНЕНИЕ ----------
+    async def load(self, session: AsyncSession) -> None:
+        """Строит индекс заново по всем зданиям из БД"""
+        cells: dict[tuple[int, int], _Cell] = {}
+        building_cells: dict[int, tuple[int, int]] = {}
+
+        stmt = select(Building.id, Building.latitude, Building.longitude)
+        result = await session.stream(
+            stmt.execution_options(yield_per=10_000, **{OPERATION_OPTION: "BuildingSpatialIndex.load"})
+        )
+
+        async for building_id, latitude, longitude in result:
+            key = self._cell_key(latitude, longitude)
+            cell = cells.get(key)
+            if cell is None:
+                cell = cells[key] = _Cell()
+            cell.ids.append(building_id)
+            cell.lats.append(latitude)
+            cell.lons.append(longitude)
+            building_cells[building_id] = key
+
+        # подменяем целиком, чтобы параллельные запросы не видели полуготовый индекс
+        self._cells = cells
+        self._building_cells = building_cells
+        self.is_ready = True
+
+    def upsert(self, building_id: int, latitude: float, longitude: float) -> None:
+        """Добавляет здание или переносит его на новые координаты"""
+        self.remove(building_id)
+
+        key = self._cell_key(latitude, longitude)
+        cell = self._cells.get(key)
+        if cell is None:
+            cell = self._cells[key] = _Cell()
+        cell.ids.append(building_id)
+        cell.lats.append(latitude)
+        cell.lons.append(longitude)
+        self._building_cells[building_id] = key
+
+    def remove(self, building_id: int) -> None:
+        key = self._building_cells.pop(building_id, None)
+        if key is None:
+            return
+
+        cell = self._cells[key]
+        position = cell.ids.index(building_id)
+        del cell.ids[position]
+        del cell.lats[position]
+        del cell.lons[position]
+        if not cell.ids:
+            del self._cells[key]
+
+    # ---------- ПОИСК ----------
+    def _cells_in(
+            self,
+            min_lat: float,
+            max_lat: float,
+            min_lon: float,
+            max_lon: float,
+    ) -> Iterator[_Cell]:
+        min_row, min_col = self._cell_key(min_lat, min_lon)
+        max_row, max_col = self._cell_key(max_lat, max_lon)
+
+        if min_row > max_row or min_col > max_col:
+            return
+
+        # для огромной области дешевле пройти по непустым ячейкам
+        area = (max_row - min_row + 1) * (max_col - min_col + 1)
+        if area > len(self._cells):
+            for (row, col), cell in self._cells.items():
+                if min_row <= row <= max_row and min_col <= col <= max_col:
+                    yield cell
+            return
+
+        for row in range(min_row, max_row + 1):
+            for col in range(min_col, max_col + 1):
+                cell = self._cells.get((row, col))
+                if cell is not None:
+                    yield cell
+
+    def _cells_around(self, latitude: float, longitude: float, radius_km: float) -> Iterator[_Cell]:
+        """Ячейки, пересекающие круг; у круга через 180-й меридиан - с обеих его сторон"""
+        min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius_km)
+        for range_min, range_max in longitude_ranges(min_lon, max_lon):
+            yield from self._cells_in(min_lat, max_lat, range_min, range_max)
+
+    def within_rectangle(
+            self,
+            min_lat: float,
+            max_lat: float,
+            min_lon: float,
+            max_lon: float,
+    ) -> list[int]:
+        building_ids = []
+        for cell in self._cells_in(min_lat, max_lat, min_lon, max_lon):
+            for building_id, lat, lon in zip(cell.ids, cell.lats, cell.lons):
+                if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon:
+                    building_ids.append(building_id)
+        return building_ids
+
+    def within_radius(
+            self,
+            latitude: float,
+            longitude: float,
+            radius_km: float,
+    ) -> list[int]:
+        building_ids = []
+        for cell in self._cells_around(latitude, longitude, radius_km):
+            for building_id, lat, lon in zip(cell.ids, cell.lats, cell.lons):
+                if haversine_km(latitude, longitude, lat, lon) <= radius_km:
+                    building_ids.append(building_id)
+        return building_ids
+
+    def nearest(
+            self,
+            latitude: float,
+            longitude: float,
+            count: int,
+    ) -> list[tuple[int, float]]:
+        """
+        count ближайших зданий как (id, расстояние в км) по возрастанию расстояния.
+        Радиус поиска удваивается, начиная с размера ячейки, пока в круг не попадёт
+        count зданий - ближайшие из них и есть ближайшие вообще
+        """
+        if count <= 0 or not self._building_cells:
+            return []
+
+        radius_km = math.radians(self.cell_size) * EARTH_RADIUS_KM
+        max_radius_km = math.pi * EARTH_RADIUS_KM  # половина окружности - весь земной шар
+        while True:
+            found = []
+            for cell in self._cells_around(latitude, longitude, radius_km):
+                for building_id, lat, lon in zip(cell.ids, cell.lats, cell.lons):
+                    distance = haversine_km(latitude, longitude, lat, lon)
+                    if distance <= radius_km:
+                        found.append((distance, building_id))
+
+            if len(found) >= count or radius_km >= max_radius_km:
+                return [(building_id, distance) for distance, building_id in heapq.nsmallest(count, found)]
+            radius_km *= 2
+
+
+building_index = BuildingSpatialIndex(cell_size=settings.spatial_index.cell_size)
@@ -0,0 +1,95 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from pydantic import ValidationError
+
+# приложение запускается с PYTHONPATH=src
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+try:
+    import config  # noqa: F401
+    DB_CONFIGURED = True
+except ValidationError:
+    # модульные тесты обходятся без БД: подключения создаются лениво и к этим адресам не открываются
+    DB_CONFIGURED = False
+    for name, value in {
+        "APP_HOST": "127.0.0.1",
+        "APP_PORT": "8000",
+        "APP_API_KEY": "test",
+        "DB_HOST": "127.0.0.1",
+        "DB_PORT": "5432",
+        "DB_USER": "test",
+        "DB_PASSWORD": "test",
+        "DB_NAME": "test",
+    }.items():
+        os.environ.setdefault(name, value)
+
+
+@pytest.fixture(scope="session")
+def database():
+    """Тесты с этой фикстурой работают с настоящей БД из переменных DB_* и без них пропускаются"""
+    if not DB_CONFIGURED:
+        pytest.skip("не задано подключение к БД (DB_*)")
+
+
+@pytest.fixture(scope="session")
+def client(database):
+    """Приложение целиком, с lifespan: индекс зданий, дерево деятельностей, очередь задач"""
+    from fastapi.testclient import TestClient
+
+    from config import settings
+    from main import app
+
+    with TestClient(app) as test_client:
+        test_client.headers["Authorization"] = f"Bearer {settings.api_key}"
+        yield test_client
+
+
+@pytest.fixture
+def app_client():
+    """Приложение без lifespan - для эндпоинтов с подставными зависимостями, БД не нужна"""
+    from fastapi.testclient import TestClient
+
+    from config import settings
+    from main import app
+
+    test_client = TestClient(app)
+    test_client.headers["Authorization"] = f"Bearer {settings.api_key}"
+    return test_client
+
+
+@pytest.fixture
+def strict_query_budget(client, monkeypatch):
+    """
+    Бюджет запросов эндпоинтов (api.query_budget) в режиме strict: лишний запрос
+    к БД прерывает HTTP-запрос с QueryBudgetExceeded, и тест падает на нём.
+    Кэш ответов сбрасывается, чтобы считались запросы при промахе.
+    Возвращает RequestStats всех запросов теста
+    """
+    from api import middleware
+    from config import settings
+    from metrics import RequestStats
+    from services.cache import response_cache
+
+    recorded: list[RequestStats] = []
+
+    class RecordedStats(RequestStats):
+        __slots__ = ()
+
+        def __init__(self):
+            super().__init__()
+            recorded.append(self)
+
+    monkeypatch.setattr(settings, "query_budget_mode", "strict")
+    monkeypatch.setattr(middleware, "RequestStats", RecordedStats)
+    if response_cache is not None:
+        client.portal.call(response_cache.clear)
+
+    yield recorded
+
+    # на случай, если эндпоинт перехватил QueryBudgetExceeded
+    exceeded = [stats for stats in recorded if stats.over_budget]
+    if exceeded:
+        pytest.fail(", ".join(f"{stats.queries} запросов при бюджете {stats.budget}" for stats in exceeded))
@@ -0,0 +1,169 @@
+"""
+Ограничение нагрузки (api.middleware.AdmissionMiddleware) на отдельном приложении
+с медленным маршрутом, который держит место, пока тест его не отпустит
+"""
+import asyncio
+
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from api.middleware import AdmissionMiddleware, _RouteGate, admission_rejected
+from metrics import registry
+
+
+class SlowApp:
+    """Starlette-приложение: /slow ждёт release, /fast и /free отвечают сразу"""
+
+    def __init__(self, **admission):
+        self.release = asyncio.Event()
+        self.active = 0
+        self.max_active = 0
+        self.app = Starlette(
+            routes=[Route("/slow", self.slow), Route("/fast", self.fast), Route("/free", self.fast)],
+            middleware=[Middleware(AdmissionMiddleware, **admission)],
+        )
+        self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=self.app), base_url="http://test")
+
+    async def slow(self, request):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await self.release.wait()
+        finally:
+            self.active -= 1
+        return JSONResponse({"ok": True})
+
+    async def fast(self, request):
+        return JSONResponse({"ok": True})
+
+    def gate(self, path: str) -> _RouteGate | None:
+        middleware = self.app.middleware_stack
+        if middleware is None:  # стек собирается при первом запросе
+            return None
+        while not isinstance(middleware, AdmissionMiddleware):
+            middleware = middleware.app
+        return middleware._gates.get(path)
+
+    async def until(self, condition, timeout: float = 5) -> None:
+        async with asyncio.timeout(timeout):
+            while not condition():
+                await asyncio.sleep(0.005)
+
+
+@pytest.fixture(autouse=True)
+def isolated_registry(monkeypatch):
+    # метрики очереди регистрируются каждым AdmissionMiddleware - не подменяем ими метрики приложения
+    monkeypatch.setattr(registry, "_metrics", dict(registry._metrics))
+
+
+def _rejected(path: str, reason: str) -> float:
+    return admission_rejected._values.get((path, reason), 0)
+
+
+def test_route_gate_ewma():
+    gate = _RouteGate(limit=2)
+    assert gate.expected_wait() == 0
+
+    # первое наблюдение задаёт среднее, дальше - экспоненциальное сглаживание
+    gate.observe(1.0)
+    assert gate.service_seconds == 1.0
+    gate.observe(2.0)
+    assert gate.service_seconds == pytest.approx(1.2)
+    gate.observe(0.2)
+    assert gate.service_seconds == pytest.approx(1.0)
+
+    gate.waiting = 3
+    assert gate.expected_wait() == pytest.approx(2.0)
+
+
+def test_requests_over_limit_wait():
+    async def main():
+        app = SlowApp(default_limit=2, max_queue=10, slo_seconds=0)
+        requests = [asyncio.create_task(app.client.get("/slow")) for _ in range(4)]
+        await app.until(lambda: app.gate("/slow") is not None and app.gate("/slow").waiting == 2)
+        gate = app.gate("/slow")
+        assert gate.in_flight == 2
+        assert app.active == 2
+
+        # другой маршрут со своим местом не ждёт
+        assert (await app.client.get("/fast")).status_code == 200
+
+        app.release.set()
+        responses = await asyncio.gather(*requests)
+        assert [response.status_code for response in responses] == [200] * 4
+        assert app.max_active == 2
+        assert gate.in_flight == 0 and gate.waiting == 0
+        assert gate.service_seconds > 0
+    asyncio.run(main())
+
+
+def test_queue_full():
+    async def main():
+        app = SlowApp(default_limit=1, max_queue=1, slo_seconds=0)
+        rejected = _rejected("/slow", "queue_full")
+        requests = [asyncio.create_task(app.client.get("/slow")) for _ in range(2)]
+        await app.until(lambda: app.gate("/slow") is not None and app.gate("/slow").waiting == 1)
+
+        response = await app.client.get("/slow")
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+        assert _rejected("/slow", "queue_full") == rejected + 1
+
+        app.release.set()
+        assert [response.status_code for response in await asyncio.gather(*requests)] == [200, 200]
+    asyncio.run(main())
+
+
+def test_expected_wait_over_slo():
+    async def main():
+        app = SlowApp(default_limit=1, max_queue=10, slo_seconds=1)
+        first = asyncio.create_task(app.client.get("/slow"))
+        await app.until(lambda: app.active == 1)
+        # по среднему времени обработки место освободится через 3 с - больше SLO
+        app.gate("/slow").service_seconds = 3
+
+        rejected = _rejected("/slow", "slo")
+        response = await app.client.get("/slow")
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "3"
+        assert response.json()["detail"]
+        assert _rejected("/slow", "slo") == rejected + 1
+        assert app.gate("/slow").waiting == 0
+
+        app.release.set()
+        assert (await first).status_code == 200
+    asyncio.run(main())
+
+
+def test_wait_over_slo_times_out():
+    async def main():
+        app = SlowApp(default_limit=1, max_queue=10, slo_seconds=0.05)
+        first = asyncio.create_task(app.client.get("/slow"))
+        await app.until(lambda: app.active == 1)
+
+        # среднего времени ещё нет - запрос встаёт в очередь и не дожидается места за slo_seconds
+        rejected = _rejected("/slow", "timeout")
+        response = await app.client.get("/slow")
+        assert response.status_code == 503
+        assert int(response.headers["Retry-After"]) >= 1
+        assert _rejected("/slow", "timeout") == rejected + 1
+        assert app.gate("/slow").waiting == 0
+
+        app.release.set()
+        assert (await first).status_code == 200
+        # место освободилось - следующий запрос проходит
+        assert (await app.client.get("/slow")).status_code == 200
+    asyncio.run(main())
+
+
+def test_unlimited_and_unknown_routes():
+    async def main():
+        app = SlowApp(default_limit=1, limits={"/free": 0}, max_queue=0, slo_seconds=0)
+        assert (await app.client.get("/free")).status_code == 200
+        assert (await app.client.get("/missing")).status_code == 404
+        assert app.gate("/free") is None
+    asyncio.run(main())
@@ -0,0 +1,22 @@
+"""
+Генератор синтетических данных (benchmarks.data) - без БД
+"""
+import argparse
+
+import pytest
+
+from benchmarks.data import MAX_ACTIVITY_LEVEL, activity_depth, generate_activities
+
+
+@pytest.mark.parametrize("depth", [1, 2, 3])
+def test_generate_activities_depth(depth):
+    activities = generate_activities(roots=2, fanout=3, depth=depth)
+    assert max(level for _, _, level, _ in activities) == depth
+    assert len(activities) == sum(2 * 3 ** i for i in range(depth))
+
+
+@pytest.mark.parametrize("value", ["0", str(MAX_ACTIVITY_LEVEL + 1)])
+def test_activity_depth_limit(value):
+    with pytest.raises(argparse.ArgumentTypeError):
+        activity_depth(value)
+    assert activity_depth(str(MAX_ACTIVITY_LEVEL)) == MAX_ACTIVITY_LEVEL
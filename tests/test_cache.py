@@ -0,0 +1,152 @@
+"""
+Кэш ответов (services.cache): MemoryCacheBackend и ключи ResponseCache.make_key
+"""
+import asyncio
+
+import pytest
+
+from services import cache as cache_module
+from services.cache import MemoryCacheBackend, ResponseCache
+
+
+class FakeClock:
+    """Подменяет time.monotonic() в services.cache, время двигается вручную"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(cache_module, "time", clock)
+    return clock
+
+
+def test_lru_eviction(clock):
+    async def main():
+        backend = MemoryCacheBackend(ttl_seconds=60, max_entries=2)
+        await backend.set("a", 1, ["x"])
+        await backend.set("b", 2, ["x"])
+        # чтение делает a самой свежей - вытесняется b
+        assert await backend.get("a") == 1
+        await backend.set("c", 3, ["y"])
+
+        assert await backend.get("b") is None
+        assert await backend.get("a") == 1
+        assert await backend.get("c") == 3
+        assert backend._tags == {"x": {"a"}, "y": {"c"}}
+    asyncio.run(main())
+
+
+def test_ttl_expiry(clock):
+    async def main():
+        backend = MemoryCacheBackend(ttl_seconds=10, max_entries=10)
+        await backend.set("a", 1, ["x"])
+        clock.now += 10
+        assert await backend.get("a") == 1
+        clock.now += 0.1
+        assert await backend.get("a") is None
+        assert not backend._entries
+        assert not backend._tags
+    asyncio.run(main())
+
+
+def test_invalidate_by_tag(clock):
+    async def main():
+        backend = MemoryCacheBackend(ttl_seconds=60, max_entries=10)
+        await backend.set("a", 1, ["org:1", "geo"])
+        await backend.set("b", 2, ["org:2", "geo"])
+        await backend.set("c", 3, ["org:2", "name"])
+
+        await backend.invalidate_tags(["org:1"])
+        assert await backend.get("a") is None
+        assert await backend.get("b") == 2
+
+        await backend.invalidate_tags(["org:2", "unknown"])
+        assert await backend.get("b") is None
+        assert await backend.get("c") is None
+        assert not backend._entries
+        assert not backend._tags
+    asyncio.run(main())
+
+
+def test_set_replaces_tags(clock):
+    async def main():
+        backend = MemoryCacheBackend(ttl_seconds=60, max_entries=10)
+        await backend.set("a", 1, ["x"])
+        await backend.set("a", 2, ["y"])
+        await backend.invalidate_tags(["x"])
+        assert await backend.get("a") == 2
+    asyncio.run(main())
+
+
+def test_hold_after_invalidate(clock):
+    async def main():
+        backend = MemoryCacheBackend(ttl_seconds=60, max_entries=10, hold_seconds=2)
+        await backend.invalidate_tags(["geo"])
+
+        # запись с удержанным тегом не кэшируется, с другими тегами - кэшируется
+        await backend.set("a", 1, ["geo", "org:1"])
+        await backend.set("b", 2, ["name"])
+        assert await backend.get("a") is None
+        assert await backend.get("b") == 2
+
+        clock.now += 2.1
+        await backend.set("a", 1, ["geo"])
+        assert await backend.get("a") == 1
+
+        # устаревшие удержания убираются при следующем сбросе
+        await backend.invalidate_tags(["name"])
+        assert set(backend._held) == {"name"}
+
+        await backend.clear()
+        assert not backend._held
+        await backend.set("b", 2, ["name"])
+        assert await backend.get("b") == 2
+    asyncio.run(main())
+
+
+def test_no_hold_by_default(clock):
+    async def main():
+        backend = MemoryCacheBackend(ttl_seconds=60, max_entries=10)
+        await backend.invalidate_tags(["geo"])
+        await backend.set("a", 1, ["geo"])
+        assert await backend.get("a") == 1
+        assert not backend._held
+    asyncio.run(main())
+
+
+def test_response_cache(clock):
+    async def main():
+        cache = ResponseCache(MemoryCacheBackend(ttl_seconds=60, max_entries=10))
+        await cache.set("a", [{"id": 1}], ["org:1"])
+        assert await cache.get("a") == [{"id": 1}]
+        await cache.invalidate(["org:1"])
+        assert await cache.get("a") is None
+    asyncio.run(main())
+
+
+def test_make_key_normalization():
+    key = ResponseCache.make_key("organizations", name="Рога", limit=10, after_id=None)
+
+    assert key.startswith("organizations:")
+    # порядок параметров и пропущенные (None) не важны
+    assert key == ResponseCache.make_key("organizations", limit=10, name="Рога")
+    # поиск по названию не зависит от регистра - запросы делят запись
+    assert key == ResponseCache.make_key("organizations", name="РОГА", limit=10)
+    assert key != ResponseCache.make_key("organizations", name="Рога", limit=20)
+    assert key != ResponseCache.make_key("organizations", name="Рог", limit=10)
+    assert key != ResponseCache.make_key("within_radius", name="Рога", limit=10)
+
+
+def test_make_key_floats():
+    key = ResponseCache.make_key("nearest", latitude=55.0, longitude=37.6, k=5)
+    assert key == ResponseCache.make_key("nearest", latitude=55, longitude=37.6, k=5)
+    assert key != ResponseCache.make_key("nearest", latitude=55.0000001, longitude=37.6, k=5)
+    assert key != ResponseCache.make_key("nearest", latitude=37.6, longitude=55.0, k=5)
+    # число и строка с тем же текстом - разные параметры
+    assert key != ResponseCache.make_key("nearest", latitude="55", longitude=37.6, k=5)
@@ -0,0 +1,28 @@
+"""Проверка согласованности настроек (config.Settings)"""
+import pytest
+from pydantic import ValidationError
+
+from config import Settings, settings
+
+
+def _settings(**values) -> Settings:
+    nested = {
+        name: getattr(settings, name)
+        for name in ("db", "spatial_index", "activity_tree", "cache", "jobs", "admission")
+    }
+    return Settings(port=8000, host="127.0.0.1", api_key="test", **nested, **values)
+
+
+@pytest.mark.parametrize("read_model, geo_backend", [
+    ("tables", "float"),
+    ("tables", "postgis"),
+    ("documents", "float"),
+])
+def test_read_model_and_geo_backend(read_model, geo_backend):
+    assert _settings(read_model=read_model, geo_backend=geo_backend).read_model == read_model
+
+
+def test_documents_reject_postgis():
+    with pytest.raises(ValidationError, match="APP_GEO_BACKEND=postgis"):
+        _settings(read_model="documents", geo_backend="postgis")
+
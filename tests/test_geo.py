@@ -0,0 +1,41 @@
+"""
+Прямоугольник вокруг круга (geo.bounding_box) и его полосы долгот у 180-го меридиана
+"""
+import random
+
+from geo import bounding_box, haversine_km, longitude_ranges
+
+
+def _in_ranges(longitude: float, ranges: list[tuple[float, float]]) -> bool:
+    return any(min_lon <= longitude <= max_lon for min_lon, max_lon in ranges)
+
+
+def test_longitude_ranges():
+    assert longitude_ranges(10, 20) == [(10, 20)]
+    assert longitude_ranges(175, 185) == [(175, 180), (-180, -175)]
+    assert longitude_ranges(-185, -175) == [(175, 180), (-180, -175)]
+    assert longitude_ranges(-200, 200) == [(-180, 180)]
+
+
+def test_bounding_box_crosses_antimeridian():
+    min_lat, max_lat, min_lon, max_lon = bounding_box(0, 179.9, 50)
+    assert max_lon > 180
+    ranges = longitude_ranges(min_lon, max_lon)
+    assert len(ranges) == 2
+    # здание по ту сторону меридиана в 20 км от центра
+    assert haversine_km(0, 179.9, 0, -179.92) < 50
+    assert _in_ranges(-179.92, ranges)
+
+
+def test_bounding_box_contains_circle():
+    rng = random.Random(1)
+    for _ in range(200):
+        latitude, longitude = rng.uniform(-80, 80), rng.uniform(-180, 180)
+        radius_km = rng.uniform(1, 2000)
+        min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius_km)
+        ranges = longitude_ranges(min_lon, max_lon)
+        for _ in range(50):
+            lat, lon = rng.uniform(-90, 90), rng.uniform(-180, 180)
+            if haversine_km(latitude, longitude, lat, lon) <= radius_km:
+                assert min_lat <= lat <= max_lat
+                assert _in_ranges(lon, ranges)
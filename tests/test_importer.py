@@ -0,0 +1,103 @@
+"""
+Разбор файлов пакетного импорта (services.importer) - без БД
+"""
+import argparse
+import asyncio
+
+import pytest
+
+from db.import_organizations import batch_size
+from services.importer import (
+    MAX_BATCH_SIZE,
+    OrganizationImporter,
+    decode_line,
+    iter_lines,
+    parse_csv,
+    parse_ndjson,
+)
+
+
+async def _chunks(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+
+
+def _parse(parser, *chunks: bytes) -> list:
+    async def main():
+        return [record async for record in parser(iter_lines(_chunks(*chunks)))]
+    return asyncio.run(main())
+
+
+def test_decode_line():
+    assert decode_line("Рога и копыта\r".encode()) == "Рога и копыта"
+    assert decode_line(b"\xef\xbb\xbf{}") == "{}"
+    error = decode_line(b"ok \xff")
+    assert isinstance(error, UnicodeDecodeError)
+    assert error.start == 3
+
+
+def test_iter_lines_across_chunks():
+    async def main():
+        return [line async for line in iter_lines(_chunks(b"a\nb", "в\r\n".encode()[:1], "в\r\n".encode()[1:], b"c"))]
+    assert asyncio.run(main()) == ["a", "bв", "c"]
+
+
+def test_parse_ndjson():
+    records = _parse(
+        parse_ndjson,
+        '{"name": "Рога"}\n'.encode(),
+        b"\n",
+        b'{"name": \n',
+        b"[1, 2]\n",
+        b'"\xff"\n',
+        b'{"name": "last"}',
+    )
+    assert records[0] == (1, {"name": "Рога"}, None)
+    # пустая строка пропускается, но номера строк сохраняются
+    assert records[1][0] == 3 and records[1][1] is None and records[1][2].startswith("Некорректный JSON")
+    assert records[2] == (4, None, "Строка должна быть JSON-объектом")
+    assert records[3] == (5, None, "Строка не в кодировке UTF-8: байт 0xff в позиции 1")
+    assert records[4] == (6, {"name": "last"}, None)
+    assert len(records) == 5
+
+
+def test_parse_csv():
+    records = _parse(
+        parse_csv,
+        b"name,phone_numbers,building_id,building_address,latitude,longitude,activity_ids,id\n",
+        "Рога,2-222-222; 3-333-333,7,,,,1;2,\n".encode(),
+        "Копыта,,,\"ул. Ленина, 1\",55.7,37.6,,15\n".encode(),
+        b"\xff,,\n",
+        b"\n",
+        b"only name\n",
+    )
+    assert records[0] == (2, {
+        "name": "Рога", "phone_numbers": ["2-222-222", "3-333-333"], "building_id": "7", "activity_ids": ["1", "2"],
+    }, None)
+    assert records[1] == (3, {
+        "name": "Копыта", "phone_numbers": [], "id": "15",
+        "building": {"address": "ул. Ленина, 1", "latitude": "55.7", "longitude": "37.6"},
+    }, None)
+    # после заголовка строка не в UTF-8 пропускается, разбор продолжается
+    assert records[2] == (4, None, "Строка не в кодировке UTF-8: байт 0xff в позиции 0")
+    assert records[3] == (6, {"name": "only name", "phone_numbers": []}, None)
+    assert len(records) == 4
+
+
+def test_parse_csv_bad_header():
+    assert _parse(parse_csv, b"name,phone,floor\n", b"x,y,z\n") == [
+        (1, None, "Неизвестные колонки: floor, phone"),
+    ]
+    # без заголовка остальные строки не разобрать
+    assert _parse(parse_csv, b"\xfename\n", b"x\n") == [
+        (1, None, "Строка не в кодировке UTF-8: байт 0xfe в позиции 0"),
+    ]
+
+
+@pytest.mark.parametrize("size", [0, MAX_BATCH_SIZE + 1])
+def test_batch_size_limit(size):
+    with pytest.raises(ValueError):
+        OrganizationImporter(None, None, None, None, None, None, size)
+    with pytest.raises(argparse.ArgumentTypeError):
+        batch_size(str(size))
+    assert batch_size(str(MAX_BATCH_SIZE)) == MAX_BATCH_SIZE
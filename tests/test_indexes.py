@@ -0,0 +1,65 @@
+"""
+Горячие запросы репозиториев используют индексы миграции a91d3c5e7f20.
+Нужна БД с применёнными миграциями, подключение - из переменных DB_* (как в example.env)
+"""
+import asyncio
+
+import pytest
+
+from config import settings
+
+from sqlalchemy import Select, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from repositories.activity import ActivityRepository
+from repositories.loaders import Loaders
+from repositories.organization import OrganizationRepository
+
+pytestmark = pytest.mark.usefixtures("database")
+
+
+def _index_names(plan) -> set[str]:
+    if isinstance(plan, list):
+        return set().union(*map(_index_names, plan)) if plan else set()
+    if not isinstance(plan, dict):
+        return set()
+    names = {plan["Index Name"]} if "Index Name" in plan else set()
+    return names.union(*map(_index_names, plan.values()))
+
+
+async def _explain(stmt: Select) -> set[str]:
+    engine = create_async_engine(settings.db.dsn_asyncpg, poolclass=NullPool)
+    try:
+        async with engine.connect() as connection:
+            # на маленькой тестовой БД последовательное чтение дешевле любого индекса -
+            # проверяем, что индекс подходит запросу, а не выбор планировщика на этих данных
+            await connection.execute(text("SET enable_seqscan = off"))
+            compiled = stmt.compile(dialect=connection.dialect)
+            params = tuple(compiled.params[name] for name in compiled.positiontup)
+            result = await connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", params)
+            return _index_names(result.scalar())
+    finally:
+        await engine.dispose()
+
+
+def explain(stmt: Select) -> set[str]:
+    return asyncio.run(_explain(stmt))
+
+
+def test_activity_filter_uses_reverse_junction_index():
+    stmt = OrganizationRepository().filtered_stmt({"activity_id": 1})
+    assert "ix_organization_activity_activity_id_organization_id" in explain(stmt)
+
+
+def test_activity_links_use_junction_primary_key():
+    assert "organization_activity_pkey" in explain(Loaders.activity_ids_stmt([1, 2, 3]))
+
+
+def test_building_filter_uses_building_id_index():
+    stmt = OrganizationRepository().by_building_ids_stmt([1, 2, 3])
+    assert "ix_organizations_building_id" in explain(stmt)
+
+
+def test_activity_subtree_uses_parent_id_index():
+    assert "ix_activities_parent_id" in explain(ActivityRepository().subtree_ids_stmt(1))
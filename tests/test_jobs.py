@@ -0,0 +1,135 @@
+"""
+Очередь фоновых задач (services.jobs) с подставным runner вместо поиска в БД.
+Ограничение размера результата проверяется через API и требует БД
+"""
+import asyncio
+import time
+
+import pytest
+
+from config import settings
+from exceptions import JobQueueFull
+from services.jobs import InMemoryJobBackend, Job
+
+
+class StubRunner:
+    """Задача "slow" ждёт release, "fail" падает, остальные сразу возвращают организации из rows"""
+
+    def __init__(self, rows: list[dict] | None = None):
+        self.rows = rows or []
+        self.release = asyncio.Event()
+
+    async def __call__(self, kind: str, params: dict) -> list[dict]:
+        if kind == "slow":
+            await self.release.wait()
+        if kind == "fail":
+            raise RuntimeError("поиск не удался")
+        return self.rows
+
+
+async def _wait(backend: InMemoryJobBackend, job: Job, timeout: float = 5) -> Job:
+    deadline = time.monotonic() + timeout
+    while job.status in ("pending", "running"):
+        assert time.monotonic() < deadline, f"задача {job.kind} не завершилась"
+        await asyncio.sleep(0.01)
+    return await backend.get(job.id)
+
+
+def _run(scenario):
+    async def main():
+        runner = StubRunner([{"id": i} for i in (2, 5, 7, 11)])
+        backend = InMemoryJobBackend(workers=2, queue_size=10, result_ttl_seconds=60, max_jobs=3)
+        await backend.start(runner)
+        try:
+            await scenario(backend, runner)
+        finally:
+            runner.release.set()
+            await backend.stop()
+    asyncio.run(main())
+
+
+def test_job_result_pages():
+    async def scenario(backend, runner):
+        job = await _wait(backend, await backend.submit("within_radius", {}))
+        assert job.status == "done"
+        assert job.to_dict(limit=2)["organizations"] == [{"id": 2}, {"id": 5}]
+        assert job.to_dict(after_id=5)["organizations"] == [{"id": 7}, {"id": 11}]
+        assert job.to_dict()["total"] == 4
+
+    _run(scenario)
+
+
+def test_failed_job_keeps_error():
+    async def scenario(backend, runner):
+        job = await _wait(backend, await backend.submit("fail", {}))
+        assert job.status == "failed"
+        assert job.error == "поиск не удался"
+        assert job.to_dict()["organizations"] == []
+
+    _run(scenario)
+
+
+def test_queue_full():
+    async def main():
+        # без обработчиков задачи остаются в очереди
+        backend = InMemoryJobBackend(workers=0, queue_size=1, result_ttl_seconds=60, max_jobs=10)
+        await backend.submit("within_radius", {})
+        with pytest.raises(JobQueueFull):
+            await backend.submit("within_radius", {})
+    asyncio.run(main())
+
+
+def test_running_job_does_not_block_eviction():
+    async def scenario(backend, runner):
+        slow = await backend.submit("slow", {})
+        first = await _wait(backend, await backend.submit("within_radius", {}))
+        second = await _wait(backend, await backend.submit("within_radius", {}))
+        assert slow.status == "running"
+
+        # задач уже max_jobs: место освобождает самая старая завершённая, а не выполняемая
+        third = await backend.submit("within_radius", {})
+        assert await backend.get(first.id) is None
+        assert await backend.get(slow.id) is slow
+        assert await backend.get(second.id) is second
+
+        runner.release.set()
+        assert (await _wait(backend, slow)).status == "done"
+        await _wait(backend, third)
+
+    _run(scenario)
+
+
+def test_expired_results_evicted_behind_running_job():
+    async def main():
+        runner = StubRunner()
+        backend = InMemoryJobBackend(workers=2, queue_size=10, result_ttl_seconds=0.05, max_jobs=100)
+        await backend.start(runner)
+        try:
+            slow = await backend.submit("slow", {})
+            done = await _wait(backend, await backend.submit("within_radius", {}))
+            await asyncio.sleep(0.1)
+
+            await backend.submit("within_radius", {})
+            # get() сам не отдаёт устаревший результат - проверяем, что его убрал _evict при постановке задачи
+            assert done.id not in backend._jobs
+            assert slow.id in backend._jobs
+        finally:
+            runner.release.set()
+            await backend.stop()
+    asyncio.run(main())
+
+
+def test_job_over_result_rows_fails(client, monkeypatch):
+    monkeypatch.setattr(settings.jobs, "max_result_rows", 1)
+    response = client.get("/api/v1/organizations/within_rectangle", params={
+        "min_lat": -90, "max_lat": 90, "min_lon": -180, "max_lon": 180, "async": True,
+    })
+    assert response.status_code == 202
+
+    deadline = time.monotonic() + 30
+    while (job := client.get(response.headers["Location"]).json())["status"] in ("pending", "running"):
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    assert job["status"] == "failed"
+    assert job["error"] == "Найдено больше 1 организаций, сузьте область поиска"
+    assert job["organizations"] == []
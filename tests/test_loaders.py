@@ -0,0 +1,146 @@
+"""
+Пакетная загрузка (repositories.loaders) с подставной функцией загрузки вместо БД
+"""
+import asyncio
+
+import pytest
+
+from repositories.loaders import DataLoader, Loaders
+
+
+class FakeBatch:
+    """Функция пакетной загрузки: запоминает вызовы, значение ключа - его квадрат"""
+
+    def __init__(self, error: Exception | None = None, missing: set[int] = frozenset()):
+        self.calls: list[list[int]] = []
+        self.error = error
+        self.missing = missing
+
+    async def __call__(self, keys: list[int]) -> dict[int, int]:
+        self.calls.append(list(keys))
+        await asyncio.sleep(0)
+        if self.error is not None:
+            raise self.error
+        return {key: key * key for key in keys if key not in self.missing}
+
+
+def test_loads_in_one_tick_are_batched():
+    async def main():
+        batch = FakeBatch()
+        loader = DataLoader(batch)
+        results = await asyncio.gather(*(loader.load(key) for key in (3, 1, 2, 1)))
+        assert results == [9, 1, 4, 1]
+        assert batch.calls == [[3, 1, 2]]
+
+        assert await loader.load_many([4, 5, 3]) == [16, 25, 9]
+        assert batch.calls == [[3, 1, 2], [4, 5]]
+    asyncio.run(main())
+
+
+def test_memoization():
+    async def main():
+        batch = FakeBatch()
+        loader = DataLoader(batch)
+        assert await loader.load(7) == 49
+        assert await loader.load(7) == 49
+        assert await loader.load_many([7, 7]) == [49, 49]
+        assert batch.calls == [[7]]
+
+        loader.prime(8, 100)
+        assert await loader.load(8) == 100
+        assert batch.calls == [[7]]
+
+        loader.clear()
+        assert await loader.load(7) == 49
+        assert batch.calls == [[7], [7]]
+    asyncio.run(main())
+
+
+def test_missing_keys_get_default():
+    async def main():
+        batch = FakeBatch(missing={2})
+        assert await DataLoader(batch).load_many([1, 2]) == [1, None]
+        assert await DataLoader(batch, default=0).load_many([1, 2]) == [1, 0]
+    asyncio.run(main())
+
+
+def test_error_reaches_every_waiter():
+    async def main():
+        batch = FakeBatch(error=RuntimeError("БД недоступна"))
+        loader = DataLoader(batch)
+        results = await asyncio.gather(*(loader.load(key) for key in (1, 2, 1)), return_exceptions=True)
+        assert len(batch.calls) == 1
+        assert all(isinstance(result, RuntimeError) and str(result) == "БД недоступна" for result in results)
+
+        # ошибка не запоминается - следующий load повторяет запрос
+        batch.error = None
+        assert await loader.load(1) == 1
+        assert batch.calls == [[1, 2], [1]]
+    asyncio.run(main())
+
+
+def test_clear_before_dispatch():
+    async def main():
+        batch = FakeBatch()
+        loader = DataLoader(batch)
+        pending = loader.load(3)
+        loader.clear()
+        # без ответа ожидающий завис бы навсегда
+        assert await asyncio.wait_for(pending, 1) == 9
+        assert batch.calls == [[3]]
+    asyncio.run(main())
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def scalars(self):
+        return self
+
+    def all(self):
+        return self.rows
+
+
+class FakeSession:
+    """Отдаёт на каждый execute следующий результат и считает одновременные запросы"""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.active = 0
+        self.calls = 0
+
+    async def execute(self, stmt):
+        self.calls += 1
+        self.active += 1
+        assert self.active == 1, "запросы в одной сессии должны идти по очереди"
+        await asyncio.sleep(0)
+        self.active -= 1
+        return FakeResult(self.results.pop(0))
+
+
+def test_loaders_share_session():
+    class Building:
+        def __init__(self, building_id):
+            self.id = building_id
+
+    async def main():
+        session = FakeSession([Building(1), Building(2)], [(10, 3), (10, 5), (11, 4)])
+        loaders = Loaders(session)
+        buildings, activity_ids = await asyncio.gather(
+            loaders.buildings.load_many([1, 2, 1]),
+            loaders.activity_ids.load_many([10, 11, 12]),
+        )
+        assert [building.id for building in buildings] == [1, 2, 1]
+        assert activity_ids == [[3, 5], [4], []]
+        assert session.calls == 2
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("keys", [[], [1]])
+def test_load_many(keys):
+    async def main():
+        batch = FakeBatch()
+        assert await DataLoader(batch).load_many(keys) == [key * key for key in keys]
+        assert batch.calls == ([keys] if keys else [])
+    asyncio.run(main())
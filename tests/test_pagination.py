@@ -0,0 +1,54 @@
+"""Курсор X-Next-After-Id у списка организаций - с подставным сервисом вместо БД"""
+import pytest
+
+from depends import get_organization_service
+
+
+class StubOrganizationService:
+    """Страница из limit организаций с id после after_id"""
+
+    async def get_organizations(
+            self,
+            filters: dict,
+            after_id: int | None = None,
+            limit: int | None = None,
+            is_current=None,
+    ):
+        start = (after_id or 0) + 1
+        building = {"id": 1, "address": "ул. Тестовая, 1", "latitude": 55.75, "longitude": 37.61}
+        organizations = [
+            {"id": i, "name": f"Организация {i}", "building_id": 1, "phone_numbers": [], "building": building, "activities": []}
+            for i in range(start, start + (limit or 3))
+        ]
+        return organizations, ("stub", None)
+
+
+@pytest.fixture
+def client(app_client):
+    app_client.app.dependency_overrides[get_organization_service] = StubOrganizationService
+    yield app_client
+    del app_client.app.dependency_overrides[get_organization_service]
+
+
+def test_full_page_has_cursor(client):
+    response = client.get("/api/v1/organizations", params={"name": "орг", "limit": 2})
+    assert response.status_code == 200
+    assert response.headers["X-Next-After-Id"] == "2"
+
+
+def test_similar_search_has_no_cursor(client):
+    response = client.get("/api/v1/organizations", params={"name": "орг", "name_search": "similar", "limit": 2})
+    assert response.status_code == 200
+    assert len(response.json()) == 2
+    assert "X-Next-After-Id" not in response.headers
+
+
+def test_cursor_continues_from_after_id(client):
+    response = client.get("/api/v1/organizations", params={"after_id": 2, "limit": 2})
+    assert [item["id"] for item in response.json()] == [3, 4]
+    assert response.headers["X-Next-After-Id"] == "4"
+
+
+def test_similar_search_rejects_after_id(client):
+    response = client.get("/api/v1/organizations", params={"name": "орг", "name_search": "similar", "after_id": 2})
+    assert response.status_code == 400
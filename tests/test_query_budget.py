@@ -0,0 +1,167 @@
+"""
+Каждый эндпоинт укладывается в свой бюджет запросов к БД (@query_budget) в режиме strict.
+Нужна БД с применёнными миграциями и данными (src/db/seed.py или src/benchmarks/data.py)
+"""
+import time
+
+import pytest
+
+API = "/api/v1"
+
+
+@pytest.fixture(scope="module")
+def organization(client) -> dict:
+    response = client.get(f"{API}/organizations", params={"limit": 1})
+    assert response.status_code == 200
+    if not response.json():
+        pytest.skip("в БД нет организаций")
+    return response.json()[0]
+
+
+def test_organizations_by_building(client, strict_query_budget, organization):
+    response = client.get(f"{API}/organizations", params={"building_id": organization["building"]["id"]})
+    assert response.status_code == 200
+    assert organization["id"] in {item["id"] for item in response.json()}
+
+
+def test_organizations_by_activity_subtree(client, strict_query_budget, organization):
+    activity = organization["activities"][0]
+    response = client.get(f"{API}/organizations", params={
+        "activity_id": activity["parent_id"] or activity["id"],
+        "include_subactivities": True,
+        "limit": 50,
+    })
+    assert response.status_code == 200
+    assert response.json()
+
+
+def test_organizations_by_name(client, strict_query_budget, organization):
+    response = client.get(f"{API}/organizations", params={"name": organization["name"][:3], "limit": 50})
+    assert response.status_code == 200
+
+
+def test_organization_by_id(client, strict_query_budget, organization):
+    response = client.get(f"{API}/organizations/{organization['id']}")
+    assert response.status_code == 200
+    assert response.json()["id"] == organization["id"]
+
+
+def test_organization_not_found(client, strict_query_budget):
+    response = client.get(f"{API}/organizations/999999999")
+    assert response.status_code == 404
+    response = client.get(f"{API}/organizations/999999999", headers={"If-None-Match": "*"})
+    assert response.status_code == 404
+
+
+def test_conditional_request_checks_versions_first(client, strict_query_budget, organization):
+    from services.cache import response_cache
+
+    etag = client.get(f"{API}/organizations/{organization['id']}").headers["ETag"]
+    if response_cache is not None:
+        client.portal.call(response_cache.clear)
+    response = client.get(f"{API}/organizations/{organization['id']}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    # только версия организации, без загрузки и сериализации
+    assert strict_query_budget[-1].queries == 1
+
+
+def test_organizations_batch_get(client, strict_query_budget, organization):
+    response = client.post(f"{API}/organizations/batch_get", json={"ids": [organization["id"], -1]})
+    assert response.status_code == 200
+    assert response.json()["missing_ids"] == [-1]
+
+
+def test_organizations_within_radius(client, strict_query_budget, organization):
+    building = organization["building"]
+    response = client.get(f"{API}/organizations/within_radius", params={
+        "latitude": building["latitude"],
+        "longitude": building["longitude"],
+        "radius_km": 1,
+        "limit": 100,
+    })
+    assert response.status_code == 200
+    assert response.json()
+
+
+def test_organizations_within_rectangle(client, strict_query_budget, organization):
+    building = organization["building"]
+    response = client.get(f"{API}/organizations/within_rectangle", params={
+        "min_lat": building["latitude"] - 0.01,
+        "max_lat": building["latitude"] + 0.01,
+        "min_lon": building["longitude"] - 0.01,
+        "max_lon": building["longitude"] + 0.01,
+        "limit": 100,
+    })
+    assert response.status_code == 200
+    assert response.json()
+
+
+def test_organizations_nearest(client, strict_query_budget, organization):
+    building = organization["building"]
+    response = client.get(f"{API}/organizations/nearest", params={
+        "latitude": building["latitude"],
+        "longitude": building["longitude"],
+        "k": 20,
+    })
+    assert response.status_code == 200
+    assert response.json()
+
+
+def test_organizations_stats(client, strict_query_budget):
+    response = client.get(f"{API}/organizations/stats", params={"buildings_limit": 10})
+    assert response.status_code == 200
+
+
+def test_organization_job(client, strict_query_budget, organization):
+    building = organization["building"]
+    response = client.get(f"{API}/organizations/within_radius", params={
+        "latitude": building["latitude"],
+        "longitude": building["longitude"],
+        "radius_km": 1,
+        "async": True,
+    })
+    assert response.status_code == 202
+
+    deadline = time.monotonic() + 30
+    while True:
+        job = client.get(response.headers["Location"], params={"limit": 10})
+        assert job.status_code == 200
+        if job.json()["status"] in ("done", "failed") or time.monotonic() > deadline:
+            break
+        time.sleep(0.05)
+    assert job.json()["status"] == "done"
+
+
+def test_organizations_import(client, strict_query_budget):
+    # только ошибочные строки - в БД ничего не пишется
+    response = client.post(
+        f"{API}/organizations/import",
+        content=b'{"name": \n"\xff"\n',
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 200
+    assert response.json()["failed"] == 2
+
+
+def test_metrics(client, strict_query_budget, organization):
+    client.get(f"{API}/organizations/{organization['id']}")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert 'http_request_db_seconds_count{method="GET",route="/api/v1/organizations/{organization_id}"}' in response.text
+
+
+def test_pool_stats(client, strict_query_budget):
+    response = client.get(f"{API}/system/pool")
+    assert response.status_code == 200
+    assert "primary" in response.json()
+
+
+def test_organizations_within_radius_empty_area(client, strict_query_budget):
+    from services.spatial_index import building_index
+
+    response = client.get(f"{API}/organizations/within_radius", params={"latitude": 0, "longitude": 0, "radius_km": 1})
+    assert response.status_code == 200
+    assert response.json() == []
+    if building_index.is_ready:
+        # индекс не нашёл зданий - организации из БД не выбираются
+        assert strict_query_budget[-1].queries == 0
@@ -0,0 +1,211 @@
+"""
+Представление ответов: сжатие (api.middleware.CompressionMiddleware) на отдельном приложении,
+компактная раскладка и MessagePack (api.responses) - с подставным сервисом вместо БД
+"""
+import asyncio
+import gzip
+
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from api import middleware, responses
+from api.middleware import CompressionMiddleware, choose_encoding
+from api.responses import compact_layout
+from depends import get_organization_service
+
+BIG = [{"id": i, "name": f"Организация {i}"} for i in range(100)]
+HAS_BROTLI = middleware.brotli is not None
+
+
+async def _big(request):
+    return JSONResponse(BIG, headers={"ETag": '"v1"', "Vary": "Accept"})
+
+
+async def _small(request):
+    return JSONResponse({"id": 1})
+
+
+async def _image(request):
+    return Response(b"\x89PNG" + bytes(4096), media_type="image/png")
+
+
+async def _stream(request):
+    async def lines():
+        for i in range(50):
+            yield f'{{"id": {i}, "name": "Организация {i}"}}\n'.encode()
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+async def _not_modified(request):
+    return Response(status_code=304, headers={"ETag": '"v1"'})
+
+
+def _get(path: str, accept_encoding: str = "gzip") -> httpx.Response:
+    app = Starlette(
+        routes=[Route(p, endpoint) for p, endpoint in (
+            ("/big", _big), ("/small", _small), ("/image", _image), ("/stream", _stream), ("/304", _not_modified),
+        )],
+        middleware=[Middleware(CompressionMiddleware, minimum_size=1024)],
+    )
+
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get(path, headers={"Accept-Encoding": accept_encoding})
+    return asyncio.run(main())
+
+
+def _vary(response: httpx.Response) -> list[str]:
+    return [value.strip() for value in response.headers.get("vary", "").split(",") if value.strip()]
+
+
+# ---------- СЖАТИЕ ----------
+@pytest.mark.parametrize("accept_encoding, expected", [
+    ("gzip", "gzip"),
+    ("gzip, deflate", "gzip"),
+    ("br, gzip", "br" if HAS_BROTLI else "gzip"),
+    ("gzip;q=0.5, br", "br" if HAS_BROTLI else "gzip"),
+    ("br;q=0.1, gzip;q=0.9", "gzip"),
+    ("*", "br" if HAS_BROTLI else "gzip"),
+    ("gzip;q=0, *;q=0", None),
+    ("gzip;q=abc", None),
+    ("identity", None),
+    ("", None),
+])
+def test_choose_encoding(accept_encoding, expected):
+    assert choose_encoding(accept_encoding) == expected
+
+
+def test_gzip_response():
+    response = _get("/big")
+    assert response.headers["content-encoding"] == "gzip"
+    assert int(response.headers["content-length"]) < len(JSONResponse(BIG).body)
+    assert response.json() == BIG
+    # байты другие - ETag слабый, Vary эндпоинта сохраняется
+    assert response.headers["etag"] == 'W/"v1"'
+    assert _vary(response) == ["Accept", "Accept-Encoding"]
+
+
+@pytest.mark.skipif(not HAS_BROTLI, reason="brotli не установлен")
+def test_brotli_response():
+    response = _get("/big", "gzip, br")
+    assert response.headers["content-encoding"] == "br"
+    # httpx сам распаковывает br, если установлен brotli
+    assert response.json() == BIG
+    assert response.headers["etag"] == 'W/"v1"'
+
+
+def test_uncompressed_responses_vary():
+    # несжатые ответы сжимаемого типа тоже зависят от Accept-Encoding
+    for path, accept_encoding in (("/big", "identity"), ("/small", "gzip")):
+        response = _get(path, accept_encoding)
+        assert "content-encoding" not in response.headers
+        assert "Accept-Encoding" in _vary(response)
+    assert _get("/big", "identity").headers["etag"] == '"v1"'
+
+
+def test_incompressible_type():
+    response = _get("/image")
+    assert "content-encoding" not in response.headers
+    assert "vary" not in response.headers
+    assert len(response.content) == 4100
+
+
+def test_streaming_response():
+    response = _get("/stream")
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    lines = response.text.splitlines()
+    assert len(lines) == 50
+    assert lines[-1] == '{"id": 49, "name": "Организация 49"}'
+
+
+def test_not_modified_passthrough():
+    response = _get("/304")
+    assert response.status_code == 304
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] == '"v1"'
+
+
+def test_gzip_is_valid_stream():
+    async def main():
+        app = Starlette(routes=[Route("/big", _big)], middleware=[Middleware(CompressionMiddleware)])
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            async with client.stream("GET", "/big", headers={"Accept-Encoding": "gzip"}) as response:
+                return b"".join([chunk async for chunk in response.aiter_raw()])
+    assert gzip.decompress(asyncio.run(main())) == JSONResponse(BIG).body
+
+
+# ---------- ФОРМАТ СПИСКОВ ----------
+BUILDING = {"id": 1, "address": "ул. Тестовая, 1", "latitude": 55.75, "longitude": 37.61}
+FOOD = {
+    "id": 1, "name": "Еда", "parent_id": None, "level": 1,
+    "children": [{"id": 2, "name": "Мясная продукция", "parent_id": 1, "level": 2, "children": []}],
+}
+CARS = {"id": 3, "name": "Автомобили", "parent_id": None, "level": 1, "children": None}
+ORGANIZATIONS = [
+    {"id": 1, "name": "Рога и копыта", "building_id": 1, "phone_numbers": ["2-222-222"],
+     "building": BUILDING, "activities": [FOOD]},
+    {"id": 2, "name": "Копыта", "building_id": 1, "phone_numbers": [],
+     "building": BUILDING, "activities": [FOOD["children"][0], CARS]},
+]
+
+
+def test_compact_layout():
+    layout = compact_layout(ORGANIZATIONS)
+    assert layout["buildings"] == [BUILDING]
+    assert [activity["id"] for activity in layout["activities"]] == [1, 2, 3]
+    assert layout["activities"][1] == {"id": 2, "name": "Мясная продукция", "parent_id": 1, "level": 2}
+    assert layout["organizations"] == [
+        {"id": 1, "name": "Рога и копыта", "building_id": 1, "phone_numbers": ["2-222-222"], "activity_ids": [1]},
+        {"id": 2, "name": "Копыта", "building_id": 1, "phone_numbers": [], "activity_ids": [2, 3]},
+    ]
+    assert compact_layout([]) == {"buildings": [], "activities": [], "organizations": []}
+
+
+class StubOrganizationService:
+    async def get_organizations(self, filters: dict, after_id=None, limit=None, is_current=None):
+        return ORGANIZATIONS, ('"v1"', None)
+
+
+@pytest.fixture
+def client(app_client):
+    app_client.app.dependency_overrides[get_organization_service] = StubOrganizationService
+    yield app_client
+    del app_client.app.dependency_overrides[get_organization_service]
+
+
+def test_compact_format(client):
+    response = client.get("/api/v1/organizations", params={"format": "compact"})
+    assert response.status_code == 200
+    assert response.json() == compact_layout(ORGANIZATIONS)
+    # у каждого представления свой ETag
+    assert response.headers["etag"].endswith('v1-compact"')
+    assert "Accept" in _vary(response)
+
+    full = client.get("/api/v1/organizations")
+    assert full.json() == ORGANIZATIONS
+    assert full.headers["etag"].removeprefix("W/") == '"v1"'
+
+
+@pytest.mark.skipif(responses.msgpack is None, reason="msgpack не установлен")
+def test_msgpack_format(client):
+    response = client.get("/api/v1/organizations", params={"format": "compact"}, headers={"Accept": "application/msgpack"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/msgpack"
+    assert responses.msgpack.unpackb(response.content) == compact_layout(ORGANIZATIONS)
+    assert response.headers["etag"].endswith('v1-compact-msgpack"')
+    assert "Accept" in _vary(response)
+
+
+@pytest.mark.skipif(responses.msgpack is not None, reason="msgpack установлен")
+def test_msgpack_falls_back_to_json(client):
+    response = client.get("/api/v1/organizations", headers={"Accept": "application/msgpack"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/json")
+    assert response.json() == ORGANIZATIONS
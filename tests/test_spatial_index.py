@@ -0,0 +1,135 @@
+"""
+Сеточный индекс зданий (services.spatial_index) сверяется с полным перебором по haversine
+"""
+import asyncio
+import random
+
+import pytest
+
+from geo import haversine_km
+from services.spatial_index import BuildingSpatialIndex
+
+
+class FakeSession:
+    """Отдаёт строки (id, latitude, longitude) вместо session.stream() по зданиям"""
+
+    def __init__(self, rows: list[tuple[int, float, float]]):
+        self.rows = rows
+
+    async def stream(self, stmt):
+        async def rows():
+            for row in self.rows:
+                yield row
+        return rows()
+
+
+def _random_buildings(count: int, seed: int = 1) -> dict[int, tuple[float, float]]:
+    rng = random.Random(seed)
+    buildings = {}
+    for building_id in range(1, count + 1):
+        # часть зданий у 180-го меридиана и у полюса
+        if building_id % 10 == 0:
+            buildings[building_id] = (rng.uniform(-5, 5), rng.choice((-1, 1)) * rng.uniform(179, 180))
+        elif building_id % 10 == 1:
+            buildings[building_id] = (rng.uniform(88, 90), rng.uniform(-180, 180))
+        else:
+            buildings[building_id] = (rng.uniform(-90, 90), rng.uniform(-180, 180))
+    return buildings
+
+
+def _load(buildings: dict[int, tuple[float, float]], cell_size: float = 1.0) -> BuildingSpatialIndex:
+    index = BuildingSpatialIndex(cell_size)
+    rows = [(building_id, lat, lon) for building_id, (lat, lon) in buildings.items()]
+    asyncio.run(index.load(FakeSession(rows)))
+    return index
+
+
+def _within_radius(buildings, latitude, longitude, radius_km) -> list[int]:
+    return sorted(
+        building_id for building_id, (lat, lon) in buildings.items()
+        if haversine_km(latitude, longitude, lat, lon) <= radius_km
+    )
+
+
+def _queries(seed: int = 2):
+    rng = random.Random(seed)
+    points = [(0, 179.9), (0, -179.9), (3, 180), (89.5, 0), (-89.9, 120)]
+    points += [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(20)]
+    for latitude, longitude in points:
+        for radius_km in (10, 150, 1500):
+            yield latitude, longitude, radius_km
+
+
+@pytest.fixture(scope="module")
+def buildings() -> dict[int, tuple[float, float]]:
+    return _random_buildings(3000)
+
+
+def test_load(buildings):
+    index = _load(buildings)
+    assert index.is_ready
+    assert len(index) == len(buildings)
+    assert sorted(index.within_rectangle(-90, 90, -180, 180)) == sorted(buildings)
+
+
+def test_within_radius(buildings):
+    index = _load(buildings)
+    for latitude, longitude, radius_km in _queries():
+        assert sorted(index.within_radius(latitude, longitude, radius_km)) == \
+            _within_radius(buildings, latitude, longitude, radius_km), (latitude, longitude, radius_km)
+
+
+def test_within_radius_across_antimeridian():
+    index = _load({1: (0, 179.95), 2: (0, -179.95)})
+    assert sorted(index.within_radius(0, 179.99, 20)) == [1, 2]
+    assert sorted(index.within_radius(0, -179.99, 20)) == [1, 2]
+
+
+def test_within_rectangle(buildings):
+    index = _load(buildings)
+    rng = random.Random(3)
+    for _ in range(20):
+        min_lat, max_lat = sorted(rng.uniform(-90, 90) for _ in range(2))
+        min_lon, max_lon = sorted(rng.uniform(-180, 180) for _ in range(2))
+        expected = sorted(
+            building_id for building_id, (lat, lon) in buildings.items()
+            if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon
+        )
+        assert sorted(index.within_rectangle(min_lat, max_lat, min_lon, max_lon)) == expected
+
+
+def test_nearest(buildings):
+    index = _load(buildings)
+    for latitude, longitude, _ in _queries():
+        expected = sorted(
+            (haversine_km(latitude, longitude, lat, lon), building_id)
+            for building_id, (lat, lon) in buildings.items()
+        )[:5]
+        found = index.nearest(latitude, longitude, 5)
+        assert [building_id for building_id, _ in found] == [building_id for _, building_id in expected]
+        assert [distance for _, distance in found] == pytest.approx([distance for distance, _ in expected])
+
+
+def test_nearest_across_antimeridian():
+    index = _load({1: (0, -179.95), 2: (0, 170)}, cell_size=0.1)
+    assert index.nearest(0, 179.99, 1)[0][0] == 1
+
+
+def test_upsert_and_remove(buildings):
+    buildings = dict(buildings)
+    index = _load(buildings)
+
+    # перенос на другую сторону меридиана, новое здание и удаление
+    buildings[10] = (0, -179.99)
+    index.upsert(10, *buildings[10])
+    buildings[99999] = (0, 179.99)
+    index.upsert(99999, *buildings[99999])
+    del buildings[20]
+    index.remove(20)
+    index.remove(-1)
+
+    assert len(index) == len(buildings)
+    for latitude, longitude, radius_km in _queries():
+        assert sorted(index.within_radius(latitude, longitude, radius_km)) == \
+            _within_radius(buildings, latitude, longitude, radius_km)
+    assert sorted(building_id for building_id, _ in index.nearest(0, 180, 2)) == [10, 99999]